@@ -0,0 +1,18 @@
+# fritz-fon-stats -- stats storage exceptions
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2019 André Erdmann <dywi@mailerd.de>
+#
+# Distributed under the terms of the MIT license.
+# (See LICENSE.MIT or http://opensource.org/licenses/MIT)
+#
+
+__all__ = []
+
+
+class StatsStorageError(ValueError):
+    pass
+
+
+class StatsStorageFormatError(StatsStorageError):
+    pass
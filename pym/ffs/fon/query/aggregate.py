@@ -0,0 +1,217 @@
+# fritz-fon-stats -- group-by aggregation
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2019 André Erdmann <dywi@mailerd.de>
+#
+# Distributed under the terms of the MIT license.
+# (See LICENSE.MIT or http://opensource.org/licenses/MIT)
+#
+#  Matched entries are grouped by a tuple of key values
+#  (e.g. me.nr and the day of the call) in a single pass,
+#  using a dict of GroupStats objects that accumulate
+#  the call duration (dauer.dauer, in minutes).
+#
+#  Percentiles use the nearest-rank method on a counter
+#  of duration values, which is kept only if requested.
+#
+
+__all__ = [
+    "GroupKey", "GroupStats", "Aggregate",
+    "GROUP_KEYS", "AGGREGATES",
+    "get_group_key", "get_aggregate",
+]
+
+import collections
+import math
+import operator
+import re
+
+
+class GroupKey(object):
+    """
+    A group key: an entry attribute and an optional conversion
+    of its value (e.g. datum -> day).
+    """
+    __slots__ = ["name", "attr_name", "attr_getter", "convert"]
+
+    def __init__(self, name, attr_name, convert=None):
+        super().__init__()
+        self.name = name
+        self.attr_name = attr_name
+        self.attr_getter = operator.attrgetter(attr_name)
+        self.convert = convert
+    # --- end of __init__ (...) ---
+
+    def get_entry_value(self, entry):
+        value = self.attr_getter(entry)
+        return (value if self.convert is None else self.convert(value))
+    # --- end of get_entry_value (...) ---
+
+    def __repr__(self):
+        return "{cls.__name__}({name!r}, {attr!r})".format(
+            cls=self.__class__, name=self.name, attr=self.attr_name
+        )
+
+# --- end of GroupKey ---
+
+
+def _datum_bucket(name, fmt):
+    return GroupKey(name, "datum", operator.methodcaller("strftime", fmt))
+# --- end of _datum_bucket (...) ---
+
+
+GROUP_KEYS = {
+    key.name: key for key in [
+        GroupKey("me", "me.nr"),
+        GroupKey("dev", "me.nebenstelle"),
+        GroupKey("them", "them.nr"),
+        GroupKey("type", "call_type", operator.attrgetter("name")),
+        GroupKey("source", "me.source"),
+
+        _datum_bucket("hour", "%Y-%m-%d %H:00"),
+        _datum_bucket("day", "%Y-%m-%d"),
+        _datum_bucket("week", "%G-W%V"),
+        _datum_bucket("month", "%Y-%m"),
+        _datum_bucket("year", "%Y"),
+        _datum_bucket("weekday", "%u-%a"),
+    ]
+}
+
+
+def get_group_key(name, resolve_names=False):
+    """
+    @raises KeyError: unknown group key
+    """
+    if name == "them" and resolve_names:
+        # group by caller, "name<nr>" for named callers
+        return GroupKey(name, "them", str)
+    else:
+        return GROUP_KEYS[name]
+# --- end of get_group_key (...) ---
+
+
+class GroupStats(object):
+    """
+    Accumulated call durations of a group.
+    """
+    __slots__ = ["count", "total", "min", "max", "values"]
+
+    def __init__(self, keep_values=False):
+        super().__init__()
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+        # value -> number of occurrences
+        self.values = (collections.Counter() if keep_values else None)
+    # --- end of __init__ (...) ---
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+
+        if self.min is None:
+            self.min = value
+            self.max = value
+        elif value < self.min:
+            self.min = value
+        elif value > self.max:
+            self.max = value
+        # --
+
+        if self.values is not None:
+            self.values[value] += 1
+    # --- end of add (...) ---
+
+    def add_total(self, count, total):
+        """
+        Adds pre-aggregated values (e.g. from a rollup table),
+        min, max and percentiles are not available for these.
+        """
+        self.count += count
+        self.total += total
+    # --- end of add_total (...) ---
+
+    def get_avg(self):
+        return ((self.total / self.count) if self.count else None)
+
+    def get_percentile(self, percent):
+        # nearest-rank method
+        if not self.count:
+            return None
+
+        rank = max(1, math.ceil((percent / 100) * self.count))
+        for value in sorted(self.values):
+            rank -= self.values[value]
+            if rank <= 0:
+                return value
+        # --
+
+        return self.max
+    # --- end of get_percentile (...) ---
+
+# --- end of GroupStats ---
+
+
+class Aggregate(object):
+    """
+    An aggregate function over GroupStats.
+    """
+    __slots__ = ["name", "func", "needs_values"]
+
+    def __init__(self, name, func, needs_values=False):
+        super().__init__()
+        self.name = name
+        self.func = func
+        self.needs_values = needs_values
+    # --- end of __init__ (...) ---
+
+    def __call__(self, group_stats):
+        return self.func(group_stats)
+
+    def __repr__(self):
+        return "{cls.__name__}({name!r})".format(
+            cls=self.__class__, name=self.name
+        )
+
+# --- end of Aggregate ---
+
+
+AGGREGATES = {
+    "count":    Aggregate("count", operator.attrgetter("count")),
+    "sum":      Aggregate("sum", operator.attrgetter("total")),
+    "avg":      Aggregate("avg", GroupStats.get_avg),
+    "min":      Aggregate("min", operator.attrgetter("min")),
+    "max":      Aggregate("max", operator.attrgetter("max")),
+    "median":   Aggregate(
+        "median", operator.methodcaller("get_percentile", 50), True
+    ),
+}
+
+RE_PERCENTILE = re.compile(r'^p(?P<percent>\d{1,2}(?:[.]\d+)?|100)$')
+
+
+def get_aggregate(name):
+    """
+    Returns the aggregate function for a name,
+    "p<N>" is the N-th percentile (e.g. p90).
+
+    @raises KeyError: unknown aggregate function
+    """
+    try:
+        return AGGREGATES[name]
+    except KeyError:
+        pass
+
+    percentile_match = RE_PERCENTILE.match(name)
+    if percentile_match is None:
+        raise KeyError(name)
+
+    return Aggregate(
+        name,
+        operator.methodcaller(
+            "get_percentile", float(percentile_match.group("percent"))
+        ),
+        True
+    )
+# --- end of get_aggregate (...) ---
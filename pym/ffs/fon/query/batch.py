@@ -0,0 +1,362 @@
+# fritz-fon-stats -- evaluating many filter expressions at once
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2019 André Erdmann <dywi@mailerd.de>
+#
+# Distributed under the terms of the MIT license.
+# (See LICENSE.MIT or http://opensource.org/licenses/MIT)
+#
+#  A FilterBatch parses each expression text once and merges the filter
+#  trees into one graph in which equal subexpressions are a single node
+#  (see get_filter_key()), e.g. "known and incoming" and
+#  "incoming and duration > 60" share the "incoming" node.
+#
+#  Columnar stats (AVMPhoneStatsColumns) are evaluated vectorized:
+#  the mask of each node gets computed at most once and is dropped
+#  once all expressions using it have been evaluated.
+#  Entry-based stats (AVMPhoneStats) are evaluated in a single pass over
+#  the entries, each node at most once per entry.
+#
+#  evaluate() runs the evaluation at once, evaluate_async() gives
+#  control back to the event loop between steps (node masks or
+#  blocks of entries). Both return the matched entries per expression.
+#
+
+__all__ = ["FilterBatch", "get_filter_key"]
+
+import array
+import itertools
+
+import ffs.util.lazyimport
+import ffs.util.mask
+from ffs.util.lazyimport import lazy_import
+
+import ffs.fon.query.filters
+from ffs.fon.query.filters import (
+    FilterNOT, FilterWrapperFunc, SimpleCompoundFilterFunc
+)
+
+# loaded on first use
+asyncio = lazy_import("asyncio")
+lazy_import("ffs.fon.query.lang.lexer")
+lazy_import("ffs.fon.query.lang.parser")
+
+
+def get_filter_key(filter_func):
+    """
+    Returns a hashable key for a (flattened) filter tree.
+    Trees with equal keys match the same entries.
+
+    The members of AND/OR filters are compared as sets.
+    """
+    if isinstance(filter_func, SimpleCompoundFilterFunc):
+        return (
+            filter_func.__class__,
+            frozenset(map(get_filter_key, filter_func.funcs))
+        )
+
+    elif isinstance(filter_func, FilterWrapperFunc):
+        return (filter_func.__class__, get_filter_key(filter_func.func))
+
+    else:
+        # describe() covers attribute names and expected values,
+        #  but neither weak attribute checks nor regexp flags
+        regexp = getattr(filter_func, "regexp", None)
+        return (
+            filter_func.__class__,
+            filter_func.describe(),
+            getattr(filter_func, "weak", None),
+            (None if regexp is None else regexp.flags)
+        )
+# --- end of get_filter_key (...) ---
+
+
+class FilterBatch(object):
+    """
+    Evaluates many filter expressions over the same stats object.
+
+    Parsed expressions are kept,
+    so that a batch object can be used for several stats objects.
+    """
+
+    # number of entries evaluated between two steps
+    #  when evaluating entry-based stats
+    ENTRY_BLOCK_SIZE = 4096
+
+    def __init__(self, parser=None):
+        """
+        @param parser:  FilterLangParser or None (create on demand)
+        """
+        super().__init__()
+        self.parser = parser
+        # expression text -> flattened filter func
+        self.filter_funcs = {}
+    # --- end of __init__ (...) ---
+
+    def get_parser(self):
+        parser = self.parser
+        if parser is None:
+            parser = ffs.fon.query.lang.parser.FilterLangParser(
+                ffs.fon.query.lang.lexer.FilterLangLexer()
+            )
+            parser.build()
+            self.parser = parser
+        # --
+
+        return parser
+    # --- end of get_parser (...) ---
+
+    def parse(self, filter_exprs):
+        """
+        Parses filter expressions, each distinct text once.
+
+        @return: list of flattened filter funcs, in filter_exprs order
+        @raises ValueError: invalid filter expression
+        """
+        filter_funcs = self.filter_funcs  # ref
+
+        for filter_expr in filter_exprs:
+            if filter_expr not in filter_funcs:
+                filter_func = self.get_parser().parse(filter_expr)
+                if filter_func is None:
+                    raise ValueError("invalid filter expression", filter_expr)
+
+                filter_funcs[filter_expr] = filter_func.flatten()
+            # --
+        # --
+
+        return [filter_funcs[filter_expr] for filter_expr in filter_exprs]
+    # --- end of parse (...) ---
+
+    def build_nodes(self, filter_funcv):
+        """
+        Merges filter trees into a graph of distinct subexpressions.
+
+        @return: 3-tuple (
+                    nodes: list of (filter func, child node ids),
+                    root node id per filter func,
+                    number of uses (by parents or as root) per node id
+                 )
+        """
+        nodes = []
+        node_ids = {}
+        num_uses = []
+
+        def add_node(filter_func):
+            key = get_filter_key(filter_func)
+
+            try:
+                node_id = node_ids[key]
+            except KeyError:
+                if isinstance(filter_func, SimpleCompoundFilterFunc):
+                    child_ids = [add_node(f) for f in filter_func.funcs]
+                elif isinstance(filter_func, FilterNOT):
+                    child_ids = [add_node(filter_func.func)]
+                else:
+                    child_ids = []
+
+                node_id = len(nodes)
+                nodes.append((filter_func, child_ids))
+                num_uses.append(0)
+                node_ids[key] = node_id
+            # --
+
+            num_uses[node_id] += 1
+            return node_id
+        # --- end of add_node (...) ---
+
+        root_ids = [add_node(filter_func) for filter_func in filter_funcv]
+        return (nodes, root_ids, num_uses)
+    # --- end of build_nodes (...) ---
+
+    def gen_eval_masks(self, nodes, root_ids, num_uses, rows):
+        """
+        Computes the mask of each root node over rows.
+
+        This is a generator that yields None after each computed mask
+        and returns the list of root masks.
+        """
+        masks = {}
+        remaining_uses = list(num_uses)
+
+        def release(node_id):
+            # one use of node_id is done (or not needed anymore)
+            remaining_uses[node_id] -= 1
+            if not remaining_uses[node_id]:
+                if masks.pop(node_id, None) is None:
+                    # not computed, so it has not used its children
+                    for child_id in nodes[node_id][1]:
+                        release(child_id)
+        # --- end of release (...) ---
+
+        def gen_get_mask(node_id):
+            try:
+                mask = masks[node_id]
+            except KeyError:
+                filter_func, child_ids = nodes[node_id]
+
+                if not child_ids:
+                    mask = filter_func.get_mask(rows)
+
+                elif isinstance(filter_func, FilterNOT):
+                    mask = ffs.util.mask.mask_not(
+                        (yield from gen_get_mask(child_ids[0]))
+                    )
+
+                else:
+                    # AND/OR, like SimpleCompoundFilterFunc.get_mask()
+                    child_iter = iter(child_ids)
+                    mask = yield from gen_get_mask(next(child_iter))
+
+                    for child_id in child_iter:
+                        if filter_func.COND_MASK_FINAL(mask):
+                            # the remaining children are not needed
+                            for skipped_id in itertools.chain(
+                                (child_id,), child_iter
+                            ):
+                                release(skipped_id)
+                            break
+
+                        mask = filter_func.COND_MASK_FUNC(
+                            mask, (yield from gen_get_mask(child_id))
+                        )
+                    # --
+                # --
+
+                masks[node_id] = mask
+                yield
+            # --
+
+            release(node_id)
+            return mask
+        # --- end of gen_get_mask (...) ---
+
+        root_masks = []
+        for root_id in root_ids:
+            root_masks.append((yield from gen_get_mask(root_id)))
+
+        return root_masks
+    # --- end of gen_eval_masks (...) ---
+
+    def gen_eval_entries(self, nodes, root_ids, entries):
+        """
+        Evaluates the root nodes for each entry in a single pass.
+
+        This is a generator that yields None after each block of entries
+        and returns the list of matched entries per root node.
+        """
+        def get_match(node_id):
+            try:
+                return matches[node_id]
+            except KeyError:
+                pass
+
+            filter_func, child_ids = nodes[node_id]
+
+            if not child_ids:
+                match = filter_func(entry)
+
+            elif isinstance(filter_func, FilterNOT):
+                match = not get_match(child_ids[0])
+
+            else:
+                # AND/OR, short-circuit like SimpleCompoundFilterFunc
+                match = filter_func.COND_FUNC(map(get_match, child_ids))
+            # --
+
+            matches[node_id] = match
+            return match
+        # --- end of get_match (...) ---
+
+        root_matched = [[] for _ in root_ids]
+        entry_iter = iter(entries)
+
+        while True:
+            block = list(itertools.islice(entry_iter, self.ENTRY_BLOCK_SIZE))
+            if not block:
+                break
+
+            for entry in block:
+                matches = {}
+                for root_id, matched in zip(root_ids, root_matched):
+                    if get_match(root_id):
+                        matched.append(entry)
+            # --
+
+            yield
+        # --
+
+        return root_matched
+    # --- end of gen_eval_entries (...) ---
+
+    def gen_evaluate(self, stats, filter_exprs):
+        """
+        Generator that yields None after each evaluation step
+        and returns the result of evaluate().
+        """
+        filter_exprs = list(dict.fromkeys(filter_exprs))
+        nodes, root_ids, num_uses = self.build_nodes(
+            self.parse(filter_exprs)
+        )
+
+        if hasattr(stats, "get_rows"):
+            rows = stats.get_rows()
+            root_masks = yield from self.gen_eval_masks(
+                nodes, root_ids, num_uses, rows
+            )
+
+            results = [
+                stats.get_rows(
+                    array.array(
+                        stats.TYPECODE_ROW,
+                        itertools.compress(rows.row_ids, mask)
+                    )
+                ) for mask in root_masks
+            ]
+
+        else:
+            results = yield from self.gen_eval_entries(
+                nodes, root_ids, stats.entries
+            )
+        # --
+
+        return dict(zip(filter_exprs, results))
+    # --- end of gen_evaluate (...) ---
+
+    def evaluate(self, stats, filter_exprs):
+        """
+        Evaluates filter expressions independently of each other
+        over all entries of stats.
+
+        @param stats:         AVMPhoneStatsColumns or AVMPhoneStats
+        @param filter_exprs:  filter expressions (str)
+
+        @return: dict expression -> matched entries
+                 (AVMPhoneStatsRows or list of entries)
+        @raises ValueError: invalid filter expression
+        """
+        eval_gen = self.gen_evaluate(stats, filter_exprs)
+        try:
+            while True:
+                next(eval_gen)
+        except StopIteration as stop:
+            return stop.value
+    # --- end of evaluate (...) ---
+
+    async def evaluate_async(self, stats, filter_exprs):
+        """
+        Like evaluate(), but lets other tasks run between
+        evaluation steps.
+
+        stats must not be modified before the evaluation is done.
+        """
+        eval_gen = self.gen_evaluate(stats, filter_exprs)
+        try:
+            while True:
+                next(eval_gen)
+                await asyncio.sleep(0)
+        except StopIteration as stop:
+            return stop.value
+    # --- end of evaluate_async (...) ---
+
+# --- end of FilterBatch ---
@@ -0,0 +1,213 @@
+# fritz-fon-stats -- persistent cache of parsed filter expressions
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2019 André Erdmann <dywi@mailerd.de>
+#
+# Distributed under the terms of the MIT license.
+# (See LICENSE.MIT or http://opensource.org/licenses/MIT)
+#
+#  The cache maps filter expression texts to flattened filter trees,
+#  so that repeated queries do not need to build the parser
+#  and to parse their filter expressions again.
+#
+#  Cached trees are valid as long as the grammar and the filter classes
+#  are unchanged, which is checked via the digest of their modules'
+#  source files ("grammar version").
+#
+#  Expressions whose result depends on the current date
+#  (e.g. "today", "for 3 days", see FilterLangParser.date_today_used)
+#  are stored along with the date they were parsed on
+#  and are invalid on any other day.
+#
+
+__all__ = ["FilterExprCache"]
+
+import datetime
+import hashlib
+import importlib
+import importlib.machinery
+import importlib.util
+import io
+import os
+import pickle
+import sys
+import tempfile
+
+import ffs.util.cachedir
+
+
+class FilterExprCache(object):
+    """
+    Stores flattened filter trees by expression text in a single file.
+
+    Usage: load(), get() / put() for each expression, save().
+    """
+
+    CACHE_FILE_NAME = "filter_exprs.pickle"
+
+    # the oldest entries are dropped when the cache grows beyond this size
+    MAX_ENTRIES = 256
+
+    # modules whose changes invalidate the cache
+    GRAMMAR_MODULES = (
+        "ffs.fon.query.lang._base.lexer",
+        "ffs.fon.query.lang._base.parser",
+        "ffs.fon.query.lang.lexer",
+        "ffs.fon.query.lang.parser",
+        "ffs.fon.query.filters",
+        "ffs.fon.stats.entry",
+    )
+
+    def __init__(self, cache_dir=None):
+        super().__init__()
+        self.cache_dir = (
+            ffs.util.cachedir.get_user_cache_dir("query")
+            if cache_dir is None else cache_dir
+        )
+        # expression text -> (parse date or None, filter tree)
+        self.entries = {}
+        self.modified = False
+    # --- end of __init__ (...) ---
+
+    def get_cache_file(self):
+        return os.path.join(self.cache_dir, self.CACHE_FILE_NAME)
+
+    @classmethod
+    def get_grammar_version(cls):
+        """
+        Returns a digest of the grammar modules' source files,
+        without importing them.
+
+        @raises OSError:
+        """
+        digest = hashlib.sha256()
+        digest.update(repr(sys.version_info[:2]).encode("ascii"))
+        # the date parser depends on whether dateutil is available
+        digest.update(
+            b'dateutil' if importlib.util.find_spec("dateutil") else b'-'
+        )
+
+        for module_name in cls.GRAMMAR_MODULES:
+            # not importlib.util.find_spec(), which would load
+            #  modules that have been imported lazily
+            parent_name = module_name.rpartition(".")[0]
+            spec = importlib.machinery.PathFinder.find_spec(
+                module_name, importlib.import_module(parent_name).__path__
+            )
+            if spec is None or not spec.origin:
+                raise OSError("cannot locate module source", module_name)
+
+            with io.open(spec.origin, "rb") as fh:
+                digest.update(fh.read())
+        # --
+
+        return digest.hexdigest()
+    # --- end of get_grammar_version (...) ---
+
+    def get_date_today(self):
+        return datetime.datetime.combine(
+            datetime.date.today(), datetime.time.min
+        )
+    # --- end of get_date_today (...) ---
+
+    def load(self):
+        """
+        Reads the cache file. Entries of other grammar versions
+        or relative-date entries from other days are discarded.
+
+        A missing or unreadable cache file results in an empty cache.
+        """
+        self.entries = {}
+        self.modified = False
+
+        try:
+            grammar_version = self.get_grammar_version()
+
+            with io.open(self.get_cache_file(), "rb") as fh:
+                cache_version, entries = pickle.load(fh)
+
+        except (OSError, EOFError, pickle.UnpicklingError, ValueError):
+            return
+
+        except (AttributeError, ImportError, TypeError):
+            # classes renamed or moved
+            return
+        # --
+
+        if cache_version != grammar_version:
+            self.modified = True
+            return
+
+        date_today = self.get_date_today()
+        for filter_expr, (parse_date, filter_func) in entries.items():
+            if parse_date is None or parse_date == date_today:
+                self.entries[filter_expr] = (parse_date, filter_func)
+            else:
+                self.modified = True
+        # --
+    # --- end of load (...) ---
+
+    def get(self, filter_expr):
+        """
+        @return: filter tree for the given expression text,
+                 or None if not cached
+        """
+        try:
+            return self.entries[filter_expr][1]
+        except KeyError:
+            return None
+    # --- end of get (...) ---
+
+    def put(self, filter_expr, filter_func, parse_date=None):
+        """
+        Adds a filter tree to the cache.
+
+        @param filter_expr:  expression text
+        @param filter_func:  flattened filter tree
+        @param parse_date:   the parser's date_today if the tree depends
+                             on it, else None
+        """
+        entries = self.entries  # ref
+
+        entries.pop(filter_expr, None)
+        entries[filter_expr] = (parse_date, filter_func)
+
+        while len(entries) > self.MAX_ENTRIES:
+            del entries[next(iter(entries))]
+
+        self.modified = True
+    # --- end of put (...) ---
+
+    def save(self):
+        """
+        Writes the cache file if entries have been added or discarded.
+        The file gets replaced atomically.
+
+        Errors are not handled here, callers may want to ignore OSError.
+        """
+        if not self.modified:
+            return
+
+        data = pickle.dumps(
+            (self.get_grammar_version(), self.entries),
+            protocol=pickle.HIGHEST_PROTOCOL
+        )
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        fd, tmp_file = tempfile.mkstemp(
+            prefix=".tmp.", suffix=".pickle", dir=self.cache_dir
+        )
+        try:
+            with io.open(fd, "wb") as fh:
+                fh.write(data)
+
+            os.replace(tmp_file, self.get_cache_file())
+        except:
+            os.unlink(tmp_file)
+            raise
+
+        self.modified = False
+    # --- end of save (...) ---
+
+# --- end of FilterExprCache ---
@@ -0,0 +1,282 @@
+# fritz-fon-stats -- filter compiler
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2019 André Erdmann <dywi@mailerd.de>
+#
+# Distributed under the terms of the MIT license.
+# (See LICENSE.MIT or http://opensource.org/licenses/MIT)
+#
+#  Turns a filter tree into a single generated Python function,
+#  which avoids the per-entry method call chain of the filter objects:
+#
+#  - attribute access is inlined (entry.them.nr)
+#  - AND/OR/NOT become Python's short-circuiting and/or/not
+#  - comparison operators are inlined, constants are closure variables
+#  - regexp searches are prebound (regexp.search)
+#  - call_type checks are precomputed for all CallType values
+#
+#  Vectorized evaluation (get_mask()) and the index/range splitting
+#  are still done by the original filter tree.
+#
+#  Compiled filters are pickled as their original filter tree
+#  and get recompiled when unpickled (e.g. in worker processes).
+#
+
+__all__ = ["FilterCompiler", "CompiledFilterFunc"]
+
+import operator
+
+import ffs.fon.stats.entry
+from ffs.fon.stats.entry import CallType
+
+import ffs.fon.query.filters
+from ffs.fon.query.filters import (
+    FilterFunc,
+    FilterAND, FilterOR, FilterNOT, FilterTrue, FilterFalse,
+    FilterAttrCheckBase, FilterAttrCmpFunc, FilterAttrCaseEq,
+    FilterAttrRegexp, FilterAttrIn, FilterHasAttr
+)
+
+
+# operators that are inlined, cmp_func -> Python operator
+INLINE_CMP_OPERATORS = {
+    operator.__eq__:    "==",
+    operator.__ne__:    "!=",
+    operator.__lt__:    "<",
+    operator.__le__:    "<=",
+    operator.__gt__:    ">",
+    operator.__ge__:    ">=",
+    operator.is_:       "is",
+    operator.is_not:    "is not",
+}
+
+
+class CompiledFilterFunc(FilterFunc):
+    """
+    Filter func that evaluates entries via a generated function
+    and delegates everything else to the original filter tree.
+    """
+    __slots__ = ["func", "compiled", "source"]
+
+    def __init__(self, func, compiled, source):
+        super().__init__()
+        self.func = func
+        self.compiled = compiled
+        self.source = source
+    # --- end of __init__ (...) ---
+
+    def __call__(self, entry):
+        return self.compiled(entry)
+
+    def get_mask(self, rows):
+        return self.func.get_mask(rows)
+
+    def gen_describe(self, level):
+        return self.func.gen_describe(level)
+
+    def split_datum_bounds(self):
+        return self.func.split_datum_bounds()
+
+    def split_index_rows(self, columns):
+        return self.func.split_index_rows(columns)
+
+    def __reduce__(self):
+        return (_recompile, (self.func,))
+
+    def __repr__(self):
+        return "{cls!r}->{func!r}".format(cls=self.__class__, func=self.func)
+
+# --- end of CompiledFilterFunc ---
+
+
+class FilterCompiler(object):
+
+    FUNC_NAME = "compiled_filter"
+    ENTRY_VAR = "entry"
+
+    def __init__(self):
+        super().__init__()
+        self.constants = None
+        self.constant_names = None
+    # --- end of __init__ (...) ---
+
+    def add_constant(self, value, prefix="c", desc=None):
+        # returns the name of a closure variable that refers to value
+        key = (prefix, id(value))
+
+        try:
+            return self.constant_names[key][1]
+        except KeyError:
+            pass
+
+        name = "{0}{1:d}".format(prefix, len(self.constants))
+        self.constants.append(
+            (name, value, (repr(value) if desc is None else desc))
+        )
+        # keep a ref to value, its id must not be reused
+        self.constant_names[key] = (value, name)
+        return name
+    # --- end of add_constant (...) ---
+
+    def gen_attr_expr(self, attr_name):
+        return ".".join([self.ENTRY_VAR] + attr_name.split("."))
+
+    def gen_weak_guard(self, attr_name):
+        # "hasattr(entry, 'a') and hasattr(entry.a, 'b')"
+        obj_expr = self.ENTRY_VAR
+        guards = []
+
+        for name in attr_name.split("."):
+            guards.append("hasattr({0}, {1!r})".format(obj_expr, name))
+            obj_expr = "{0}.{1}".format(obj_expr, name)
+
+        return " and ".join(guards)
+    # --- end of gen_weak_guard (...) ---
+
+    def gen_value_check_expr(self, func, value_expr):
+        if func.attr_name == "call_type":
+            # precompute the check for all CallType values
+            matching = frozenset(
+                call_type for call_type in CallType
+                if func.attr_check(call_type)
+            )
+            return "({0} in {1})".format(
+                value_expr, self.add_constant(matching, "t")
+            )
+
+        elif isinstance(func, FilterAttrCmpFunc):
+            expected = self.add_constant(func.expected_value)
+            try:
+                cmp_op = INLINE_CMP_OPERATORS[func.cmp_func]
+            except KeyError:
+                return "{0}({1}, {2})".format(
+                    self.add_constant(func.cmp_func, "f"), value_expr, expected
+                )
+            else:
+                return "({0} {1} {2})".format(value_expr, cmp_op, expected)
+
+        elif isinstance(func, FilterAttrIn):
+            return "({0} in {1})".format(
+                value_expr, self.add_constant(func.expected_value)
+            )
+
+        elif isinstance(func, FilterAttrCaseEq):
+            return "({0}.lower() == {1})".format(
+                value_expr,
+                self.add_constant(func.expected_value.lower())
+            )
+
+        elif isinstance(func, FilterAttrRegexp):
+            return "({0}({1}) is not None)".format(
+                self.add_constant(
+                    func.regexp.search, "s",
+                    "{!r}.search".format(func.regexp)
+                ),
+                value_expr
+            )
+
+        else:
+            return "{0}({1})".format(
+                self.add_constant(func.attr_check, "k"), value_expr
+            )
+    # --- end of gen_value_check_expr (...) ---
+
+    def gen_expr(self, func):
+        if isinstance(func, FilterAND):
+            return "({})".format(" and ".join(map(self.gen_expr, func.funcs)))
+
+        elif isinstance(func, FilterOR):
+            return "({})".format(" or ".join(map(self.gen_expr, func.funcs)))
+
+        elif isinstance(func, FilterNOT):
+            return "(not {})".format(self.gen_expr(func.func))
+
+        elif isinstance(func, CompiledFilterFunc):
+            return self.gen_expr(func.func)
+
+        elif isinstance(func, FilterTrue):
+            return "True"
+
+        elif isinstance(func, FilterFalse):
+            return "False"
+
+        elif isinstance(func, FilterAttrCheckBase):
+            check_expr = self.gen_value_check_expr(
+                func, self.gen_attr_expr(func.attr_name)
+            )
+
+            if func.weak:
+                return "({0} and {1})".format(
+                    self.gen_weak_guard(func.attr_name), check_expr
+                )
+            else:
+                return check_expr
+
+        elif isinstance(func, FilterHasAttr):
+            return "({0} and {1}({2}))".format(
+                self.gen_weak_guard(func.attr_name),
+                self.add_constant(func.value_check, "k"),
+                self.gen_attr_expr(func.attr_name)
+            )
+
+        else:
+            # unknown filter, call it
+            return "{0}({1})".format(
+                self.add_constant(func, "x"), self.ENTRY_VAR
+            )
+    # --- end of gen_expr (...) ---
+
+    def gen_source(self, func):
+        expr = self.gen_expr(func)
+        constants = self.constants
+
+        yield "def make_{0}({1}):".format(
+            self.FUNC_NAME, ", ".join(name for name, _, _ in constants)
+        )
+
+        for name, _, value_desc in constants:
+            if len(value_desc) > 60:
+                value_desc = value_desc[:57] + "..."
+            yield "    # {0} = {1}".format(name, value_desc)
+        # --
+
+        yield "    def {0}({1}):".format(self.FUNC_NAME, self.ENTRY_VAR)
+        yield "        return {0}".format(expr)
+        yield "    return {0}".format(self.FUNC_NAME)
+    # --- end of gen_source (...) ---
+
+    def compile(self, func):
+        """
+        Compiles a (flattened) filter tree.
+
+        @return: L{CompiledFilterFunc}
+        """
+        self.constants = []
+        self.constant_names = {}
+        try:
+            source = "\n".join(self.gen_source(func))
+            constants = self.constants
+        finally:
+            self.constants = None
+            self.constant_names = None
+        # --
+
+        namespace = {}
+        exec(compile(source, "<compiled filter>", "exec"), namespace)
+        compiled = namespace["make_" + self.FUNC_NAME](
+            *(value for _, value, _ in constants)
+        )
+
+        if isinstance(func, CompiledFilterFunc):
+            func = func.func
+
+        return CompiledFilterFunc(func, compiled, source)
+    # --- end of compile (...) ---
+
+# --- end of FilterCompiler ---
+
+
+def _recompile(func):
+    # unpickles CompiledFilterFunc objects
+    return FilterCompiler().compile(func)
+# --- end of _recompile (...) ---
@@ -10,17 +10,42 @@
 __all__ = []
 
 import abc
+import datetime
 import operator
 import re
 
+import ffs.util.mask
+import ffs.util.rowids
+
+
+# comparison functions that can be turned into datum index ranges
+DATUM_BOUND_CMP_FUNCS = frozenset({
+    operator.__eq__,
+    operator.__lt__, operator.__le__,
+    operator.__gt__, operator.__ge__,
+})
+
 
 class FilterFunc(object, metaclass=abc.ABCMeta):
     __slots__ = []
 
+    # rough per-entry evaluation cost and fraction of matching entries,
+    #  used by the query planner (ffs.fon.query.planner) if no better
+    #  estimates are available
+    EST_COST = 1.0
+    EST_SELECTIVITY = 0.5
+
     @abc.abstractmethod
     def __call__(self, entry):
         raise NotImplementedError(self)
 
+    def get_mask(self, rows):
+        # vectorized evaluation over AVMPhoneStatsRows,
+        #  returns a mask with one byte (0/1) per row.
+        #  The default implementation falls back to calling self per entry.
+        return rows.get_entry_mask(self)
+    # ---
+
     def describe(self, *, level=0, indent_str="  "):
         return "\n".join(
             ((level * indent_str) + desc)
@@ -35,6 +60,25 @@ class FilterFunc(object, metaclass=abc.ABCMeta):
     def flatten(self):
         return self
 
+    def split_datum_bounds(self):
+        # returns a 2-tuple (bounds, remaining filter func or None),
+        #  bounds is a list of (cmp_func, datetime) pairs that restrict
+        #  the datum of matching entries and are ANDed with the remaining
+        #  filter. Used for narrowing down rows via a sorted datum index.
+        return ([], self)
+    # ---
+
+    def get_est_cost(self):
+        return self.EST_COST
+
+    def split_index_rows(self, columns):
+        # returns a 2-tuple (row ids or None, remaining filter func or None),
+        #  row ids are the ascending ids of rows found via the indexes
+        #  of an AVMPhoneStatsColumns object (get_attr_index_rows())
+        #  and are ANDed with the remaining filter.
+        return (None, self)
+    # ---
+
     def __repr__(self):
         return "{cls!r}".format(cls=self.__class__)
 
@@ -132,6 +176,14 @@ class SimpleCompoundFilterFunc(CompoundFilterFunc):
     @abc.abstractmethod
     def COND_FUNC(cls):
         raise NotImplementedError(cls)
+
+    @abc.abstractmethod
+    def COND_MASK_FUNC(cls):
+        raise NotImplementedError(cls)
+
+    @abc.abstractmethod
+    def COND_MASK_FINAL(cls):
+        raise NotImplementedError(cls)
     # ---
 
     def gen_describe(self, level):
@@ -146,6 +198,21 @@ class SimpleCompoundFilterFunc(CompoundFilterFunc):
         return self.COND_FUNC((f(entry) for f in self.funcs))
     # --- end of __call__ (...) ---
 
+    def get_mask(self, rows):
+        # pylint: disable=too-many-function-args
+        funcs_iter = iter(self.funcs)
+        mask = next(funcs_iter).get_mask(rows)
+
+        for func in funcs_iter:
+            if self.COND_MASK_FINAL(mask):
+                break
+
+            mask = self.COND_MASK_FUNC(mask, func.get_mask(rows))
+        # --
+
+        return mask
+    # --- end of get_mask (...) ---
+
 # --- end of SimpleCompoundFilterFunc ---
 
 
@@ -184,6 +251,9 @@ class FilterAttrCheckBase(FilterFunc):
             return self.attr_check(value)
     # --- end of __call__ (...) ---
 
+    def get_mask(self, rows):
+        return rows.get_attr_mask(self.attr_name, self.attr_check, self.weak)
+
 # --- end of FilterAttrCheckBase ---
 
 
@@ -238,6 +308,10 @@ class FilterHasAttr(FilterFunc):
         except AttributeError:
             return False
 
+        return self.value_check(value)
+    # ---
+
+    def value_check(self, value):
         if value is None:
             return False
         elif isinstance(value, str):
@@ -245,6 +319,9 @@ class FilterHasAttr(FilterFunc):
         else:
             return True
     # ---
+
+    def get_mask(self, rows):
+        return rows.get_attr_mask(self.attr_name, self.value_check, weak=True)
 # --- end of FilterHasAttr ---
 
 
@@ -252,6 +329,8 @@ class FilterAttrCaseEq(FilterAttrCmpBase):
     __slots__ = []
 
     CMP_DESC = "AttrStrCaseEqual"
+    EST_COST = 2.0
+    EST_SELECTIVITY = 0.1
 
     def attr_cmp(self, a, b):
         return a.lower() == b.lower()
@@ -261,6 +340,11 @@ class FilterAttrRegexp(FilterAttrCheckBase):
     __slots__ = ['regexp']
 
     CMP_DESC = "AttrRegexpMatch"
+    EST_COST = 4.0
+
+    def get_est_cost(self):
+        # long patterns (e.g. "mobile") are more expensive
+        return self.EST_COST + (len(self.regexp.pattern) / 16)
 
     def gen_describe(self, level):
         yield (
@@ -286,6 +370,8 @@ class FilterAttrRegexp(FilterAttrCheckBase):
 class FilterAttrCmpFunc(FilterAttrCmpBase):
     __slots__ = ["cmp_func"]
 
+    EST_SELECTIVITY = 0.3
+
     @property
     def CMP_DESC(self):
         return "Attr{}".format(self.cmp_func.__name__.upper())
@@ -297,6 +383,35 @@ class FilterAttrCmpFunc(FilterAttrCmpBase):
         super().__init__(attr_name, expected_value, **kwargs)
         self.cmp_func = cmp_func
     # ---
+
+    def get_mask(self, rows):
+        return rows.get_attr_cmp_mask(
+            self.attr_name, self.cmp_func, self.expected_value, self.weak
+        )
+
+    def split_datum_bounds(self):
+        if (
+            self.attr_name == "datum"
+            and self.cmp_func in DATUM_BOUND_CMP_FUNCS
+            and isinstance(self.expected_value, datetime.datetime)
+            and self.expected_value.tzinfo is None
+        ):
+            return ([(self.cmp_func, self.expected_value)], None)
+        else:
+            return ([], self)
+    # ---
+
+    def split_index_rows(self, columns):
+        if self.cmp_func is operator.__eq__:
+            rows = columns.get_attr_index_rows(
+                self.attr_name, (self.expected_value,)
+            )
+            if rows is not None:
+                return (rows, None)
+        # --
+
+        return (None, self)
+    # ---
 # ---
 
 
@@ -304,6 +419,8 @@ class FilterAttrIn(FilterAttrCmpBase):
     __slots__ = []
 
     CMP_DESC = "AttrIn"
+    EST_COST = 1.5
+    EST_SELECTIVITY = 0.2
 
     def gen_describe(self, level):
         yield (
@@ -323,6 +440,11 @@ class FilterAttrIn(FilterAttrCmpBase):
     def attr_cmp(self, a, b):
         return a in b
     # ---
+
+    def split_index_rows(self, columns):
+        rows = columns.get_attr_index_rows(self.attr_name, self.expected_value)
+        return ((None, self) if rows is None else (rows, None))
+    # ---
 # --- end of FilterAttrIn ---
 
 
@@ -330,6 +452,26 @@ class FilterOR(SimpleCompoundFilterFunc):
     __slots__ = []
     COND_DESC = "OR"
     COND_FUNC = any
+    COND_MASK_FUNC = staticmethod(ffs.util.mask.mask_or)
+    COND_MASK_FINAL = staticmethod(ffs.util.mask.mask_all)
+
+    def split_index_rows(self, columns):
+        # all members must be resolved via indexes
+        rows = None
+
+        for func in self.funcs:
+            func_rows, func_remaining = func.split_index_rows(columns)
+            if func_rows is None or func_remaining is not None:
+                return (None, self)
+
+            rows = (
+                func_rows if rows is None
+                else ffs.util.rowids.rows_or(rows, func_rows)
+            )
+        # --
+
+        return (rows, None)
+    # --- end of split_index_rows (...) ---
 # --- end of FilterOR ---
 
 
@@ -337,6 +479,56 @@ class FilterAND(SimpleCompoundFilterFunc):
     __slots__ = []
     COND_DESC = "AND"
     COND_FUNC = all
+    COND_MASK_FUNC = staticmethod(ffs.util.mask.mask_and)
+    COND_MASK_FINAL = staticmethod(ffs.util.mask.mask_none)
+
+    def split_datum_bounds(self):
+        bounds = []
+        remaining = []
+
+        for func in self.funcs:
+            func_bounds, func_remaining = func.split_datum_bounds()
+            bounds.extend(func_bounds)
+            if func_remaining is not None:
+                remaining.append(func_remaining)
+        # --
+
+        if not bounds:
+            return ([], self)
+        elif not remaining:
+            return (bounds, None)
+        elif len(remaining) == 1:
+            return (bounds, remaining[0])
+        else:
+            return (bounds, self.__class__(remaining))
+    # --- end of split_datum_bounds (...) ---
+
+    def split_index_rows(self, columns):
+        rows = None
+        remaining = []
+
+        for func in self.funcs:
+            func_rows, func_remaining = func.split_index_rows(columns)
+
+            if func_rows is not None:
+                rows = (
+                    func_rows if rows is None
+                    else ffs.util.rowids.rows_and(rows, func_rows)
+                )
+
+            if func_remaining is not None:
+                remaining.append(func_remaining)
+        # --
+
+        if rows is None:
+            return (None, self)
+        elif not remaining:
+            return (rows, None)
+        elif len(remaining) == 1:
+            return (rows, remaining[0])
+        else:
+            return (rows, self.__class__(remaining))
+    # --- end of split_index_rows (...) ---
 # --- end of FilterAND ---
 
 
@@ -365,12 +557,17 @@ class FilterNOT(FilterWrapperFunc):
     def __call__(self, entry):
         return (not self.func(entry))
     # ---
+
+    def get_mask(self, rows):
+        return ffs.util.mask.mask_not(self.func.get_mask(rows))
 # --- end of FilterNOT ---
 
 
 class _FilterCallType(FilterAttrCheckBase):
     __slots__ = []
 
+    EST_COST = 0.5
+
     def __init__(self):
         super().__init__("call_type", weak=False)
 
@@ -402,20 +599,32 @@ class FilterCallOutgoing(_FilterCallType):
 class FilterTrue(FilterFunc):
     __slots__ = []
 
+    EST_COST = 0.0
+    EST_SELECTIVITY = 1.0
+
     def gen_describe(self, level):
         yield (level, "TRUE")
 
     def __call__(self, entry):
         return True
+
+    def get_mask(self, rows):
+        return ffs.util.mask.mask_true(len(rows))
 # --- end of FilterTrue ---
 
 
 class FilterFalse(FilterFunc):
     __slots__ = []
 
+    EST_COST = 0.0
+    EST_SELECTIVITY = 0.0
+
     def gen_describe(self, level):
         yield (level, "FALSE")
 
     def __call__(self, entry):
         return False
+
+    def get_mask(self, rows):
+        return ffs.util.mask.mask_false(len(rows))
 # --- end of FilterFalse ---
@@ -0,0 +1,308 @@
+# fritz-fon-stats -- time-bucketed histograms
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2019 André Erdmann <dywi@mailerd.de>
+#
+# Distributed under the terms of the MIT license.
+# (See LICENSE.MIT or http://opensource.org/licenses/MIT)
+#
+#  Counts and total durations are kept per calendar bucket
+#  (hour, day, week, month), so that memory usage depends on the number
+#  of buckets, not on the number of entries.
+#
+#  Single entries are added to the bucket of the previous entry if
+#  they fall into it, which is the common case for entries in datum order.
+#  Blocks of entries (columns) are counted in one sweep over sorted
+#  timestamps: the durations are turned into prefix sums, and each bucket
+#  is a bisect for its boundary timestamp.
+#
+#  Cyclic buckets (hour of day, weekday) are folded from hour/day buckets.
+#  Empty buckets are included, from the first to the last bucket
+#  of the history range (e.g. all entries of the stats).
+#
+
+__all__ = ["DatumHistogram", "HISTOGRAM_BUCKETS"]
+
+import array
+import bisect
+import datetime
+import itertools
+import operator
+
+import ffs.util.lazyimport
+from ffs.util.lazyimport import lazy_import
+
+# loaded on first use
+lazy_import("ffs.fon.stats.columns")
+
+
+ONE_HOUR = datetime.timedelta(hours=1)
+ONE_DAY = datetime.timedelta(days=1)
+ONE_WEEK = datetime.timedelta(days=7)
+
+# a Monday, used for labeling cyclic buckets
+REF_MONDAY = datetime.datetime(1970, 1, 5)
+
+
+def _get_cyclic_labels(label_fmt, step, num_buckets):
+    return [
+        (REF_MONDAY + (idx * step)).strftime(label_fmt)
+        for idx in range(num_buckets)
+    ]
+# --- end of _get_cyclic_labels (...) ---
+
+
+# bucket name -> (calendar unit, label format, cyclic bucket labels or None)
+HISTOGRAM_BUCKETS = {
+    "hour":         ("hour", "%Y-%m-%d %H:00", None),
+    "day":          ("day", "%Y-%m-%d", None),
+    "week":         ("week", "%G-W%V", None),
+    "month":        ("month", "%Y-%m", None),
+    "hourofday":    ("hour", "%H", _get_cyclic_labels("%H", ONE_HOUR, 24)),
+    "weekday":      ("day", "%u-%a", _get_cyclic_labels("%u-%a", ONE_DAY, 7)),
+}
+
+
+def floor_datum(unit, datum):
+    """Returns the start of the calendar bucket that contains datum."""
+    if unit == "hour":
+        return datum.replace(minute=0, second=0, microsecond=0)
+
+    day = datum.replace(hour=0, minute=0, second=0, microsecond=0)
+    if unit == "day":
+        return day
+    elif unit == "week":
+        return day - (day.weekday() * ONE_DAY)
+    elif unit == "month":
+        return day.replace(day=1)
+    else:
+        raise ValueError(unit)
+# --- end of floor_datum (...) ---
+
+
+def next_datum(unit, datum):
+    """Returns the start of the calendar bucket after datum's bucket."""
+    datum = floor_datum(unit, datum)
+
+    if unit == "hour":
+        return datum + ONE_HOUR
+    elif unit == "day":
+        return datum + ONE_DAY
+    elif unit == "week":
+        return datum + ONE_WEEK
+    elif datum.month == 12:
+        return datum.replace(year=(datum.year + 1), month=1)
+    else:
+        return datum.replace(month=(datum.month + 1))
+# --- end of next_datum (...) ---
+
+
+class DatumHistogram(object):
+
+    def __init__(self, bucket):
+        super().__init__()
+        self.bucket = bucket
+        self.unit, self.label_fmt, self.cyclic_labels = (
+            HISTOGRAM_BUCKETS[bucket]
+        )
+        # bucket start datum -> [count, total]
+        self.counters = {}
+        # bucket of the last add() call:
+        #  (start timestamp, end timestamp, counters) or None
+        self.last_bucket = None
+        self.num_values = 0
+        self.total = 0
+    # --- end of __init__ (...) ---
+
+    def get_counters(self, bucket_start):
+        try:
+            return self.counters[bucket_start]
+        except KeyError:
+            counters = [0, 0]
+            self.counters[bucket_start] = counters
+            return counters
+    # --- end of get_counters (...) ---
+
+    def add(self, timestamp, value):
+        """
+        Adds a single value.
+
+        @param timestamp:  datum timestamp
+        @param value:      duration
+        """
+        last_bucket = self.last_bucket
+        if (
+            last_bucket is None
+            or not (last_bucket[0] <= timestamp < last_bucket[1])
+        ):
+            bucket_start = floor_datum(
+                self.unit, ffs.fon.stats.columns.timestamp_to_datum(timestamp)
+            )
+            datum_to_timestamp = ffs.fon.stats.columns.datum_to_timestamp
+            last_bucket = (
+                datum_to_timestamp(bucket_start),
+                datum_to_timestamp(next_datum(self.unit, bucket_start)),
+                self.get_counters(bucket_start)
+            )
+            self.last_bucket = last_bucket
+        # --
+
+        counters = last_bucket[2]
+        counters[0] += 1
+        counters[1] += value
+        self.num_values += 1
+        self.total += value
+    # --- end of add (...) ---
+
+    def add_many(self, timestamps, values):
+        """
+        Adds a block of values.
+
+        @param timestamps:  datum timestamps (any order, array)
+        @param values:      durations, one per timestamp (array)
+        """
+        timestamps, values = self.sort_values(timestamps, values)
+
+        for bucket_start, count, total in self.gen_calendar_buckets(
+            timestamps, values
+        ):
+            if count:
+                counters = self.get_counters(bucket_start)
+                counters[0] += count
+                counters[1] += total
+        # --
+
+        self.num_values += len(values)
+        self.total += sum(values)
+    # --- end of add_many (...) ---
+
+    def sort_values(self, timestamps, values):
+        """
+        Returns timestamps and values in ascending timestamp order,
+        without sorting if they are already (reverse) sorted.
+        """
+        if all(
+            map(
+                operator.__le__, timestamps,
+                itertools.islice(timestamps, 1, None)
+            )
+        ):
+            return (timestamps, values)
+
+        elif all(
+            map(
+                operator.__ge__, timestamps,
+                itertools.islice(timestamps, 1, None)
+            )
+        ):
+            return (timestamps[::-1], values[::-1])
+
+        else:
+            order = sorted(range(len(timestamps)), key=timestamps.__getitem__)
+            return (
+                array.array(
+                    timestamps.typecode, map(timestamps.__getitem__, order)
+                ),
+                array.array(values.typecode, map(values.__getitem__, order))
+            )
+    # --- end of sort_values (...) ---
+
+    def gen_calendar_buckets(self, timestamps, values, history_range=None):
+        """
+        Sweeps over ascending timestamps.
+
+        @return: generator of (bucket start datum, count, total) tuples
+        """
+        if history_range is None:
+            if not timestamps:
+                return
+            history_range = (timestamps[0], timestamps[-1])
+        # --
+
+        unit = self.unit
+        prefix_sums = array.array('q', itertools.accumulate(values, initial=0))
+        lower_idx = 0
+        timestamp_to_datum = ffs.fon.stats.columns.timestamp_to_datum
+        datum_to_timestamp = ffs.fon.stats.columns.datum_to_timestamp
+
+        bucket_start = floor_datum(unit, timestamp_to_datum(history_range[0]))
+        last_bucket_start = floor_datum(
+            unit, timestamp_to_datum(history_range[1])
+        )
+
+        while bucket_start <= last_bucket_start:
+            bucket_end = next_datum(unit, bucket_start)
+            upper_idx = bisect.bisect_left(
+                timestamps, datum_to_timestamp(bucket_end), lower_idx
+            )
+
+            yield (
+                bucket_start,
+                (upper_idx - lower_idx),
+                (prefix_sums[upper_idx] - prefix_sums[lower_idx])
+            )
+
+            lower_idx = upper_idx
+            bucket_start = bucket_end
+        # --
+    # --- end of gen_calendar_buckets (...) ---
+
+    def gen_counted_buckets(self, history_range=None):
+        """
+        @return: generator of (bucket start datum, count, total) tuples,
+                 including empty buckets
+        """
+        bucket_starts = list(self.counters)
+
+        if history_range is not None:
+            timestamp_to_datum = ffs.fon.stats.columns.timestamp_to_datum
+            bucket_starts.extend(
+                floor_datum(self.unit, timestamp_to_datum(timestamp))
+                for timestamp in history_range
+            )
+        # --
+
+        if not bucket_starts:
+            return
+
+        bucket_start = min(bucket_starts)
+        last_bucket_start = max(bucket_starts)
+
+        while bucket_start <= last_bucket_start:
+            count, total = self.counters.get(bucket_start, (0, 0))
+            yield (bucket_start, count, total)
+            bucket_start = next_datum(self.unit, bucket_start)
+        # --
+    # --- end of gen_counted_buckets (...) ---
+
+    def get_buckets(self, history_range=None):
+        """
+        @param history_range:  2-tuple (first timestamp, last timestamp)
+                               or None (range of the added timestamps)
+
+        @return: list of (label, count, total) tuples
+        """
+        label_fmt = self.label_fmt
+        calendar_buckets = self.gen_counted_buckets(history_range)
+
+        if self.cyclic_labels is None:
+            return [
+                (bucket_start.strftime(label_fmt), count, total)
+                for bucket_start, count, total in calendar_buckets
+            ]
+        # --
+
+        folded = {label: [0, 0] for label in self.cyclic_labels}
+        for bucket_start, count, total in calendar_buckets:
+            counters = folded[bucket_start.strftime(label_fmt)]
+            counters[0] += count
+            counters[1] += total
+        # --
+
+        return [
+            (label, count, total)
+            for label, (count, total) in folded.items()
+        ]
+    # --- end of get_buckets (...) ---
+
+# --- end of DatumHistogram ---
@@ -24,6 +24,14 @@ class LexerBase(object):
         return reserved
     # --- end of build_reserved (...) ---
 
+    def build_value_keywords(self):
+        """
+        Returns the token types of keywords that may also appear as values,
+        these tokens keep their original text.
+        """
+        return set()
+    # --- end of build_value_keywords (...) ---
+
     def build_tokens(self):
         tokens = ["STR"]
         tokens.extend(set(self.reserved.values()))
@@ -37,6 +45,7 @@ class LexerBase(object):
         self.regexp_escape_seq = re.compile(r'[\\]([.])')
 
         self.reserved = self.build_reserved()
+        self.value_keywords = self.build_value_keywords()
         self.tokens = self.build_tokens()
 
         self.lexer = None
@@ -110,7 +119,8 @@ class LexerBase(object):
         except KeyError:
             pass
         else:
-            t.value = slow
+            if stype not in self.value_keywords:
+                t.value = slow
             t.type = stype
         # --
         return self.emit_reset_cmd_end(t)
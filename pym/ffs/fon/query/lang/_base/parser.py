@@ -10,6 +10,9 @@
 __all__ = ["ParserBase"]
 
 import io
+import os
+import pickle
+import tempfile
 import ply.yacc
 
 import ffs.fon.exc.lang
@@ -56,14 +59,107 @@ class ParserBase(object):
         self.filename = None
     # --- end of reset (...) ---
 
-    def build(self, **kwargs):
+    def build(self, tables_file=None, **kwargs):
+        """
+        Builds the lexer (if necessary) and the parser.
+
+        @param tables_file:  path to a file for caching the parser tables
+                             (pickle) or None. The file gets replaced
+                             if the grammar (rule docstrings, tokens,
+                             precedence) or PLY's table version has changed
+                             since it was written. Cache directories that
+                             cannot be written are ignored silently.
+        """
         kwargs.setdefault("debug", False)
         kwargs.setdefault("write_tables", False)
 
         self.lexer.build_if_needed(debug=kwargs["debug"])
+
+        if tables_file is not None:
+            try:
+                self.parser = self._build_cached(tables_file, **kwargs)
+            except OSError:
+                pass
+            else:
+                return
+        # --
+
         self.parser = ply.yacc.yacc(module=self, **kwargs)
     # --- end of build (...) ---
 
+    def _build_cached(self, tables_file, **kwargs):
+        """
+        Builds the parser from a private copy of the tables file.
+        PLY rewrites that copy in place if the tables are out of date,
+        the copy then replaces the tables file atomically, so that
+        concurrent builds never read a partially written file.
+
+        @raises OSError: tables file not usable, e.g. not writable
+        """
+        tables_dir = os.path.dirname(tables_file) or "."
+        os.makedirs(tables_dir, exist_ok=True)
+
+        try:
+            with io.open(tables_file, "rb") as fh:
+                tables_data = fh.read()
+        except FileNotFoundError:
+            tables_data = None
+
+        fd, tmp_file = tempfile.mkstemp(
+            prefix=".tmp.", suffix=".pickle", dir=tables_dir
+        )
+        try:
+            with io.open(fd, "wb") as fh:
+                if tables_data is not None:
+                    fh.write(tables_data)
+            # --
+
+            if tables_data is None:
+                # no tables to read
+                os.unlink(tmp_file)
+
+            # PLY reports write errors to the errorlog only,
+            #  the tables file is replaced only if the copy can be read
+            kwargs.setdefault("errorlog", ply.yacc.NullLogger())
+
+            try:
+                parser = ply.yacc.yacc(
+                    module=self, picklefile=tmp_file, **kwargs
+                )
+
+            except (EOFError, pickle.UnpicklingError):
+                # damaged tables file, e.g. written by an older version
+                #  that did not replace it atomically, recreate it
+                os.unlink(tables_file)
+                raise OSError("bad parser tables file", tables_file) from None
+            # --
+
+            try:
+                with io.open(tmp_file, "rb") as fh:
+                    new_tables_data = fh.read()
+            except FileNotFoundError:
+                # not written
+                return parser
+
+            if new_tables_data != tables_data:
+                try:
+                    ply.yacc.LRTable().read_pickle(tmp_file)
+                except (EOFError, pickle.UnpicklingError):
+                    return parser
+
+                os.replace(tmp_file, tables_file)
+            # --
+
+        finally:
+            try:
+                os.unlink(tmp_file)
+            except FileNotFoundError:
+                pass
+        # --
+
+        return parser
+    # --- end of _build_cached (...) ---
+
     def build_if_needed(self, **kwargs):
         if self.parser is None:
             self.build(**kwargs)
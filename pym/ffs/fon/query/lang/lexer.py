@@ -52,6 +52,9 @@ class FilterLangLexer(ffs.fon.query.lang._base.lexer.LexerBase):
             "nr":               "KW_THEM",
             "name":             "KW_NAME",
 
+            "source":           "KW_SOURCE",
+            "box":              "KW_SOURCE",
+
             "duration":         "KW_DURATION",
 
             "since":            "KW_SINCE",
@@ -78,6 +81,16 @@ class FilterLangLexer(ffs.fon.query.lang._base.lexer.LexerBase):
         return reserved
     # --- end of build_reserved (...) ---
 
+    def build_value_keywords(self):
+        value_keywords = super().build_value_keywords()
+
+        # "source" and "box" are common words (e.g. "name ~ box"),
+        #  accept them as values, see FilterLangParser.p_value()
+        value_keywords.add("KW_SOURCE")
+
+        return value_keywords
+    # --- end of build_value_keywords (...) ---
+
     def build_tokens(self):
         tokens = super().build_tokens()
 
@@ -59,12 +59,11 @@ class FilterLangParser(ffs.fon.query.lang._base.parser.ParserBase):
         self.regexp_telnummer = re.compile(r'^(?P<nr>\d+)$')
         self.obj_cache = ffs.util.objcache.ObjectCache()
 
-        self.date_today = (
-            datetime.datetime.combine(
-                datetime.date.today(),
-                datetime.time.min
-            )
-        )
+        self.date_today = None
+        self.set_date_today()
+        # set if the last parsed expression depends on date_today,
+        #  e.g. "today" or "for 3 days" (see get_date())
+        self.date_today_used = False
 
         self.date_op_map = self.dict_composition_partial(
             self.lexer.reserved,
@@ -89,13 +88,36 @@ class FilterLangParser(ffs.fon.query.lang._base.parser.ParserBase):
         )
     # --- end of __init__ (...) ---
 
+    def reset(self):
+        super().reset()
+        self.date_today_used = False
+    # --- end of reset (...) ---
+
+    def set_date_today(self, date_today=None):
+        """
+        Sets the date that relative dates ("today", "week", ...) refer to.
+
+        @param date_today:  datetime.date or None (current date)
+        """
+        if date_today is None:
+            date_today = datetime.date.today()
+
+        self.date_today = datetime.datetime.combine(
+            date_today, datetime.time.min
+        )
+    # --- end of set_date_today (...) ---
+
     def get_date(self, date_shift=None):
         date_today = self.date_today
+        self.date_today_used = True
         return (date_today + date_shift) if date_shift else date_today
     # ---
 
     if HAVE_DATEUTIL_PARSER:
         def convert_date(self, arg):
+            # missing fields (e.g. the year in "03-01") are taken
+            #  from the current date
+            self.date_today_used = True
             return dateutil.parser.parse(arg, ignoretz=True, yearfirst=True)
         # --- end of convert_date (...) ---
     else:
@@ -157,6 +179,13 @@ class FilterLangParser(ffs.fon.query.lang._base.parser.ParserBase):
         else:
             p[0] = None
 
+    # values of name/number/source expressions,
+    #  which may be keywords that are not ambiguous there
+    def p_value(self, p):
+        '''value : STR
+                 | KW_SOURCE'''
+        p[0] = p[1]
+
     # simple expressions
     def p_sexpr_true(self, p):
         '''sexpr : KW_TRUE'''
@@ -216,11 +245,11 @@ class FilterLangParser(ffs.fon.query.lang._base.parser.ParserBase):
         )
 
     def p_sexpr_dev(self, p):
-        '''sexpr : KW_DEV STR'''
+        '''sexpr : KW_DEV value'''
         p[0] = FilterAttrRegexp("me.nebenstelle", p[2], flags=re.I)
 
     def p_sexpr_me(self, p):
-        '''sexpr : KW_ME STR'''
+        '''sexpr : KW_ME value'''
         m = self.regexp_telnummer.match(p[2])
         if m:
             p[0] = self.obj_cache(
@@ -234,7 +263,7 @@ class FilterLangParser(ffs.fon.query.lang._base.parser.ParserBase):
         p[0] = self.obj_cache(FilterTrue)
 
     def p_sexpr_them(self, p):
-        '''sexpr : KW_THEM STR'''
+        '''sexpr : KW_THEM value'''
         if not p[2]:
             self.handle_parse_error(p, 2, "empty 'them' identifier")
         else:
@@ -250,7 +279,7 @@ class FilterLangParser(ffs.fon.query.lang._base.parser.ParserBase):
     # ---
 
     def p_sexpr_them_like(self, p):
-        '''sexpr : KW_THEM APPROX STR'''
+        '''sexpr : KW_THEM APPROX value'''
         p[0] = FilterAttrRegexp("them.nr", p[3], flags=re.I)
     # ---
 
@@ -259,14 +288,28 @@ class FilterLangParser(ffs.fon.query.lang._base.parser.ParserBase):
         p[0] = self.obj_cache(FilterTrue)
 
     def p_sexpr_them_name_eq(self, p):
-        '''sexpr : KW_NAME EQ     STR
-                 | KW_NAME EQ_CMP STR'''
+        '''sexpr : KW_NAME EQ     value
+                 | KW_NAME EQ_CMP value'''
         p[0] = FilterAttrCaseEq("them.name", p[3], weak=True)
 
     def p_sexpr_them_name_like(self, p):
-        '''sexpr : KW_NAME APPROX STR'''
+        '''sexpr : KW_NAME APPROX value'''
         p[0] = FilterAttrRegexp("them.name", p[3], flags=re.I, weak=True)
 
+    def p_sexpr_source(self, p):
+        '''sexpr : KW_SOURCE value'''
+        p[0] = self.obj_cache(
+            FilterAttrCmpFunc, "me.source", operator.__eq__, p[2]
+        )
+
+    def p_sexpr_source_like(self, p):
+        '''sexpr : KW_SOURCE APPROX value'''
+        p[0] = FilterAttrRegexp("me.source", p[3], flags=re.I)
+
+    def p_sexpr_source_any(self, p):
+        '''sexpr : KW_SOURCE KW_ANY'''
+        p[0] = self.obj_cache(FilterTrue)
+
     def _create_time_cmp_date(self, op_func, p):
         try:
             date_arg = self.convert_date(p[2])
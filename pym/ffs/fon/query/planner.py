@@ -0,0 +1,197 @@
+# fritz-fon-stats -- filter planner
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2019 André Erdmann <dywi@mailerd.de>
+#
+# Distributed under the terms of the MIT license.
+# (See LICENSE.MIT or http://opensource.org/licenses/MIT)
+#
+#  The planner reorders the members of AND/OR filters so that
+#  cheap members that decide the result for many entries run first:
+#
+#    AND:  ascending cost / (1 - selectivity)
+#    OR:   ascending cost / selectivity
+#
+#  Costs are per-class estimates (FilterFunc.get_est_cost()),
+#  selectivities are measured on a sample of the loaded stats
+#  or default to FilterFunc.EST_SELECTIVITY.
+#
+
+__all__ = ["FilterPlanner"]
+
+import ffs.util.mask
+
+import ffs.fon.query.filters
+from ffs.fon.query.filters import (
+    FilterAND, FilterOR, FilterWrapperFunc, SimpleCompoundFilterFunc
+)
+
+
+# avoid division by zero when ranking
+MIN_RANK_DIVISOR = 1e-6
+
+
+class FilterPlanner(object):
+
+    SAMPLE_SIZE = 1024
+
+    def __init__(self, stats=None, sample_size=None):
+        super().__init__()
+        self.sample = self.get_sample(
+            stats, (self.SAMPLE_SIZE if sample_size is None else sample_size)
+        )
+        # id(func) -> (func, cost, selectivity)
+        self.estimates = {}
+    # --- end of __init__ (...) ---
+
+    def get_sample(self, stats, sample_size):
+        # evenly spaced rows of a columnar stats object, or None
+        if stats is None or not sample_size or not hasattr(stats, "get_rows"):
+            return None
+
+        rows = stats.get_rows()
+        if not rows:
+            return None
+
+        return rows[::max(1, (len(rows) // sample_size))]
+    # --- end of get_sample (...) ---
+
+    def get_estimates(self, func):
+        """
+        @return: 2-tuple (cost, selectivity) or None if func is not planned
+        """
+        try:
+            _, cost, selectivity = self.estimates[id(func)]
+        except KeyError:
+            return None
+        else:
+            return (cost, selectivity)
+    # --- end of get_estimates (...) ---
+
+    def measure_selectivity(self, func, default):
+        sample = self.sample
+        if sample is None:
+            return default
+
+        try:
+            mask = func.get_mask(sample)
+        except AttributeError:
+            return default
+        else:
+            return ffs.util.mask.mask_count(mask) / len(sample)
+    # --- end of measure_selectivity (...) ---
+
+    def _get_and_rank(self, func):
+        cost, selectivity = self.get_estimates(func)
+        return cost / max((1.0 - selectivity), MIN_RANK_DIVISOR)
+    # --- end of _get_and_rank (...) ---
+
+    def _get_or_rank(self, func):
+        cost, selectivity = self.get_estimates(func)
+        return cost / max(selectivity, MIN_RANK_DIVISOR)
+    # --- end of _get_or_rank (...) ---
+
+    def _plan_compound(self, func):
+        funcs = [self.plan(f) for f in func.funcs]
+
+        if isinstance(func, FilterAND):
+            funcs.sort(key=self._get_and_rank)
+            get_pass_ratio = (lambda selectivity: selectivity)
+            get_selectivity = (lambda pass_ratio: pass_ratio)
+        elif isinstance(func, FilterOR):
+            funcs.sort(key=self._get_or_rank)
+            get_pass_ratio = (lambda selectivity: 1.0 - selectivity)
+            get_selectivity = (lambda pass_ratio: 1.0 - pass_ratio)
+        else:
+            return (func, func.get_est_cost(), func.EST_SELECTIVITY)
+        # --
+
+        # expected cost when evaluating entry by entry,
+        #  a member is only evaluated if the previous ones did not decide
+        cost = 0.0
+        pass_ratio = 1.0
+        for member in funcs:
+            member_cost, member_selectivity = self.get_estimates(member)
+            cost += pass_ratio * member_cost
+            pass_ratio *= get_pass_ratio(member_selectivity)
+        # --
+
+        if funcs == func.funcs:
+            planned = func
+        else:
+            planned = func.__class__(funcs)
+
+        # members are assumed to be independent if there is no sample
+        return (
+            planned, cost,
+            self.measure_selectivity(planned, get_selectivity(pass_ratio))
+        )
+    # --- end of _plan_compound (...) ---
+
+    def plan(self, func):
+        """
+        Returns a filter func that is equivalent to the given one,
+        with reordered AND/OR members. The input filter is not modified.
+        """
+        if isinstance(func, SimpleCompoundFilterFunc):
+            planned, cost, selectivity = self._plan_compound(func)
+
+        elif isinstance(func, FilterWrapperFunc):
+            inner = self.plan(func.func)
+            planned = (func if inner is func.func else func.__class__(inner))
+            cost, inner_selectivity = self.get_estimates(inner)
+            selectivity = (1.0 - inner_selectivity)
+
+        else:
+            planned = func
+            cost = func.get_est_cost()
+            selectivity = self.measure_selectivity(func, func.EST_SELECTIVITY)
+        # --
+
+        self.estimates[id(planned)] = (planned, cost, selectivity)
+        return planned
+    # --- end of plan (...) ---
+
+    def _get_estimates_desc(self, func):
+        estimates = self.get_estimates(func)
+        if estimates is None:
+            return ""
+        else:
+            return "  [cost {0:.2f}, selectivity {1:.1%}]".format(*estimates)
+    # --- end of _get_estimates_desc (...) ---
+
+    def gen_describe(self, func, level):
+        estimates_desc = self._get_estimates_desc(func)
+
+        if isinstance(func, SimpleCompoundFilterFunc):
+            yield (level, "{}({}".format(func.COND_DESC, estimates_desc))
+            for member in func.funcs:
+                yield from self.gen_describe(member, level + 1)
+            yield (level, ")")
+
+        elif isinstance(func, FilterWrapperFunc):
+            # FilterNOT
+            yield (level, "NOT({}".format(estimates_desc))
+            yield from self.gen_describe(func.func, level + 1)
+            yield (level, ")")
+
+        else:
+            desc_iter = iter(func.gen_describe(level))
+            for desc_level, desc in desc_iter:
+                yield (desc_level, desc + estimates_desc)
+                break
+            yield from desc_iter
+        # --
+    # --- end of gen_describe (...) ---
+
+    def describe(self, func, *, level=0, indent_str="  "):
+        """
+        Like FilterFunc.describe(), but includes the estimates.
+        """
+        return "\n".join(
+            ((level * indent_str) + desc)
+            for level, desc in self.gen_describe(func, level)
+        )
+    # --- end of describe (...) ---
+
+# --- end of FilterPlanner ---
@@ -0,0 +1,104 @@
+# fritz-fon-stats -- answering queries from rollup tables
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2019 André Erdmann <dywi@mailerd.de>
+#
+# Distributed under the terms of the MIT license.
+# (See LICENSE.MIT or http://opensource.org/licenses/MIT)
+#
+#  A query can be answered from rollup cells (ffs.fon.stats.rollup)
+#  instead of the raw rows if
+#
+#  - it groups by cell dimensions only (me, device, source, call type,
+#    day or coarser time buckets)
+#  - it needs per-group counts and sums only (count, sum, avg)
+#  - its filters give the same result for all rows of a cell,
+#    i.e. they check me/call_type attributes or compare the datum
+#    against the start of a day (>=, <)
+#
+#  Otherwise, the query falls back to the raw rows.
+#
+
+__all__ = ["is_rollup_filter", "can_use_rollup"]
+
+import datetime
+import operator
+
+import ffs.fon.query.compiler
+import ffs.fon.query.filters
+from ffs.fon.query.filters import (
+    CompoundFilterFunc, FilterWrapperFunc, FilterTrue, FilterFalse,
+    FilterAttrCheckBase, FilterAttrCmpFunc, FilterHasAttr
+)
+
+
+# group keys that are constant within a cell
+ROLLUP_GROUP_KEYS = frozenset({
+    "me", "dev", "source", "type",
+    "day", "week", "month", "year", "weekday",
+})
+
+# aggregates that can be computed from per-cell count and total
+ROLLUP_AGGREGATES = frozenset({"count", "sum", "avg"})
+
+# attribute heads that are constant within a cell
+ROLLUP_ATTR_HEADS = frozenset({"me", "call_type"})
+
+# datum comparisons against the start of a day
+#  that are exact for day cells
+ROLLUP_DATUM_CMP_FUNCS = frozenset({operator.__ge__, operator.__lt__})
+
+
+def is_rollup_filter(filter_func):
+    """
+    Returns True if filter_func gives the same result
+    for all rows of a rollup cell.
+    """
+    if isinstance(filter_func, (FilterTrue, FilterFalse)):
+        return True
+
+    elif isinstance(filter_func, CompoundFilterFunc):
+        return all(map(is_rollup_filter, filter_func.funcs))
+
+    elif isinstance(
+        filter_func,
+        (FilterWrapperFunc, ffs.fon.query.compiler.CompiledFilterFunc)
+    ):
+        return is_rollup_filter(filter_func.func)
+
+    elif (
+        isinstance(filter_func, FilterAttrCmpFunc)
+        and filter_func.attr_name == "datum"
+    ):
+        expected_value = filter_func.expected_value
+        return (
+            filter_func.cmp_func in ROLLUP_DATUM_CMP_FUNCS
+            and isinstance(expected_value, datetime.datetime)
+            and expected_value.tzinfo is None
+            and expected_value.time() == datetime.time.min
+        )
+
+    elif isinstance(filter_func, (FilterAttrCheckBase, FilterHasAttr)):
+        return (
+            filter_func.attr_name.partition(".")[0] in ROLLUP_ATTR_HEADS
+        )
+
+    else:
+        return False
+# --- end of is_rollup_filter (...) ---
+
+
+def can_use_rollup(group_keys, aggregates, filter_funcv):
+    """
+    @param group_keys:    GroupKey objects (ffs.fon.query.aggregate)
+    @param aggregates:    Aggregate objects
+    @param filter_funcv:  filter chain
+
+    @return: True if the query can be answered from rollup cells
+    """
+    return (
+        all(key.name in ROLLUP_GROUP_KEYS for key in group_keys)
+        and all(agg.name in ROLLUP_AGGREGATES for agg in aggregates)
+        and all(map(is_rollup_filter, filter_funcv))
+    )
+# --- end of can_use_rollup (...) ---
@@ -0,0 +1,252 @@
+# fritz-fon-stats -- query server and client over a unix socket
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2019 André Erdmann <dywi@mailerd.de>
+#
+# Distributed under the terms of the MIT license.
+# (See LICENSE.MIT or http://opensource.org/licenses/MIT)
+#
+#  A query server answers ffs-query command lines
+#  with data that is kept in memory between requests
+#  (see ffs.scripts.ffs_query.FFSQueryServerWorker).
+#
+#  Each connection carries one request and one response,
+#  both are JSON objects, prefixed by their length (4 bytes, big endian):
+#
+#    request:   {"argv": [<arg>...], "cwd": <client's working directory>}
+#    response:  {"exit_code": <int>, "stdout": <str>, "stderr": <str>}
+#
+#  Requests are handled one at a time, in the server's event loop.
+#
+#  The client side (query_server()) uses blocking sockets
+#  so that clients do not need to load asyncio.
+#
+
+__all__ = ["QueryServer", "query_server"]
+
+import errno
+import json
+import os
+import signal
+import socket
+import stat
+import struct
+
+import ffs.util.lazyimport
+from ffs.util.lazyimport import lazy_import
+
+# server only
+asyncio = lazy_import("asyncio")
+
+
+MESSAGE_HEADER = struct.Struct("!I")
+
+# requests are small (a command line), reject anything beyond that
+MAX_REQUEST_SIZE = 2**20
+
+
+def encode_message(obj):
+    data = json.dumps(obj).encode("utf-8")
+    return MESSAGE_HEADER.pack(len(data)) + data
+# --- end of encode_message (...) ---
+
+
+def decode_message(data):
+    """
+    @raises ValueError: not a JSON object
+    """
+    obj = json.loads(data.decode("utf-8"))
+    if not isinstance(obj, dict):
+        raise ValueError("message is not an object")
+    return obj
+# --- end of decode_message (...) ---
+
+
+def query_server(socket_path, argv, cwd=None):
+    """
+    Sends a command line to a query server and waits for its response.
+
+    @param socket_path:  path to the server's socket
+    @param argv:         ffs-query arguments
+    @param cwd:          directory that relative paths in argv refer to
+                         (default: current working directory)
+
+    @return: 3-tuple (exit code, stdout text, stderr text)
+    @raises OSError:    connection failed
+    @raises ValueError: malformed response
+    """
+    request = {
+        "argv": list(argv),
+        "cwd": (os.getcwd() if cwd is None else cwd),
+    }
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        sock.sendall(encode_message(request))
+
+        with sock.makefile("rb") as fh:
+            header = fh.read(MESSAGE_HEADER.size)
+            if len(header) < MESSAGE_HEADER.size:
+                raise ValueError("truncated response")
+
+            (size,) = MESSAGE_HEADER.unpack(header)
+            data = fh.read(size)
+            if len(data) < size:
+                raise ValueError("truncated response")
+        # --
+    # --
+
+    response = decode_message(data)
+    try:
+        return (
+            int(response["exit_code"]),
+            str(response["stdout"]), str(response["stderr"])
+        )
+    except (KeyError, TypeError):
+        raise ValueError("malformed response") from None
+# --- end of query_server (...) ---
+
+
+class QueryServer(object):
+    """
+    Listens on a unix socket and passes requests
+    to a handler function(argv, cwd) -> (exit code, stdout, stderr).
+    """
+
+    def __init__(self, socket_path, handle_request):
+        super().__init__()
+        self.socket_path = socket_path
+        self.handle_request = handle_request
+    # --- end of __init__ (...) ---
+
+    def remove_stale_socket(self):
+        """
+        Removes the socket file of a server that is no longer running.
+
+        @raises OSError: another server is listening on the socket,
+                         or the path exists and is not a socket
+        """
+        try:
+            stat_info = os.stat(self.socket_path)
+        except FileNotFoundError:
+            return
+
+        if not stat.S_ISSOCK(stat_info.st_mode):
+            raise OSError(
+                errno.EEXIST, "file exists and is not a socket",
+                self.socket_path
+            )
+
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            try:
+                sock.connect(self.socket_path)
+            except ConnectionRefusedError:
+                pass
+            else:
+                raise OSError(
+                    errno.EADDRINUSE, "query server already running",
+                    self.socket_path
+                )
+        # --
+
+        os.unlink(self.socket_path)
+    # --- end of remove_stale_socket (...) ---
+
+    async def read_request(self, reader):
+        """
+        @return: request dict, or None if the client sent no request
+        @raises ValueError: malformed request
+        """
+        try:
+            header = await reader.readexactly(MESSAGE_HEADER.size)
+        except asyncio.IncompleteReadError:
+            return None
+
+        (size,) = MESSAGE_HEADER.unpack(header)
+        if size > MAX_REQUEST_SIZE:
+            raise ValueError("request too large")
+
+        try:
+            data = await reader.readexactly(size)
+        except asyncio.IncompleteReadError:
+            raise ValueError("truncated request") from None
+
+        request = decode_message(data)
+        argv = request.get("argv")
+        cwd = request.get("cwd")
+
+        if (
+            not isinstance(argv, list)
+            or not all(isinstance(arg, str) for arg in argv)
+            or not isinstance(cwd, str)
+        ):
+            raise ValueError("malformed request")
+
+        return request
+    # --- end of read_request (...) ---
+
+    async def handle_connection(self, reader, writer):
+        try:
+            try:
+                request = await self.read_request(reader)
+            except ValueError as err:
+                response = {
+                    "exit_code": 2, "stdout": "",
+                    "stderr": "query server: {}\n".format(err)
+                }
+            else:
+                if request is None:
+                    return
+
+                exit_code, stdout, stderr = self.handle_request(
+                    request["argv"], request["cwd"]
+                )
+                response = {
+                    "exit_code": exit_code, "stdout": stdout, "stderr": stderr
+                }
+            # --
+
+            writer.write(encode_message(response))
+            await writer.drain()
+
+        except ConnectionError:
+            pass  # client went away
+
+        finally:
+            writer.close()
+    # --- end of handle_connection (...) ---
+
+    async def serve(self):
+        """
+        Serves requests until SIGTERM or SIGINT is received.
+        The socket file is created with mode 0600 and removed on exit.
+        """
+        self.remove_stale_socket()
+
+        loop = asyncio.get_running_loop()
+        stop_event = asyncio.Event()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, stop_event.set)
+
+        old_umask = os.umask(0o177)
+        try:
+            server = await asyncio.start_unix_server(
+                self.handle_connection, path=self.socket_path
+            )
+        finally:
+            os.umask(old_umask)
+
+        try:
+            async with server:
+                await stop_event.wait()
+        finally:
+            try:
+                os.unlink(self.socket_path)
+            except OSError:
+                pass
+    # --- end of serve (...) ---
+
+    def run(self):
+        asyncio.run(self.serve())
+
+# --- end of QueryServer ---
@@ -0,0 +1,586 @@
+# fritz-fon-stats -- query output sinks
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2019 André Erdmann <dywi@mailerd.de>
+#
+# Distributed under the terms of the MIT license.
+# (See LICENSE.MIT or http://opensource.org/licenses/MIT)
+#
+#  Output sinks consume matched entries one at a time and keep
+#  only what is needed for their output (a counter, a set of values),
+#  so that they can be fed from a stream.
+#
+
+__all__ = ["OUTPUT_SINKS", "create_output_sink"]
+
+import abc
+import heapq
+import itertools
+import operator
+import sys
+
+import ffs.util.hll
+import ffs.util.lazyimport
+from ffs.util.lazyimport import lazy_import
+
+import ffs.fon.query.aggregate
+import ffs.fon.query.histogram
+
+# loaded on first use
+lazy_import("ffs.fon.stats.columns")
+lazy_import("ffs.fon.query.rollup")
+
+
+def get_group_values(entries, group_keys):
+    """
+    @param entries:     AVMPhoneStatsRows object
+    @param group_keys:  GroupKey objects (ffs.fon.query.aggregate)
+
+    @return: iterable of key values tuples, one per entry
+    """
+    if group_keys:
+        return zip(
+            *[
+                entries.get_attr_values(key.attr_name, key.convert)
+                for key in group_keys
+            ]
+        )
+    else:
+        return itertools.repeat(())
+# --- end of get_group_values (...) ---
+
+
+class OutputSink(object, metaclass=abc.ABCMeta):
+
+    def __init__(self, *, resolve_names=True, outstream=None):
+        super().__init__()
+        self.resolve_names = resolve_names
+        self.outstream = (sys.stdout if outstream is None else outstream)
+    # --- end of __init__ (...) ---
+
+    def write_lines(self, lines):
+        print("\n".join(lines), file=self.outstream)
+
+    @abc.abstractmethod
+    def add(self, entry):
+        raise NotImplementedError(self)
+
+    def add_many(self, entries):
+        add = self.add
+        for entry in entries:
+            add(entry)
+    # --- end of add_many (...) ---
+
+    def supports_rollup(self, filter_funcv):
+        """
+        Returns True if the output can be computed from rollup cells
+        for the given filter chain.
+
+        Sinks that return True implement add_rollup_cells(cells),
+        which adds matched rollup cells, a view of
+        AVMPhoneStatsRollupColumns (ffs.fon.stats.rollup) rows.
+        """
+        return False
+    # --- end of supports_rollup (...) ---
+
+    @abc.abstractmethod
+    def finish(self, num_prev_matched):
+        """
+        Writes the output.
+
+        @param num_prev_matched:  number of entries that have been
+                                  matched by all but the final filter
+        """
+        raise NotImplementedError(self)
+    # --- end of finish (...) ---
+
+# --- end of OutputSink ---
+
+
+class PrintSink(OutputSink):
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.num_matched = 0
+
+    def add(self, entry):
+        self.outstream.write(str(entry))
+        self.outstream.write("\n")
+        self.num_matched += 1
+    # --- end of add (...) ---
+
+    def finish(self, num_prev_matched):
+        if not self.num_matched:
+            self.write_lines(())
+    # --- end of finish (...) ---
+
+# --- end of PrintSink ---
+
+
+class CountSink(OutputSink):
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.num_matched = 0
+
+    def add(self, entry):
+        self.num_matched += 1
+
+    def add_many(self, entries):
+        try:
+            self.num_matched += len(entries)
+        except TypeError:
+            self.num_matched += sum(1 for _ in entries)
+    # --- end of add_many (...) ---
+
+    def finish(self, num_prev_matched):
+        self.write_lines([str(self.num_matched)])
+
+# --- end of CountSink ---
+
+
+class RatioSink(CountSink):
+
+    def finish(self, num_prev_matched):
+        num_matched = self.num_matched
+
+        self.write_lines([
+            "{p:.00%} ({a} / {b})".format(
+                a=num_matched, b=num_prev_matched,
+                p=num_matched / (num_prev_matched or 1)
+            )
+        ])
+    # --- end of finish (...) ---
+
+# --- end of RatioSink ---
+
+
+class _ValueSetSink(OutputSink):
+    # name of the (dotted) entry attribute to collect
+    VALUE_ATTR = None
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.values = set()
+        self.get_value = operator.attrgetter(self.get_value_attr())
+    # --- end of __init__ (...) ---
+
+    def get_value_attr(self):
+        return self.VALUE_ATTR
+
+    def add(self, entry):
+        self.values.add(self.get_value(entry))
+
+    def add_many(self, entries):
+        self.values.update(map(self.get_value, entries))
+
+    def get_sorted_values(self):
+        return sorted(self.values)
+
+    def finish(self, num_prev_matched):
+        self.write_lines(map(str, self.get_sorted_values()))
+
+# --- end of _ValueSetSink ---
+
+
+class ListMeSink(_ValueSetSink):
+    VALUE_ATTR = "me.nr"
+
+
+class ListDevSink(_ValueSetSink):
+    VALUE_ATTR = "me.nebenstelle"
+
+
+class ListThemSink(_ValueSetSink):
+    VALUE_ATTR = "them.nr"
+
+    def get_value_attr(self):
+        return ("them" if self.resolve_names else self.VALUE_ATTR)
+
+    def get_sorted_values(self):
+        if self.resolve_names:
+            return sorted(self.values, key=lambda o: o.nr)
+        else:
+            return sorted(self.values)
+    # --- end of get_sorted_values (...) ---
+
+# --- end of ListThemSink ---
+
+
+class AggregateSink(OutputSink):
+    """
+    Groups entries by key values and aggregates their call duration,
+    see ffs.fon.query.aggregate.
+
+    Writes a tab-separated table with a header line,
+    one line per group, ordered by key values.
+    """
+
+    def __init__(self, *, group_by=None, aggregates=None, **kwargs):
+        super().__init__(**kwargs)
+        self.group_keys = [
+            ffs.fon.query.aggregate.get_group_key(name, self.resolve_names)
+            for name in (group_by or ())
+        ]
+        self.aggregates = [
+            ffs.fon.query.aggregate.get_aggregate(name)
+            for name in (aggregates or ("count",))
+        ]
+        self.keep_values = any(agg.needs_values for agg in self.aggregates)
+        # key values tuple -> GroupStats
+        self.groups = {}
+    # --- end of __init__ (...) ---
+
+    def add_values(self, keys, values):
+        groups = self.groups  # ref
+        keep_values = self.keep_values
+        group_stats_cls = ffs.fon.query.aggregate.GroupStats
+
+        for key, value in zip(keys, values):
+            try:
+                group = groups[key]
+            except KeyError:
+                group = group_stats_cls(keep_values)
+                groups[key] = group
+            # --
+
+            group.add(value)
+        # --
+    # --- end of add_values (...) ---
+
+    def add(self, entry):
+        self.add_values(
+            [tuple(key.get_entry_value(entry) for key in self.group_keys)],
+            [entry.dauer.dauer]
+        )
+    # --- end of add (...) ---
+
+    def add_many(self, entries):
+        try:
+            get_attr_values = entries.get_attr_values
+        except AttributeError:
+            # not columnar
+            super().add_many(entries)
+            return
+        # --
+
+        self.add_values(
+            get_group_values(entries, self.group_keys),
+            get_attr_values("dauer.dauer")
+        )
+    # --- end of add_many (...) ---
+
+    def supports_rollup(self, filter_funcv):
+        return ffs.fon.query.rollup.can_use_rollup(
+            self.group_keys, self.aggregates, filter_funcv
+        )
+    # --- end of supports_rollup (...) ---
+
+    def add_rollup_cells(self, cells):
+        groups = self.groups  # ref
+        group_stats_cls = ffs.fon.query.aggregate.GroupStats
+
+        for key, count, total in zip(
+            get_group_values(cells, self.group_keys),
+            cells.get_column("count"), cells.get_column("total")
+        ):
+            try:
+                group = groups[key]
+            except KeyError:
+                group = group_stats_cls()
+                groups[key] = group
+            # --
+
+            group.add_total(count, total)
+        # --
+    # --- end of add_rollup_cells (...) ---
+
+    def format_value(self, value):
+        if value is None:
+            return "-"
+        elif isinstance(value, float):
+            return "{:.2f}".format(value)
+        else:
+            return str(value)
+    # --- end of format_value (...) ---
+
+    def finish(self, num_prev_matched):
+        groups = self.groups
+        if not groups and not self.group_keys:
+            # aggregate over no entries
+            groups = {(): ffs.fon.query.aggregate.GroupStats()}
+
+        format_value = self.format_value
+        lines = [
+            "\t".join(
+                [key.name for key in self.group_keys]
+                + [agg.name for agg in self.aggregates]
+            )
+        ]
+
+        lines.extend(
+            sorted(
+                "\t".join(
+                    [format_value(value) for value in key]
+                    + [format_value(agg(group)) for agg in self.aggregates]
+                )
+                for key, group in groups.items()
+            )
+        )
+
+        self.write_lines(lines)
+    # --- end of finish (...) ---
+
+# --- end of AggregateSink ---
+
+
+class TopSink(AggregateSink):
+    """
+    Ranks the values of a group key (e.g. "them")
+    by call count or total duration and writes the top N values.
+
+    Counts are accumulated per distinct value, and the top values
+    are selected with a bounded heap instead of sorting all values.
+    """
+
+    # rank_by -> GroupStats attribute
+    RANK_ATTRS = {
+        "count":    "count",
+        "duration": "total",
+    }
+
+    def __init__(
+        self, *, top_key="them", num_top=10, rank_by="count", **kwargs
+    ):
+        super().__init__(
+            group_by=[top_key], aggregates=["count", "sum"], **kwargs
+        )
+        self.num_top = num_top
+        self.get_rank = operator.attrgetter(self.RANK_ATTRS[rank_by])
+    # --- end of __init__ (...) ---
+
+    def finish(self, num_prev_matched):
+        get_rank = self.get_rank
+        format_value = self.format_value
+
+        top_groups = heapq.nsmallest(
+            self.num_top, self.groups.items(),
+            key=(
+                lambda item: (-get_rank(item[1]), format_value(item[0][0]))
+            )
+        )
+
+        lines = ["\t".join((self.group_keys[0].name, "count", "duration"))]
+        lines.extend(
+            "{0}\t{1:d}\t{2:d}".format(
+                format_value(key[0]), group.count, group.total
+            )
+            for key, group in top_groups
+        )
+
+        self.write_lines(lines)
+    # --- end of finish (...) ---
+
+# --- end of TopSink ---
+
+
+class ApproxDistinctSink(OutputSink):
+    """
+    Estimates the number of distinct remote numbers, local numbers
+    or devices of the matched entries, optionally per group,
+    with HyperLogLog sketches (ffs.util.hll) instead of sets.
+
+    Writes a tab-separated table like AggregateSink. The estimates
+    have a relative standard error of HyperLogLog.get_std_error().
+    """
+
+    # distinct key -> attr name
+    DISTINCT_ATTRS = {
+        "them":     "them.nr",
+        "me":       "me.nr",
+        "dev":      "me.nebenstelle",
+    }
+
+    def __init__(self, *, distinct_key="them", group_by=None, **kwargs):
+        super().__init__(**kwargs)
+        self.distinct_key = distinct_key
+        self.attr_name = self.DISTINCT_ATTRS[distinct_key]
+        self.attr_getter = operator.attrgetter(self.attr_name)
+        self.group_keys = [
+            ffs.fon.query.aggregate.get_group_key(name, self.resolve_names)
+            for name in (group_by or ())
+        ]
+        self.get_register = self.new_sketch().get_register
+        # key values tuple -> HyperLogLog
+        self.sketches = {}
+    # --- end of __init__ (...) ---
+
+    def new_sketch(self):
+        return ffs.util.hll.HyperLogLog()
+
+    def get_sketch(self, key):
+        sketches = self.sketches  # ref
+
+        try:
+            return sketches[key]
+        except KeyError:
+            sketch = self.new_sketch()
+            sketches[key] = sketch
+            return sketch
+    # --- end of get_sketch (...) ---
+
+    def add_registers(self, keys, registers):
+        get_sketch = self.get_sketch
+        for key, (register, rank) in zip(keys, registers):
+            get_sketch(key).add_register(register, rank)
+    # --- end of add_registers (...) ---
+
+    def add(self, entry):
+        self.get_sketch(
+            tuple(key.get_entry_value(entry) for key in self.group_keys)
+        ).add(self.attr_getter(entry))
+    # --- end of add (...) ---
+
+    def add_many(self, entries):
+        try:
+            get_attr_values = entries.get_attr_values
+        except AttributeError:
+            # not columnar
+            super().add_many(entries)
+            return
+        # --
+
+        # hashes each distinct value once
+        self.add_registers(
+            get_group_values(entries, self.group_keys),
+            get_attr_values(self.attr_name, self.get_register)
+        )
+    # --- end of add_many (...) ---
+
+    def supports_rollup(self, filter_funcv):
+        return ffs.fon.query.rollup.can_use_rollup(
+            self.group_keys, (), filter_funcv
+        )
+    # --- end of supports_rollup (...) ---
+
+    def add_rollup_cells(self, cells):
+        keys = get_group_values(cells, self.group_keys)
+
+        if self.distinct_key == "them":
+            get_sketch = self.get_sketch
+            them_sketches = cells.columns.them_sketches
+
+            for key, row in zip(keys, cells.row_ids):
+                get_sketch(key).merge(them_sketches[row])
+
+        else:
+            # me.* is a cell dimension
+            self.add_registers(
+                keys, cells.get_attr_values(self.attr_name, self.get_register)
+            )
+    # --- end of add_rollup_cells (...) ---
+
+    def finish(self, num_prev_matched):
+        sketches = self.sketches
+        if not sketches and not self.group_keys:
+            sketches = {(): self.new_sketch()}
+
+        lines = [
+            "\t".join(
+                [key.name for key in self.group_keys]
+                + ["distinct_{}".format(self.distinct_key)]
+            )
+        ]
+
+        lines.extend(
+            sorted(
+                "\t".join(
+                    [("-" if value is None else str(value)) for value in key]
+                    + [str(sketch.estimate())]
+                )
+                for key, sketch in sketches.items()
+            )
+        )
+
+        self.write_lines(lines)
+    # --- end of finish (...) ---
+
+# --- end of ApproxDistinctSink ---
+
+
+class HistogramSink(OutputSink):
+    """
+    Counts entries and sums up their call duration per time bucket,
+    see ffs.fon.query.histogram.
+
+    For columnar stats, empty buckets cover the whole history
+    (all entries), otherwise the range of the matched entries.
+    Writes a tab-separated table with a header line and a total line.
+    """
+
+    def __init__(self, *, bucket="day", **kwargs):
+        super().__init__(**kwargs)
+        self.histogram = ffs.fon.query.histogram.DatumHistogram(bucket)
+        self.history_range = None
+    # --- end of __init__ (...) ---
+
+    def add(self, entry):
+        self.histogram.add(
+            ffs.fon.stats.columns.datum_to_timestamp(entry.datum),
+            entry.dauer.dauer
+        )
+    # --- end of add (...) ---
+
+    def add_many(self, entries):
+        try:
+            get_column = entries.get_column
+        except AttributeError:
+            # not columnar
+            super().add_many(entries)
+            return
+        # --
+
+        self.histogram.add_many(get_column("datum"), get_column("dauer"))
+
+        datum_values = entries.columns.get_datum_index()[0]
+        if datum_values:
+            self.history_range = (datum_values[0], datum_values[-1])
+    # --- end of add_many (...) ---
+
+    def finish(self, num_prev_matched):
+        histogram = self.histogram  # ref
+        buckets = histogram.get_buckets(self.history_range)
+
+        lines = ["\t".join((histogram.bucket, "count", "duration"))]
+        lines.extend(
+            "{0}\t{1:d}\t{2:d}".format(*bucket) for bucket in buckets
+        )
+        lines.append(
+            "total\t{0:d}\t{1:d}".format(
+                histogram.num_values, histogram.total
+            )
+        )
+
+        self.write_lines(lines)
+    # --- end of finish (...) ---
+
+# --- end of HistogramSink ---
+
+
+OUTPUT_SINKS = {
+    "print":        PrintSink,
+    "count":        CountSink,
+    "ratio":        RatioSink,
+    "list_me":      ListMeSink,
+    "list_them":    ListThemSink,
+    "list_dev":     ListDevSink,
+    "aggregate":    AggregateSink,
+    "histogram":    HistogramSink,
+    "top":          TopSink,
+    "approx_distinct":  ApproxDistinctSink,
+}
+
+
+def create_output_sink(output_mode, **kwargs):
+    return OUTPUT_SINKS[output_mode](**kwargs)
+# --- end of create_output_sink (...) ---
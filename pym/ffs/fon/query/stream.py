@@ -0,0 +1,63 @@
+# fritz-fon-stats -- streaming filter evaluation
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2019 André Erdmann <dywi@mailerd.de>
+#
+# Distributed under the terms of the MIT license.
+# (See LICENSE.MIT or http://opensource.org/licenses/MIT)
+#
+
+__all__ = ["FilterChainStream"]
+
+
+class FilterChainStream(object):
+    """
+    Applies a sequence of filters to a stream of entries,
+    like AVMPhoneStats.filter_chain(), without keeping any entries.
+
+    Matched entries are passed through, entries matched by all but
+    the final filter are counted (num_prev_matched) once the stream
+    has been consumed.
+    """
+
+    def __init__(self, filter_funcv, invert=False):
+        super().__init__()
+        self.filter_funcv = list(filter_funcv)
+        self.invert = invert
+        self.num_prev_matched = 0
+    # --- end of __init__ (...) ---
+
+    def filter(self, entries):
+        filter_funcv = self.filter_funcv
+        num_stages = len(filter_funcv)
+        num_prev_matched = 0
+
+        if not num_stages:
+            for entry in entries:
+                num_prev_matched += 1
+                yield entry
+
+        else:
+            prev_stage = num_stages - 1
+            final_stage = (prev_stage if self.invert else num_stages)
+
+            for entry in entries:
+                stage = 0
+                for filter_func in filter_funcv:
+                    if not filter_func(entry):
+                        break
+                    stage += 1
+                # --
+
+                if stage >= prev_stage:
+                    num_prev_matched += 1
+                    if stage == final_stage:
+                        yield entry
+                # --
+            # --
+        # --
+
+        self.num_prev_matched = num_prev_matched
+    # --- end of filter (...) ---
+
+# --- end of FilterChainStream ---
@@ -0,0 +1,399 @@
+# fritz-fon-stats -- memory-mapped fonlist archive
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2019 André Erdmann <dywi@mailerd.de>
+#
+# Distributed under the terms of the MIT license.
+# (See LICENSE.MIT or http://opensource.org/licenses/MIT)
+#
+#  An archive is a directory containing
+#
+#    header         magic, archive version, byte order, number of rows,
+#                   high-water mark (newest datum)
+#    tables         string table and me/them object tables,
+#                   see ffs.fon.stats.storage.encode_tables()
+#    <name>.col     one fixed-width record file per numeric column,
+#                   raw native-endian values (see COLUMN_NAMES)
+#    rollup         calls per day, me and call type (optional),
+#                   see ffs.fon.stats.rollup
+#
+#  Column files are opened via mmap and used without deserializing,
+#  so only the pages that are actually accessed get read, and
+#  concurrent readers share the page cache.
+#
+#  Rows are sorted by datum (oldest first). New rows are appended
+#  to the column files, see ingest().
+#
+#  The header is always written last. Column files may contain
+#  more records than the header says (e.g. after an interrupted write),
+#  these are ignored.
+#
+#  The rollup file records the number of rows it covers. It is ignored
+#  if that does not match the header, and rebuilt on the next append().
+#
+
+__all__ = ["AVMPhoneStatsArchive"]
+
+import array
+import collections
+import io
+import mmap
+import os
+import struct
+
+import ffs.fon.exc.storage
+
+import ffs.fon.stats.columns
+from ffs.fon.stats.columns import timestamp_to_datum
+import ffs.fon.stats.rollup
+import ffs.fon.stats.storage
+from ffs.fon.stats.storage import COLUMN_NAMES, BYTE_ORDER_FLAG
+
+
+class AVMPhoneStatsArchive(object):
+
+    # bump this whenever the layout changes
+    ARCHIVE_VERSION = 3
+    ARCHIVE_MAGIC = b'FFSARCH\0'
+
+    HEADER = struct.Struct("=8sIB3xQq")
+
+    HEADER_FILE = "header"
+    TABLES_FILE = "tables"
+    ROLLUP_FILE = "rollup"
+    COLUMN_FILE_SUFFIX = ".col"
+
+    def __init__(self, path, use_rollup=True):
+        super().__init__()
+        self.path = path
+        # whether to maintain the rollup file when writing
+        self.use_rollup = use_rollup
+    # --- end of __init__ (...) ---
+
+    def get_file(self, name):
+        return os.path.join(self.path, name)
+
+    def get_column_file(self, name):
+        return self.get_file(name + self.COLUMN_FILE_SUFFIX)
+
+    def exists(self):
+        return os.path.isfile(self.get_file(self.HEADER_FILE))
+
+    def _replace_file(self, name, write_func):
+        tmp_file = self.get_file(".tmp.{0}.{1:d}".format(name, os.getpid()))
+        fd = os.open(tmp_file, (os.O_WRONLY | os.O_CREAT | os.O_TRUNC), 0o666)
+        try:
+            with io.open(fd, "wb") as fh:
+                write_func(fh)
+                fh.flush()
+                os.fsync(fh.fileno())
+
+            os.replace(tmp_file, self.get_file(name))
+        except:
+            os.unlink(tmp_file)
+            raise
+    # --- end of _replace_file (...) ---
+
+    def read_header(self):
+        """
+        @return: 2-tuple (number of rows, high-water mark timestamp)
+        """
+        with io.open(self.get_file(self.HEADER_FILE), "rb") as fh:
+            data = fh.read(self.HEADER.size)
+
+        try:
+            magic, version, byte_order, num_rows, high_water_mark = (
+                self.HEADER.unpack(data)
+            )
+        except struct.error:
+            raise ffs.fon.exc.storage.StatsStorageFormatError(
+                self.path, "truncated header"
+            ) from None
+
+        if magic != self.ARCHIVE_MAGIC:
+            raise ffs.fon.exc.storage.StatsStorageFormatError(
+                self.path, "bad magic"
+            )
+        elif version != self.ARCHIVE_VERSION:
+            raise ffs.fon.exc.storage.StatsStorageFormatError(
+                self.path, "unsupported version", version
+            )
+        elif byte_order != BYTE_ORDER_FLAG:
+            raise ffs.fon.exc.storage.StatsStorageFormatError(
+                self.path, "unsupported byte order"
+            )
+        # --
+
+        return (num_rows, high_water_mark)
+    # --- end of read_header (...) ---
+
+    def write_header(self, num_rows, high_water_mark):
+        self._replace_file(
+            self.HEADER_FILE,
+            lambda fh: fh.write(
+                self.HEADER.pack(
+                    self.ARCHIVE_MAGIC, self.ARCHIVE_VERSION,
+                    BYTE_ORDER_FLAG, num_rows, high_water_mark
+                )
+            )
+        )
+    # --- end of write_header (...) ---
+
+    def write_tables(self, columns):
+        def write_tables_data(fh):
+            for data in ffs.fon.stats.storage.encode_tables(columns):
+                ffs.fon.stats.storage.write_section(fh, data)
+        # ---
+
+        self._replace_file(self.TABLES_FILE, write_tables_data)
+    # --- end of write_tables (...) ---
+
+    def read_tables(self, columns):
+        with io.open(self.get_file(self.TABLES_FILE), "rb") as fh:
+            data = fh.read()
+
+        sections = list(ffs.fon.stats.storage.iter_sections(data))
+        if len(sections) != 4:
+            raise ffs.fon.exc.storage.StatsStorageFormatError(
+                self.path, "bad tables file"
+            )
+
+        ffs.fon.stats.storage.decode_tables(columns, *sections)
+    # --- end of read_tables (...) ---
+
+    def read_rollup(self, num_rows):
+        """
+        @param num_rows:  number of rows in the archive
+
+        @return: AVMPhoneStatsRollup object, or None if there is
+                 no (compatible) rollup file or if it does not cover
+                 num_rows rows
+        """
+        try:
+            with io.open(self.get_file(self.ROLLUP_FILE), "rb") as fh:
+                data = fh.read()
+        except FileNotFoundError:
+            return None
+
+        rollup = ffs.fon.stats.rollup.AVMPhoneStatsRollup.load(
+            data, self.path
+        )
+        if rollup is None or rollup.num_rows != num_rows:
+            return None
+        return rollup
+    # --- end of read_rollup (...) ---
+
+    def write_rollup(self, rollup):
+        self._replace_file(self.ROLLUP_FILE, rollup.dump)
+    # --- end of write_rollup (...) ---
+
+    def map_column(self, name, typecode, num_rows):
+        itemsize = array.array(typecode).itemsize
+
+        if not num_rows:
+            return array.array(typecode)
+
+        with io.open(self.get_column_file(name), "rb") as fh:
+            mapped = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(mapped) < (num_rows * itemsize):
+            raise ffs.fon.exc.storage.StatsStorageFormatError(
+                self.path, "column file too short", name
+            )
+
+        return memoryview(mapped)[:(num_rows * itemsize)].cast(typecode)
+    # --- end of map_column (...) ---
+
+    def map_columns(self, columns, num_rows):
+        """
+        Sets columns' column arrays to read-only memory maps
+        of the first num_rows records of the column files.
+        """
+        for name in COLUMN_NAMES:
+            setattr(
+                columns, name,
+                self.map_column(
+                    name, columns.COLUMN_TYPECODES[name], num_rows
+                )
+            )
+        # --
+
+        # rows are stored in datum order
+        columns.datum_index = (columns.datum, range(num_rows))
+    # --- end of map_columns (...) ---
+
+    def open(self):
+        """
+        Opens the archive and returns an AVMPhoneStatsColumns object
+        whose columns are read-only memory maps of the column files.
+        """
+        num_rows, _ = self.read_header()
+
+        columns = ffs.fon.stats.columns.AVMPhoneStatsColumns()
+        self.read_tables(columns)
+        self.map_columns(columns, num_rows)
+
+        columns.rollup = self.read_rollup(num_rows)
+
+        # not calling check_codes() here, it would read all pages
+        return columns
+    # --- end of open (...) ---
+
+    def _get_high_water_mark(self, columns, default=0):
+        return (max(columns.datum) if len(columns) else default)
+    # --- end of _get_high_water_mark (...) ---
+
+    def write(self, columns):
+        """
+        Creates the archive, replacing all existing data.
+        """
+        columns = columns.take(columns.get_datum_order())
+
+        os.makedirs(self.path, exist_ok=True)
+
+        for name in COLUMN_NAMES:
+            column_data = memoryview(getattr(columns, name)).cast('B')
+            self._replace_file(
+                name + self.COLUMN_FILE_SUFFIX,
+                lambda fh: fh.write(column_data)
+            )
+        # --
+
+        self.write_tables(columns)
+
+        if self.use_rollup:
+            rollup = ffs.fon.stats.rollup.AVMPhoneStatsRollup()
+            rollup.add_rows(columns)
+            self.write_rollup(rollup)
+        # --
+
+        self.write_header(len(columns), self._get_high_water_mark(columns))
+    # --- end of write (...) ---
+
+    def append(self, columns):
+        """
+        Appends rows to the archive without rewriting the existing rows.
+        All rows must be at least as new as the archive's high-water mark.
+        """
+        num_rows, high_water_mark = self.read_header()
+
+        if not len(columns):
+            return
+
+        columns = columns.take(columns.get_datum_order())
+        if num_rows and columns.datum[0] < high_water_mark:
+            raise ValueError("rows older than the high-water mark")
+
+        # remap me/them codes to the archive's tables
+        stored = ffs.fon.stats.columns.AVMPhoneStatsColumns()
+        self.read_tables(stored)
+
+        me_map, them_map = columns.get_code_maps(
+            stored.me_table, stored.them_table
+        )
+        columns.me = array.array('I', map(me_map.__getitem__, columns.me))
+        columns.them = array.array('I', map(them_map.__getitem__, columns.them))
+        # the codes refer to the archive's tables now,
+        #  which matters for the rollup (me codes, them.nr sketches)
+        columns.me_table = stored.me_table
+        columns.them_table = stored.them_table
+
+        for name in COLUMN_NAMES:
+            column = getattr(columns, name)
+
+            with io.open(self.get_column_file(name), "r+b") as fh:
+                # drop leftovers of interrupted writes
+                fh.truncate(num_rows * column.itemsize)
+                fh.seek(0, io.SEEK_END)
+                fh.write(memoryview(column).cast('B'))
+                fh.flush()
+                os.fsync(fh.fileno())
+            # --
+        # --
+
+        self.write_tables(stored)
+
+        if self.use_rollup:
+            rollup = self.read_rollup(num_rows)
+            if rollup is None:
+                # roll up the stored rows, too
+                self.map_columns(stored, (num_rows + len(columns)))
+                rollup = ffs.fon.stats.rollup.AVMPhoneStatsRollup()
+                rollup.add_rows(stored)
+            else:
+                rollup.add_rows(columns)
+
+            self.write_rollup(rollup)
+        # --
+
+        self.write_header(
+            num_rows + len(columns),
+            self._get_high_water_mark(columns, high_water_mark)
+        )
+    # --- end of append (...) ---
+
+    def get_high_water_mark(self):
+        """
+        @return: datum of the newest row, or None if the archive is empty
+        """
+        num_rows, high_water_mark = self.read_header()
+        return (timestamp_to_datum(high_water_mark) if num_rows else None)
+    # --- end of get_high_water_mark (...) ---
+
+    def ingest(self, entries):
+        """
+        Merges entries into the archive, creating it if necessary.
+
+        Only entries at least as new as the high-water mark are considered.
+        Entries at the high-water mark that are already stored
+        (same AVMPhoneStatsEntry identity) are dropped.
+
+        Rows older than the high-water mark are not touched,
+        so the cost depends on the number of new entries only.
+        Use read_csv_file(..., min_datum=get_high_water_mark())
+        to skip parsing old csv rows.
+
+        @return: number of new rows
+        """
+        new_columns = ffs.fon.stats.columns.AVMPhoneStatsColumns()
+
+        if not self.exists():
+            new_columns.update(entries)
+            self.write(new_columns)
+            return len(new_columns)
+        # --
+
+        num_rows, high_water_mark = self.read_header()
+        stored = self.open()
+
+        # stored rows at the high-water mark are at the end of the archive
+        row = num_rows
+        while row > 0 and stored.datum[row - 1] == high_water_mark:
+            row -= 1
+
+        known = collections.Counter(stored.get_rows(range(row, num_rows)))
+        min_datum = self.get_high_water_mark()
+
+        def gen_new_entries():
+            for entry in entries:
+                if min_datum is None:
+                    yield entry
+
+                elif entry.datum > min_datum:
+                    yield entry
+
+                elif entry.datum == min_datum:
+                    if known[entry]:
+                        known[entry] -= 1
+                    else:
+                        yield entry
+                # --
+            # --
+        # --- end of gen_new_entries (...) ---
+
+        new_columns.update(gen_new_entries())
+        self.append(new_columns)
+        return len(new_columns)
+    # --- end of ingest (...) ---
+
+# --- end of AVMPhoneStatsArchive ---
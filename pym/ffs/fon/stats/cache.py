@@ -0,0 +1,126 @@
+# fritz-fon-stats -- persistent cache of parsed csv files
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2019 André Erdmann <dywi@mailerd.de>
+#
+# Distributed under the terms of the MIT license.
+# (See LICENSE.MIT or http://opensource.org/licenses/MIT)
+#
+
+__all__ = ["AVMPhoneStatsCache"]
+
+import hashlib
+import io
+import os
+import tempfile
+
+import ffs.util.cachedir
+
+import ffs.fon.exc.storage
+import ffs.fon.stats.storage
+
+
+class AVMPhoneStatsCache(object):
+    """
+    Stores parsed csv files in the binary columnar format,
+    one cache file per csv file (path).
+
+    A cache file is valid if the csv file's
+    path, size, mtime and sha256 digest and the source (box) name
+    still match, and if it has been written with the current
+    storage format version.
+    """
+
+    CACHE_FILE_SUFFIX = ".ffsc"
+    READ_BLOCK_SIZE = 2**20
+
+    def __init__(self, cache_dir=None):
+        super().__init__()
+        self.cache_dir = (
+            ffs.util.cachedir.get_user_cache_dir("csv")
+            if cache_dir is None else cache_dir
+        )
+    # --- end of __init__ (...) ---
+
+    def get_cache_file(self, csv_file):
+        path_digest = hashlib.sha256(
+            os.path.realpath(csv_file).encode("utf-8", "surrogateescape")
+        ).hexdigest()
+
+        return os.path.join(
+            self.cache_dir, path_digest[:32] + self.CACHE_FILE_SUFFIX
+        )
+    # --- end of get_cache_file (...) ---
+
+    def get_fingerprint(self, csv_file, source=""):
+        """
+        Returns the fingerprint of a csv file (and its source name)
+        as bytes.
+
+        Note that this reads the entire file in order to compute its digest.
+        """
+        content_digest = hashlib.sha256()
+
+        with io.open(csv_file, "rb") as fh:
+            stat_info = os.fstat(fh.fileno())
+
+            block = fh.read(self.READ_BLOCK_SIZE)
+            while block:
+                content_digest.update(block)
+                block = fh.read(self.READ_BLOCK_SIZE)
+        # --
+
+        return "\0".join((
+            os.path.realpath(csv_file),
+            str(stat_info.st_size),
+            str(stat_info.st_mtime_ns),
+            content_digest.hexdigest(),
+            source,
+        )).encode("utf-8", "surrogateescape")
+    # --- end of get_fingerprint (...) ---
+
+    def load(self, csv_file, fingerprint):
+        """
+        Returns cached stats for the given csv file,
+        or None if there is no valid cache file.
+        """
+        try:
+            with io.open(self.get_cache_file(csv_file), "rb") as fh:
+                data = fh.read()
+        except OSError:
+            return None
+
+        try:
+            columns, meta = ffs.fon.stats.storage.load_columns(data)
+        except ffs.fon.exc.storage.StatsStorageError:
+            return None
+
+        return (columns if meta == fingerprint else None)
+    # --- end of load (...) ---
+
+    def store(self, csv_file, fingerprint, columns):
+        """
+        Writes stats for the given csv file to the cache.
+        The cache file gets replaced atomically.
+
+        Errors are not handled here, callers may want to ignore OSError.
+        """
+        cache_file = self.get_cache_file(csv_file)
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        fd, tmp_file = tempfile.mkstemp(
+            prefix=".tmp.", suffix=self.CACHE_FILE_SUFFIX, dir=self.cache_dir
+        )
+        try:
+            with io.open(fd, "wb") as fh:
+                ffs.fon.stats.storage.dump_columns(
+                    columns, fh, meta=fingerprint
+                )
+
+            os.replace(tmp_file, cache_file)
+        except:
+            os.unlink(tmp_file)
+            raise
+    # --- end of store (...) ---
+
+# --- end of AVMPhoneStatsCache ---
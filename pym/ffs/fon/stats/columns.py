@@ -0,0 +1,1020 @@
+# fritz-fon-stats -- columnar fonlist stats
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2019 André Erdmann <dywi@mailerd.de>
+#
+# Distributed under the terms of the MIT license.
+# (See LICENSE.MIT or http://opensource.org/licenses/MIT)
+#
+
+__all__ = ["AVMPhoneStatsColumns", "AVMPhoneStatsRows"]
+
+import array
+import bisect
+import datetime
+import fractions
+import heapq
+import itertools
+import operator
+import sys
+
+import ffs.util.intern
+import ffs.util.mask
+
+import ffs.fon.stats.entry
+from ffs.fon.stats.entry import (
+    CallType, GespraechsDauer, AVMPhoneStatsEntry
+)
+
+
+EPOCH = datetime.datetime(1970, 1, 1)
+ONE_SECOND = datetime.timedelta(seconds=1)
+ONE_MICROSECOND = datetime.timedelta(microseconds=1)
+
+# comparison functions that may be applied to encoded (int) column values
+#  instead of the decoded values
+ORDER_PRESERVING_CMP_FUNCS = frozenset({
+    operator.__eq__, operator.__ne__,
+    operator.__lt__, operator.__le__,
+    operator.__gt__, operator.__ge__,
+})
+
+# lookup table value for attribute errors (see build_lut())
+LUT_ATTR_ERROR = 2
+
+BIG_ENDIAN = (sys.byteorder == "big")
+
+ENTRY_RECORD_GETTER = operator.attrgetter(
+    "me", "them", "dauer", "datum", "call_type"
+)
+
+
+def datum_to_timestamp(datum):
+    return (datum - EPOCH) // ONE_SECOND
+# --- end of datum_to_timestamp (...) ---
+
+
+def timestamp_to_datum(timestamp):
+    return EPOCH + datetime.timedelta(seconds=timestamp)
+# --- end of timestamp_to_datum (...) ---
+
+
+def datum_to_timestamp_exact(datum):
+    if datum.microsecond:
+        return fractions.Fraction((datum - EPOCH) // ONE_MICROSECOND, 10**6)
+    else:
+        return datum_to_timestamp(datum)
+# --- end of datum_to_timestamp_exact (...) ---
+
+
+def build_lut(objects, value_getter, check, weak):
+    # creates a lookup table (bytes) with one check result per object,
+    #  check() is called at most once per distinct attribute value
+    results = {}
+    lut = bytearray()
+
+    for obj in objects:
+        try:
+            value = (obj if value_getter is None else value_getter(obj))
+        except AttributeError:
+            lut.append(0 if weak else LUT_ATTR_ERROR)
+        else:
+            try:
+                res = results[value]
+            except KeyError:
+                res = (1 if check(value) else 0)
+                results[value] = res
+            # --
+            lut.append(res)
+        # --
+    # --
+
+    return bytes(lut)
+# --- end of build_lut (...) ---
+
+
+def lut_lookup(lut, codes):
+    # returns bytes(lut[code] for code in codes)
+    if len(lut) <= 256:
+        # all codes fit into their least significant byte,
+        #  translate the raw array and pick every n-th byte
+        itemsize = codes.itemsize
+        translated = bytes(codes).translate(lut.ljust(256, b'\x00'))
+
+        if BIG_ENDIAN:
+            return translated[(itemsize - 1)::itemsize]
+        else:
+            return translated[::itemsize]
+    else:
+        return bytes(map(lut.__getitem__, codes))
+# --- end of lut_lookup (...) ---
+
+
+def get_caller_key(caller):
+    return (caller.__class__, caller.nr, getattr(caller, "name", None))
+# --- end of get_caller_key (...) ---
+
+
+def get_nebenstelle_key(nebenstelle):
+    return (
+        nebenstelle.__class__, nebenstelle.nr,
+        nebenstelle.desc, nebenstelle.nebenstelle, nebenstelle.source
+    )
+# --- end of get_nebenstelle_key (...) ---
+
+
+class AVMPhoneStatsColumns(object):
+    """
+    Columnar alternative to AVMPhoneStats.
+
+    Each call is stored as one row spread over typed arrays:
+
+      datum       int64   seconds since 1970-01-01 (naive, as in the csv)
+      dauer       int32   GespraechsDauer.dauer
+      call_type   uint8   CallType value
+      me          uint32  code into me_table   (AVMNebenstelle objects)
+      them        uint32  code into them_table (AVMCaller objects)
+
+    AVMPhoneStatsEntry objects are created on demand only, see get_entry().
+
+    Columns may also be read-only memoryviews with the same item type,
+    e.g. when opened from an archive (ffs.fon.stats.archive).
+    """
+
+    TYPECODE_DATUM      = 'q'
+    TYPECODE_DAUER      = 'i'
+    TYPECODE_CALL_TYPE  = 'B'
+    TYPECODE_CODE       = 'I'
+    TYPECODE_ROW        = 'I'
+
+    # attributes that may be looked up via get_attr_index_rows(),
+    #  attr name -> code column
+    INDEXED_ATTRS = {
+        "me.nr":            "me",
+        "me.nebenstelle":   "me",
+        "me.source":        "me",
+        "them.nr":          "them",
+    }
+
+    COLUMN_TYPECODES = {
+        "datum":        TYPECODE_DATUM,
+        "dauer":        TYPECODE_DAUER,
+        "call_type":    TYPECODE_CALL_TYPE,
+        "me":           TYPECODE_CODE,
+        "them":         TYPECODE_CODE,
+    }
+
+    def __init__(self):
+        super().__init__()
+        self.datum = array.array(self.TYPECODE_DATUM)
+        self.dauer = array.array(self.TYPECODE_DAUER)
+        self.call_type = array.array(self.TYPECODE_CALL_TYPE)
+        self.me = array.array(self.TYPECODE_CODE)
+        self.them = array.array(self.TYPECODE_CODE)
+
+        self.me_table = ffs.util.intern.InternTable()
+        self.them_table = ffs.util.intern.InternTable()
+
+        self.dauer_cache = {}
+        self.call_type_map = {int(v): v for v in CallType}
+
+        # optional AVMPhoneStatsRollup (ffs.fon.stats.rollup)
+        #  that gets updated whenever rows are added
+        self.rollup = None
+
+        self.reset_indexes()
+    # --- end of __init__ (...) ---
+
+    def reset_indexes(self):
+        # (datum values in ascending order, corresponding row ids),
+        #  see get_datum_index()
+        self.datum_index = None
+
+        # attr name -> {attr value -> [code, ...]},
+        #  see get_attr_index_rows()
+        self.attr_codes = {}
+
+        # (column name, code) -> ascending row ids
+        self.code_rows = {}
+    # --- end of reset_indexes (...) ---
+
+    def __len__(self):
+        return len(self.datum)
+
+    def make_writable(self):
+        # columns may be read-only buffers (e.g. memoryviews of an archive),
+        #  copy them to arrays before appending rows
+        for name, typecode in self.COLUMN_TYPECODES.items():
+            column = getattr(self, name)
+            if not isinstance(column, array.array):
+                writable_column = array.array(typecode)
+                writable_column.frombytes(column)
+                setattr(self, name, writable_column)
+            # --
+        # --
+    # --- end of make_writable (...) ---
+
+    def add_entry(self, entry):
+        self.update((entry,))
+    # --- end of add_entry (...) ---
+
+    def update(self, reader_data):
+        self.update_records(map(ENTRY_RECORD_GETTER, reader_data))
+    # --- end of update (...) ---
+
+    def update_records(self, records):
+        """
+        Adds rows from (me, them, dauer, datum, call_type) records,
+        see AVMPhoneStatsReader.gen_parse_csv_rows().
+        """
+        self.make_writable()
+        self.reset_indexes()
+
+        add_datum = self.datum.append
+        add_dauer = self.dauer.append
+        add_call_type = self.call_type.append
+        add_me = self.me.append
+        add_them = self.them.append
+        intern_me = self.me_table.intern
+        intern_them = self.them_table.intern
+
+        # the reader shares me/them objects between entries,
+        #  remember their codes by id() (keeping a ref to the object)
+        me_codes = {}
+        them_codes = {}
+        last_datum = None
+        last_timestamp = None
+
+        for me, them, dauer, datum, call_type in records:
+            if datum is not last_datum:
+                last_datum = datum
+                last_timestamp = datum_to_timestamp(datum)
+            add_datum(last_timestamp)
+
+            add_dauer(dauer.dauer)
+            add_call_type(call_type)
+
+            try:
+                add_me(me_codes[id(me)][1])
+            except KeyError:
+                code = intern_me(get_nebenstelle_key(me), me)
+                me_codes[id(me)] = (me, code)
+                add_me(code)
+
+            try:
+                add_them(them_codes[id(them)][1])
+            except KeyError:
+                code = intern_them(get_caller_key(them), them)
+                them_codes[id(them)] = (them, code)
+                add_them(code)
+        # --
+
+        self.update_rollup()
+    # --- end of update_records (...) ---
+
+    def get_code_maps(self, me_table, them_table):
+        """
+        Interns the me/them objects of this object into other code tables.
+
+        @return: 2-tuple of arrays (me code map, them code map)
+                 that map codes of this object to codes of the given tables
+        """
+        return (
+            array.array(
+                self.TYPECODE_CODE, (
+                    me_table.intern(get_nebenstelle_key(obj), obj)
+                    for obj in self.me_table
+                )
+            ),
+            array.array(
+                self.TYPECODE_CODE, (
+                    them_table.intern(get_caller_key(obj), obj)
+                    for obj in self.them_table
+                )
+            )
+        )
+    # --- end of get_code_maps (...) ---
+
+    def extend(self, other):
+        """
+        Appends the rows of another AVMPhoneStatsColumns object.
+
+        me/them objects are unified by key, objects that are already
+        known are kept and other's equal objects are dropped.
+        """
+        self.make_writable()
+        self.reset_indexes()
+
+        me_map, them_map = other.get_code_maps(self.me_table, self.them_table)
+
+        self.datum.extend(other.datum)
+        self.dauer.extend(other.dauer)
+        self.call_type.extend(other.call_type)
+        self.me.extend(map(me_map.__getitem__, other.me))
+        self.them.extend(map(them_map.__getitem__, other.them))
+
+        self.update_rollup()
+    # --- end of extend (...) ---
+
+    def update_rollup(self):
+        if self.rollup is not None:
+            self.rollup.update(self)
+    # --- end of update_rollup (...) ---
+
+    def get_dauer(self, dauer):
+        dauer_cache = self.dauer_cache  # ref
+
+        try:
+            return dauer_cache[dauer]
+        except KeyError:
+            pass
+
+        obj = GespraechsDauer(dauer)
+        dauer_cache[dauer] = obj
+        return obj
+    # --- end of get_dauer (...) ---
+
+    def get_entry(self, row):
+        return AVMPhoneStatsEntry(
+            me=self.me_table[self.me[row]],
+            them=self.them_table[self.them[row]],
+            dauer=self.get_dauer(self.dauer[row]),
+            datum=timestamp_to_datum(self.datum[row]),
+            call_type=self.call_type_map[self.call_type[row]]
+        )
+    # --- end of get_entry (...) ---
+
+    def get_call_type_lut(self, value_getter, check, weak):
+        call_type_map = self.call_type_map  # ref
+        lut = bytearray(256)
+
+        for code, value in zip(
+            call_type_map,
+            build_lut(call_type_map.values(), value_getter, check, weak)
+        ):
+            lut[code] = value
+
+        return bytes(lut)
+    # --- end of get_call_type_lut (...) ---
+
+    def take(self, rows):
+        """
+        Returns a new AVMPhoneStatsColumns object
+        that contains the given rows, in that order.
+        """
+        obj = self.__class__()
+        obj.me_table = self.me_table.copy()
+        obj.them_table = self.them_table.copy()
+
+        row_view = self.get_rows(rows)
+        for name, typecode in self.COLUMN_TYPECODES.items():
+            column = row_view.get_column(name)
+
+            # never share column arrays, copy views of the original column
+            if (
+                column is getattr(self, name)
+                or not isinstance(column, array.array)
+            ):
+                column_copy = array.array(typecode)
+                column_copy.frombytes(column)
+                column = column_copy
+            # --
+
+            setattr(obj, name, column)
+        # --
+
+        return obj
+    # --- end of take (...) ---
+
+    @classmethod
+    def merge_sorted(cls, parts):
+        """
+        Merges AVMPhoneStatsColumns objects into a new one,
+        ordered by datum, newest first (like csv exports).
+
+        Parts that are already in that order (csv exports) are merged
+        without sorting. Rows with the same datum keep their order,
+        and rows of earlier parts come first.
+        A single part is copied as-is.
+        """
+        merged = cls()
+        part_rows = []
+        offset = 0
+
+        for part in parts:
+            merged.extend(part)
+
+            datum = part.datum
+            num_rows = len(datum)
+            if all(
+                map(operator.__ge__, datum, itertools.islice(datum, 1, None))
+            ):
+                part_rows.append(range(offset, (offset + num_rows)))
+            else:
+                part_rows.append([
+                    (offset + row) for row in sorted(
+                        range(num_rows), key=datum.__getitem__, reverse=True
+                    )
+                ])
+            # --
+
+            offset += num_rows
+        # --
+
+        if len(part_rows) < 2:
+            return merged
+
+        return merged.take(
+            array.array(
+                cls.TYPECODE_ROW,
+                heapq.merge(
+                    *part_rows, key=merged.datum.__getitem__, reverse=True
+                )
+            )
+        )
+    # --- end of merge_sorted (...) ---
+
+    def get_datum_order(self):
+        """
+        Returns the row ids sorted by datum (stable).
+        """
+        return sorted(range(len(self)), key=self.datum.__getitem__)
+    # --- end of get_datum_order (...) ---
+
+    def get_datum_index(self):
+        """
+        Returns a 2-tuple (datum values in ascending order, row ids)
+        that can be searched with bisect.
+
+        Already sorted columns (archives) and reverse-sorted columns
+        (csv exports list the newest call first) are indexed without
+        sorting, and the row ids are a range object then.
+        """
+        if self.datum_index is not None:
+            return self.datum_index
+
+        datum = self.datum
+        num_rows = len(datum)
+
+        if all(map(operator.__le__, datum, itertools.islice(datum, 1, None))):
+            datum_index = (datum, range(num_rows))
+
+        elif all(
+            map(operator.__ge__, datum, itertools.islice(datum, 1, None))
+        ):
+            datum_index = (datum[::-1], range((num_rows - 1), -1, -1))
+
+        else:
+            rows = array.array(self.TYPECODE_ROW, self.get_datum_order())
+            datum_index = (
+                array.array(
+                    self.TYPECODE_DATUM, map(datum.__getitem__, rows)
+                ),
+                rows
+            )
+        # --
+
+        self.datum_index = datum_index
+        return datum_index
+    # --- end of get_datum_index (...) ---
+
+    def get_attr_codes(self, attr_name):
+        attr_codes = self.attr_codes  # ref
+
+        try:
+            return attr_codes[attr_name]
+        except KeyError:
+            pass
+
+        head, _, tail = attr_name.partition(".")
+        value_getter = operator.attrgetter(tail)
+
+        codes_map = {}
+        for code, obj in enumerate(getattr(self, head + "_table")):
+            codes_map.setdefault(value_getter(obj), []).append(code)
+
+        attr_codes[attr_name] = codes_map
+        return codes_map
+    # --- end of get_attr_codes (...) ---
+
+    def get_code_rows(self, name, codes):
+        """
+        @return: list with the ascending row ids of each code
+        """
+        code_rows = self.code_rows  # ref
+        missing = [code for code in codes if (name, code) not in code_rows]
+
+        if missing:
+            column = getattr(self, name)
+            row_range = range(len(column))
+
+            if len(missing) == 1:
+                code = missing[0]
+                code_rows[(name, code)] = array.array(
+                    self.TYPECODE_ROW,
+                    itertools.compress(row_range, map(code.__eq__, column))
+                )
+
+            else:
+                # one pass over the column for all missing codes
+                lut = bytearray(len(getattr(self, name + "_table")))
+                new_rows = {}
+                for code in missing:
+                    lut[code] = 1
+                    new_rows[code] = array.array(self.TYPECODE_ROW)
+                # --
+
+                for row in itertools.compress(
+                    row_range, lut_lookup(bytes(lut), column)
+                ):
+                    new_rows[column[row]].append(row)
+                # --
+
+                for code, rows in new_rows.items():
+                    code_rows[(name, code)] = rows
+            # --
+        # --
+
+        return [code_rows[(name, code)] for code in codes]
+    # --- end of get_code_rows (...) ---
+
+    def get_attr_index_rows(self, attr_name, values):
+        """
+        Looks up rows whose attribute is equal to any of the given values
+        via an inverted index (built lazily, for the requested codes only).
+
+        @return: ascending row ids (must not be modified),
+                 or None if the attribute is not indexed
+        """
+        try:
+            name = self.INDEXED_ATTRS[attr_name]
+        except KeyError:
+            return None
+
+        if not all(isinstance(value, str) for value in values):
+            return None
+
+        attr_codes = self.get_attr_codes(attr_name)
+        codes = sorted(
+            itertools.chain.from_iterable(
+                attr_codes.get(value, ()) for value in values
+            )
+        )
+        codes_rows = self.get_code_rows(name, codes)
+
+        if not codes_rows:
+            return array.array(self.TYPECODE_ROW)
+
+        elif len(codes_rows) == 1:
+            return codes_rows[0]
+
+        else:
+            # rows of distinct codes are disjoint
+            return array.array(
+                self.TYPECODE_ROW,
+                sorted(itertools.chain.from_iterable(codes_rows))
+            )
+        # --
+    # --- end of get_attr_index_rows (...) ---
+
+    def get_rows(self, rows=None):
+        return AVMPhoneStatsRows(self, rows)
+    # --- end of get_rows (...) ---
+
+    def get_entries(self):
+        return self.get_rows()
+
+    def filter(self, filter_func, entries=None):
+        if entries is None:
+            entries = self.get_rows()
+
+        return filter(filter_func, entries)
+    # ---
+
+    def narrow_datum_range(self, filter_func, entries):
+        """
+        Moves datum bounds at the top of filter_func's AND chain
+        to a datum index lookup.
+
+        @return: 2-tuple (entries, remaining filter func or None)
+        """
+        bounds, remaining = filter_func.split_datum_bounds()
+
+        if bounds:
+            narrowed = entries.select_datum_range(bounds)
+            if narrowed is not None:
+                return (narrowed, remaining)
+        # --
+
+        return (entries, filter_func)
+    # --- end of narrow_datum_range (...) ---
+
+    def filter_select(self, filter_func, entries=None, vectorized=True):
+        """
+        Like filter_split(), but returns the matched entries only,
+        which allows to skip rows via the datum index.
+        """
+        if entries is None:
+            entries = self.get_rows()
+        # --
+
+        if filter_func is None:
+            return entries
+
+        elif not vectorized:
+            return self.filter_split(filter_func, entries, vectorized=False)[0]
+        # --
+
+        entries, filter_func = self.narrow_datum_range(filter_func, entries)
+        if filter_func is None or not entries:
+            return entries
+
+        index_rows, filter_func = filter_func.split_index_rows(self)
+        if index_rows is not None:
+            entries = entries.select_rows(index_rows)
+            if filter_func is None or not entries:
+                return entries
+        # --
+
+        return self.get_rows(
+            array.array(
+                self.TYPECODE_ROW,
+                itertools.compress(
+                    entries.row_ids, filter_func.get_mask(entries)
+                )
+            )
+        )
+    # --- end of filter_select (...) ---
+
+    def filter_chain(self, filter_funcv, invert=False, entries=None):
+        """
+        Applies a sequence of filters, each one to the rows
+        matched by the previous filters, see AVMPhoneStats.filter_chain().
+
+        Filters are evaluated vectorized over the remaining rows only,
+        non-matching rows are collected for the inverted final filter only.
+
+        @return: 2-tuple (prev_matched, matched)
+        """
+        matched = (self.get_rows() if entries is None else entries)
+        prev_matched = matched
+        final_filter_idx = len(filter_funcv) - 1
+
+        for filter_idx, filter_func in enumerate(filter_funcv):
+            prev_matched = matched
+
+            if not prev_matched:
+                break
+
+            elif invert and filter_idx == final_filter_idx:
+                matched = self.filter_split(filter_func, prev_matched)[1]
+
+            else:
+                matched = self.filter_select(filter_func, prev_matched)
+        # --
+
+        return (prev_matched, matched)
+    # --- end of filter_chain (...) ---
+
+    def filter_split(self, filter_func, entries=None, vectorized=True):
+        if entries is None:
+            entries = self.get_rows()
+        # --
+
+        if filter_func is None:
+            return (entries, self.get_rows(()))
+
+        elif vectorized:
+            mask = filter_func.get_mask(entries)
+            row_ids = entries.row_ids
+            return (
+                self.get_rows(
+                    array.array(
+                        self.TYPECODE_ROW, itertools.compress(row_ids, mask)
+                    )
+                ),
+                self.get_rows(
+                    array.array(
+                        self.TYPECODE_ROW,
+                        itertools.compress(
+                            row_ids, ffs.util.mask.mask_not(mask)
+                        )
+                    )
+                )
+            )
+        # --
+
+        matched = array.array(self.TYPECODE_ROW)
+        not_matched = array.array(self.TYPECODE_ROW)
+        add_matched = matched.append
+        add_not_matched = not_matched.append
+        get_entry = self.get_entry
+
+        for row in entries.row_ids:
+            if filter_func(get_entry(row)):
+                add_matched(row)
+            else:
+                add_not_matched(row)
+            # --
+        # --
+
+        return (self.get_rows(matched), self.get_rows(not_matched))
+    # --- end of filter_split (...) ---
+
+# --- end of AVMPhoneStatsColumns ---
+
+
+class AVMPhoneStatsRows(object):
+    """
+    A read-only sequence of AVMPhoneStatsEntry objects
+    backed by a subset of rows from an AVMPhoneStatsColumns object.
+    """
+
+    __slots__ = ["columns", "row_ids", "column_cache"]
+
+    # decoders for columns that are not backed by a code table,
+    #  by attribute name
+    COLUMN_DECODERS = {
+        "datum": (lambda columns: timestamp_to_datum),
+        "dauer": (lambda columns: columns.get_dauer),
+    }
+
+    def __init__(self, columns, rows=None):
+        super().__init__()
+        self.columns = columns
+        self.row_ids = (range(len(columns)) if rows is None else rows)
+        self.column_cache = {}
+    # --- end of __init__ (...) ---
+
+    def get_column(self, name):
+        """Returns the values of a column for the rows of this view."""
+        column_cache = self.column_cache  # ref
+
+        try:
+            return column_cache[name]
+        except KeyError:
+            pass
+
+        column = getattr(self.columns, name)
+        row_ids = self.row_ids
+
+        if isinstance(row_ids, range) and row_ids.step == 1:
+            if row_ids.start == 0 and row_ids.stop == len(column):
+                values = column
+            else:
+                values = column[row_ids.start:row_ids.stop]
+        else:
+            values = array.array(
+                self.columns.COLUMN_TYPECODES[name],
+                map(column.__getitem__, row_ids)
+            )
+        # --
+
+        column_cache[name] = values
+        return values
+    # --- end of get_column (...) ---
+
+    def _check_lut_mask(self, attr_name, lut, mask):
+        if LUT_ATTR_ERROR in lut and LUT_ATTR_ERROR in mask:
+            raise AttributeError(attr_name)
+        return mask
+    # --- end of _check_lut_mask (...) ---
+
+    def get_attr_values(self, attr_name, convert=None):
+        """
+        Returns an iterable of convert(<attr value>) for all rows.
+
+        Like get_attr_mask(), values are computed once per code table
+        entry or distinct column value and not once per row.
+        """
+        columns = self.columns
+        head, _, tail = attr_name.partition(".")
+        value_getter = (operator.attrgetter(tail) if tail else None)
+
+        def get_value(obj):
+            value = (obj if value_getter is None else value_getter(obj))
+            return (value if convert is None else convert(value))
+        # ---
+
+        if head in {"me", "them"}:
+            lut = [get_value(obj) for obj in getattr(columns, head + "_table")]
+            return map(lut.__getitem__, self.get_column(head))
+
+        elif head == "call_type":
+            lut = {
+                code: get_value(call_type)
+                for code, call_type in columns.call_type_map.items()
+            }
+            return map(lut.__getitem__, self.get_column(head))
+
+        elif head in self.COLUMN_DECODERS:
+            column = self.get_column(head)
+            decode = self.COLUMN_DECODERS[head](columns)
+            lut = {value: get_value(decode(value)) for value in set(column)}
+            return map(lut.__getitem__, column)
+
+        else:
+            attr_getter = operator.attrgetter(attr_name)
+            return (
+                map(attr_getter, self) if convert is None
+                else map(convert, map(attr_getter, self))
+            )
+    # --- end of get_attr_values (...) ---
+
+    def get_entry_mask(self, func):
+        """Evaluates func once per entry, the slow path."""
+        return bytes(map(bool, map(func, self)))
+    # --- end of get_entry_mask (...) ---
+
+    def get_attr_mask(self, attr_name, check, weak=False):
+        """
+        Evaluates check(<attr value>) for all rows.
+
+        For code table columns, check() gets called once per distinct
+        attribute value in the table and not once per row.
+        Same for other columns, but only distinct values from
+        the rows of this view are checked.
+        """
+        columns = self.columns
+        head, _, tail = attr_name.partition(".")
+        value_getter = (operator.attrgetter(tail) if tail else None)
+
+        if head in {"me", "them"}:
+            lut = build_lut(
+                getattr(columns, head + "_table"), value_getter, check, weak
+            )
+            mask = lut_lookup(lut, self.get_column(head))
+
+        elif head == "call_type":
+            lut = columns.get_call_type_lut(value_getter, check, weak)
+            mask = lut_lookup(lut, self.get_column(head))
+
+        elif head in self.COLUMN_DECODERS:
+            column = self.get_column(head)
+            distinct_values = list(set(column))
+            lut = build_lut(
+                map(self.COLUMN_DECODERS[head](columns), distinct_values),
+                value_getter, check, weak
+            )
+            lut_map = dict(zip(distinct_values, lut))
+            mask = bytes(map(lut_map.__getitem__, column))
+
+        else:
+            getter = operator.attrgetter(attr_name)
+
+            def entry_check(entry):
+                try:
+                    value = getter(entry)
+                except AttributeError:
+                    if weak:
+                        return False
+                    raise
+                else:
+                    return check(value)
+            # --- end of entry_check (...) ---
+
+            return self.get_entry_mask(entry_check)
+        # --
+
+        return self._check_lut_mask(attr_name, lut, mask)
+    # --- end of get_attr_mask (...) ---
+
+    def get_attr_cmp_mask(self, attr_name, cmp_func, expected_value, weak=False):
+        """
+        Evaluates cmp_func(<attr value>, expected_value) for all rows.
+
+        Comparisons against datum and dauer.dauer are done
+        on the encoded column values directly.
+        """
+        if cmp_func in ORDER_PRESERVING_CMP_FUNCS:
+            if (
+                attr_name == "datum"
+                and isinstance(expected_value, datetime.datetime)
+                and expected_value.tzinfo is None
+            ):
+                column = self.get_column("datum")
+                return bytes(
+                    map(
+                        cmp_func, column,
+                        itertools.repeat(
+                            datum_to_timestamp_exact(expected_value),
+                            len(column)
+                        )
+                    )
+                )
+
+            elif (
+                attr_name == "dauer.dauer"
+                and isinstance(expected_value, int)
+            ):
+                column = self.get_column("dauer")
+                return bytes(
+                    map(
+                        cmp_func, column,
+                        itertools.repeat(expected_value, len(column))
+                    )
+                )
+            # --
+        # --
+
+        return self.get_attr_mask(
+            attr_name,
+            (lambda value: cmp_func(value, expected_value)),
+            weak
+        )
+    # --- end of get_attr_cmp_mask (...) ---
+
+    def select_datum_range(self, bounds):
+        """
+        Returns a view of the rows whose datum satisfies all
+        (cmp_func, datetime) bounds, using bisect on the datum index.
+
+        The row order is preserved. Returns None if this view's rows
+        are not a contiguous range, callers should use a mask then.
+        """
+        row_ids = self.row_ids
+        if not (isinstance(row_ids, range) and row_ids.step == 1):
+            return None
+
+        columns = self.columns
+        datum_values, index_rows = columns.get_datum_index()
+        low = 0
+        high = len(datum_values)
+
+        for cmp_func, expected_value in bounds:
+            value = datum_to_timestamp_exact(expected_value)
+
+            if cmp_func is operator.__ge__ or cmp_func is operator.__eq__:
+                low = max(low, bisect.bisect_left(datum_values, value))
+            elif cmp_func is operator.__gt__:
+                low = max(low, bisect.bisect_right(datum_values, value))
+            # --
+
+            if cmp_func is operator.__le__ or cmp_func is operator.__eq__:
+                high = min(high, bisect.bisect_right(datum_values, value))
+            elif cmp_func is operator.__lt__:
+                high = min(high, bisect.bisect_left(datum_values, value))
+            # --
+        # --
+
+        rows = index_rows[low:max(low, high)]
+
+        if isinstance(rows, range):
+            if rows.step < 0:
+                rows = rows[::-1]
+
+            start = max(rows.start, row_ids.start)
+            stop = max(start, min(rows.stop, row_ids.stop))
+            rows = range(start, stop)
+
+        else:
+            rows = array.array(
+                columns.TYPECODE_ROW,
+                sorted(filter(row_ids.__contains__, rows))
+            )
+        # --
+
+        return self.__class__(columns, rows)
+    # --- end of select_datum_range (...) ---
+
+    def select_rows(self, rows):
+        """
+        Returns a view of the rows that are also in rows
+        (ascending row ids), preserving the order of this view.
+        """
+        row_ids = self.row_ids
+
+        if isinstance(row_ids, range) and row_ids.step == 1:
+            selected = rows[
+                bisect.bisect_left(rows, row_ids.start)
+                :bisect.bisect_left(rows, row_ids.stop)
+            ]
+        else:
+            selected = array.array(
+                self.columns.TYPECODE_ROW,
+                filter(set(rows).__contains__, row_ids)
+            )
+        # --
+
+        return self.__class__(self.columns, selected)
+    # --- end of select_rows (...) ---
+
+    def __len__(self):
+        return len(self.row_ids)
+
+    def __iter__(self):
+        return map(self.columns.get_entry, self.row_ids)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return self.__class__(self.columns, self.row_ids[idx])
+        else:
+            return self.columns.get_entry(self.row_ids[idx])
+    # --- end of __getitem__ (...) ---
+
+    def __repr__(self):
+        return "{cls.__name__}<{n:d} of {m:d} rows>".format(
+            cls=self.__class__, n=len(self), m=len(self.columns)
+        )
+
+# --- end of AVMPhoneStatsRows ---
@@ -38,6 +38,16 @@ class CallType(enum.IntEnum):
 class GespraechsDauer(object):
     __slots__ = ["dauer"]
 
+    def __hash__(self):
+        return hash(self.dauer)
+
+    def __eq__(self, other):
+        if isinstance(other, GespraechsDauer):
+            return self.dauer == other.dauer
+        else:
+            return NotImplemented
+    # ---
+
     def __init__(self, dauer):
         super().__init__()
         self.dauer = dauer
@@ -96,15 +106,18 @@ class AVMNamedCaller(AVMCaller):
 
 
 class AVMNebenstelle(AVMRufnummer):
-    __slots__ = ["desc", "nebenstelle"]
+    # source: name of the box (csv export) this number belongs to,
+    #         empty if unknown
+    __slots__ = ["desc", "nebenstelle", "source"]
 
     def __hash__(self):
-        return hash((self.nr, self.nebenstelle))
+        return hash((self.nr, self.nebenstelle, self.source))
 
-    def __init__(self, nr, desc, nebenstelle):
+    def __init__(self, nr, desc, nebenstelle, source=""):
         super().__init__(nr)
         self.desc = desc
         self.nebenstelle = nebenstelle
+        self.source = source
     # ---
 # --- end of AVMNebenstelle ---
 
@@ -115,6 +128,16 @@ class AVMPhoneStatsEntry(object):
     def __hash__(self):
         return hash((self.me, self.them, self.dauer, self.datum, self.call_type))
 
+    def __eq__(self, other):
+        if isinstance(other, AVMPhoneStatsEntry):
+            return (
+                (self.me, self.them, self.dauer, self.datum, self.call_type)
+                == (other.me, other.them, other.dauer, other.datum, other.call_type)
+            )
+        else:
+            return NotImplemented
+    # ---
+
     def __init__(self, *, me, them, dauer, datum, call_type):
         super().__init__()
         self.me = me
@@ -124,6 +147,10 @@ class AVMPhoneStatsEntry(object):
         self.call_type = call_type
     # --- end of __init__ (...) ---
 
+    @property
+    def source(self):
+        return self.me.source
+
     def __str__(self):
         call_type = self.call_type
 
@@ -0,0 +1,332 @@
+# fritz-fon-stats -- parallel fonlist csv reader
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2019 André Erdmann <dywi@mailerd.de>
+#
+# Distributed under the terms of the MIT license.
+# (See LICENSE.MIT or http://opensource.org/licenses/MIT)
+#
+#  The data part of a csv file (after the "sep=" and header lines)
+#  is split into byte ranges on line boundaries, which are parsed into
+#  AVMPhoneStatsColumns objects by a process pool. The results are
+#  merged in file order, and me/them objects are unified by key
+#  (AVMPhoneStatsColumns.extend()), so equal objects are shared again.
+#
+#  Quoted fields must not contain line breaks, which is the case
+#  for FRITZ!Box exports.
+#
+#  Filter chains are evaluated by partitioning the entries into
+#  contiguous chunks. The stats object is inherited by the worker
+#  processes (or sent once per worker if fork is not available),
+#  filter trees are pickled per chunk, and only row ids or stages
+#  (number of passed filters per entry) are sent back.
+#
+
+__all__ = ["AVMPhoneStatsParallelReader", "AVMPhoneStatsParallelFilter"]
+
+import array
+import concurrent.futures
+import csv
+import io
+import multiprocessing
+import os
+
+import ffs.fon.stats.columns
+import ffs.fon.stats.reader
+
+
+def _read_csv_chunk(reader_cls, csv_file, start, end, sep, field_positions,
+                    min_datum, source):
+    # runs in a worker process
+    reader = reader_cls(source=source)
+    columns = ffs.fon.stats.columns.AVMPhoneStatsColumns()
+
+    with io.open(csv_file, "rb") as fh:
+        fh.seek(start)
+        data = fh.read(end - start)
+
+    with io.TextIOWrapper(io.BytesIO(data), encoding="utf-8") as text_fh:
+        columns.update_records(
+            reader.gen_parse_csv_rows(
+                csv.reader(text_fh, delimiter=sep), field_positions,
+                min_datum=min_datum
+            )
+        )
+
+    columns.dauer_cache.clear()  # not worth pickling
+    return columns
+# --- end of _read_csv_chunk (...) ---
+
+
+class AVMPhoneStatsParallelReader(object):
+
+    # files smaller than this are read by a single process
+    MIN_CHUNK_SIZE = 4 * 2**20
+
+    def __init__(self, jobs=None, reader_cls=None):
+        super().__init__()
+        self.jobs = (os.cpu_count() or 1) if not jobs else jobs
+        self.reader_cls = (
+            ffs.fon.stats.reader.AVMPhoneStatsReader
+            if reader_cls is None else reader_cls
+        )
+    # --- end of __init__ (...) ---
+
+    def read_csv_header(self, fh):
+        """
+        Reads the "sep=" and header lines from a binary file handle.
+
+        @return: 2-tuple (sep, field positions) or None if the file is empty
+        """
+        # lines are read on demand, so that fh ends up at the first data row
+        return self.reader_cls().read_csv_header(
+            iter(lambda: str(fh.readline(), "utf-8"), "")
+        )
+    # --- end of read_csv_header (...) ---
+
+    def get_chunks(self, fh, start, num_chunks):
+        """
+        Splits a binary file into byte ranges that end on line boundaries.
+
+        @return: list of (start, end) offsets
+        """
+        end = os.fstat(fh.fileno()).st_size
+        chunk_size = max(
+            ((end - start) // max(num_chunks, 1)), self.MIN_CHUNK_SIZE
+        )
+
+        chunks = []
+        while start < end:
+            chunk_end = start + chunk_size
+            if chunk_end >= end:
+                chunk_end = end
+            else:
+                fh.seek(chunk_end)
+                fh.readline()
+                chunk_end = fh.tell()
+            # --
+
+            chunks.append((start, chunk_end))
+            start = chunk_end
+        # --
+
+        return chunks
+    # --- end of get_chunks (...) ---
+
+    def get_chunk_args(self, csv_file, min_datum=None, source=""):
+        """
+        @return: list of _read_csv_chunk() arguments, one per chunk
+        """
+        with io.open(csv_file, "rb") as fh:
+            header = self.read_csv_header(fh)
+            if header is None:
+                return []
+
+            sep, field_positions = header
+            chunks = self.get_chunks(fh, fh.tell(), self.jobs)
+        # --
+
+        return [
+            (
+                self.reader_cls, csv_file, chunk_start, chunk_end,
+                sep, field_positions, min_datum, source
+            )
+            for chunk_start, chunk_end in chunks
+        ]
+    # --- end of get_chunk_args (...) ---
+
+    def read_csv_files(self, csv_files, min_datum=None, sources=None):
+        """
+        Reads csv files using a process pool.
+        The chunks of all files share the pool, so that many small files
+        are read concurrently, too.
+
+        @param csv_files:  paths to the csv files (must be seekable)
+        @param min_datum:  if set, skip entries older than this datetime
+        @param sources:    box names of the csv files, see AVMNebenstelle
+
+        @return: list of L{AVMPhoneStatsColumns}, one per file
+        """
+        if sources is None:
+            sources = [""] * len(csv_files)
+
+        files_chunk_args = [
+            self.get_chunk_args(csv_file, min_datum=min_datum, source=source)
+            for csv_file, source in zip(csv_files, sources)
+        ]
+        num_chunks = sum(map(len, files_chunk_args))
+
+        files_columns = [
+            ffs.fon.stats.columns.AVMPhoneStatsColumns()
+            for _ in files_chunk_args
+        ]
+
+        if num_chunks < 2 or self.jobs < 2:
+            for columns, chunk_args in zip(files_columns, files_chunk_args):
+                for args in chunk_args:
+                    columns.extend(_read_csv_chunk(*args))
+            # --
+            return files_columns
+        # --
+
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=min(self.jobs, num_chunks)
+        ) as executor:
+            files_futures = [
+                [
+                    executor.submit(_read_csv_chunk, *args)
+                    for args in chunk_args
+                ]
+                for chunk_args in files_chunk_args
+            ]
+
+            # merge in file order
+            for columns, futures in zip(files_columns, files_futures):
+                for future in futures:
+                    columns.extend(future.result())
+            # --
+        # --
+
+        return files_columns
+    # --- end of read_csv_files (...) ---
+
+    def read_csv_file(self, csv_file, min_datum=None, source=""):
+        """
+        Reads a csv file using a process pool.
+
+        @param csv_file:   path to the csv file (must be seekable)
+        @param min_datum:  if set, skip entries older than this datetime
+        @param source:     box name, see AVMNebenstelle
+
+        @return: L{AVMPhoneStatsColumns}
+        """
+        return self.read_csv_files(
+            [csv_file], min_datum=min_datum, sources=[source]
+        )[0]
+    # --- end of read_csv_file (...) ---
+
+# --- end of AVMPhoneStatsParallelReader ---
+
+
+# stats object of a filter worker process
+_worker_stats = None
+
+
+def _init_filter_worker(stats):
+    global _worker_stats
+    _worker_stats = stats
+# --- end of _init_filter_worker (...) ---
+
+
+def _filter_chunk(filter_funcv, invert, start, end):
+    # runs in a worker process
+    stats = _worker_stats
+
+    if hasattr(stats, "get_rows"):
+        prev_matched, matched = stats.filter_chain(
+            filter_funcv, invert=invert,
+            entries=stats.get_rows(range(start, end))
+        )
+        return (
+            array.array(stats.TYPECODE_ROW, prev_matched.row_ids),
+            array.array(stats.TYPECODE_ROW, matched.row_ids)
+        )
+
+    else:
+        return stats.get_filter_stages(filter_funcv, stats.entries[start:end])
+# --- end of _filter_chunk (...) ---
+
+
+class AVMPhoneStatsParallelFilter(object):
+
+    # stats with fewer entries per job are filtered by a single process
+    MIN_CHUNK_SIZE = 50000
+
+    def __init__(self, jobs=None):
+        super().__init__()
+        self.jobs = (os.cpu_count() or 1) if not jobs else jobs
+    # --- end of __init__ (...) ---
+
+    def get_chunks(self, num_entries):
+        """
+        Splits the entries into contiguous ranges.
+
+        @return: list of (start, end) indexes
+        """
+        chunk_size = max(
+            -(-num_entries // max(self.jobs, 1)), self.MIN_CHUNK_SIZE
+        )
+
+        return [
+            (start, min(start + chunk_size, num_entries))
+            for start in range(0, num_entries, chunk_size)
+        ]
+    # --- end of get_chunks (...) ---
+
+    def get_mp_context(self):
+        # fork shares the stats with the workers without pickling them
+        if "fork" in multiprocessing.get_all_start_methods():
+            return multiprocessing.get_context("fork")
+        else:
+            return None
+    # --- end of get_mp_context (...) ---
+
+    def filter_chain(self, stats, filter_funcv, invert=False):
+        """
+        Like stats.filter_chain(), but evaluates the filters
+        in a process pool. The entry order is preserved.
+
+        @param stats:         AVMPhoneStats or AVMPhoneStatsColumns object
+        @param filter_funcv:  picklable filter funcs
+        @param invert:        whether to invert the final filter
+
+        @return: 2-tuple (prev_matched, matched)
+        """
+        is_columnar = hasattr(stats, "get_rows")
+        chunks = self.get_chunks(
+            len(stats) if is_columnar else len(stats.entries)
+        )
+
+        if not filter_funcv or len(chunks) < 2 or self.jobs < 2:
+            return stats.filter_chain(filter_funcv, invert=invert)
+        # --
+
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=min(self.jobs, len(chunks)),
+            mp_context=self.get_mp_context(),
+            initializer=_init_filter_worker, initargs=(stats,)
+        ) as executor:
+            futures = [
+                executor.submit(
+                    _filter_chunk, filter_funcv, invert, chunk_start, chunk_end
+                )
+                for chunk_start, chunk_end in chunks
+            ]
+
+            # merge in entry order
+            if is_columnar:
+                prev_matched = array.array(stats.TYPECODE_ROW)
+                matched = array.array(stats.TYPECODE_ROW)
+
+                for future in futures:
+                    chunk_prev_matched, chunk_matched = future.result()
+                    prev_matched.extend(chunk_prev_matched)
+                    matched.extend(chunk_matched)
+                # --
+
+            else:
+                stages = array.array('H')
+                for future in futures:
+                    stages.extend(future.result())
+            # --
+        # --
+
+        if is_columnar:
+            return (stats.get_rows(prev_matched), stats.get_rows(matched))
+        else:
+            return stats.select_filter_stages(
+                stages, len(filter_funcv), invert
+            )
+    # --- end of filter_chain (...) ---
+
+# --- end of AVMPhoneStatsParallelFilter ---
@@ -35,54 +35,107 @@ class AVMPhoneStatsReader(object):
 
     DATUM_FMT = r'%d.%m.%y %H:%M'
 
-    def __init__(self):
+    # exports are sorted by date, so a small datum cache is sufficient
+    DATUM_CACHE_SIZE = 4096
+
+    # csv columns used by the fast reader, in record order
+    FIELDS = (
+        "Typ", "Datum", "Name", "Rufnummer",
+        "Nebenstelle", "Eigene Rufnummer", "Dauer"
+    )
+
+    def __init__(self, fast=True, source=""):
         super().__init__()
+        self.fast = fast
+        # name of the box, see AVMNebenstelle.source
+        self.source = source
         self.obj_cache = ffs.util.objcache.ObjectCache()
+        # caches for the fast reader, str -> parsed value
+        self.datum_cache = {}
+        self.dauer_cache = {}
+        self.call_type_cache = {}
+        self.me_cache = {}
+        self.them_cache = {}
     # --- end of __init__ (...) ---
 
-    def _create_stats_entry(self, data):
-        obj_cache = self.obj_cache  # ref
-        data = {k: v.strip() for k, v in data.items()}  # overwrite param
+    def parse_datum(self, datum_str):
+        # fast path for the fixed "dd.mm.yy HH:MM" format,
+        #  anything else is handled by strptime()
+        if (
+            len(datum_str) == 14
+            and datum_str[2] == '.' and datum_str[5] == '.'
+            and datum_str[8] == ' ' and datum_str[11] == ':'
+        ):
+            try:
+                year = int(datum_str[6:8], 10)
+                # same century rule as strptime's %y
+                year += (2000 if year < 69 else 1900)
 
-        entry_data = {}
+                return datetime.datetime(
+                    year,
+                    int(datum_str[3:5], 10),
+                    int(datum_str[0:2], 10),
+                    int(datum_str[9:11], 10),
+                    int(datum_str[12:14], 10)
+                )
+            except ValueError:
+                pass
+        # --
 
-        # me (Nebenstelle/Rufnummer fritz box)
-        me_match = self.RE_EIGENE_RUFNUMMER.match(data['Eigene Rufnummer'])
+        return datetime.datetime.strptime(datum_str, self.DATUM_FMT)
+    # --- end of parse_datum (...) ---
+
+    def parse_dauer(self, dauer_str):
+        dauer_match = self.RE_DAUER.match(dauer_str)
+        if dauer_match is not None:
+            return self.obj_cache(
+                GespraechsDauer,
+                (
+                    (60 * int(dauer_match.group('H'), 10))
+                    + int(dauer_match.group('M'), 10)
+                )
+            )
+        else:
+            raise ValueError("Dauer", dauer_str)
+    # --- end of parse_dauer (...) ---
+
+    def parse_me(self, eigene_rufnummer, nebenstelle):
+        me_match = self.RE_EIGENE_RUFNUMMER.match(eigene_rufnummer)
         if me_match is not None:
-            entry_data["me"] = obj_cache(
-                AVMNebenstelle, me_match.group('nr'), me_match.group('desc'), data['Nebenstelle']
+            return self.obj_cache(
+                AVMNebenstelle,
+                me_match.group('nr'), me_match.group('desc'), nebenstelle,
+                self.source
             )
         else:
-            raise ValueError("Eigene Rufnummer", data['Eigene Rufnummer'])
-        # --
+            raise ValueError("Eigene Rufnummer", eigene_rufnummer)
+    # --- end of parse_me (...) ---
 
+    def parse_them(self, rufnummer, name):
+        if name:
+            return self.obj_cache(AVMNamedCaller, rufnummer, name)
+        else:
+            return self.obj_cache(AVMCaller, rufnummer)
+    # --- end of parse_them (...) ---
+
+    def _create_stats_entry(self, data):
+        data = {k: v.strip() for k, v in data.items()}  # overwrite param
+
+        entry_data = {}
+
+        # me (Nebenstelle/Rufnummer fritz box)
+        entry_data["me"] = self.parse_me(
+            data['Eigene Rufnummer'], data['Nebenstelle']
+        )
 
         # them (Name/Rufnummer Gegenstelle)
-        if data['Name']:
-            entry_data["them"] = obj_cache(
-                AVMNamedCaller, data['Rufnummer'], data['Name']
-            )
-        else:
-            entry_data["them"] = obj_cache(AVMCaller, data['Rufnummer'])
-        # --
+        entry_data["them"] = self.parse_them(data['Rufnummer'], data['Name'])
 
         # call_type
         entry_data["call_type"] = CallType(int(data['Typ'].strip(), 10))
 
         # dauer
-        dauer_match = self.RE_DAUER.match(data['Dauer'])
-        if dauer_match is not None:
-            entry_data["dauer"] = obj_cache(
-                GespraechsDauer,
-                (
-                    (60 * int(dauer_match.group('H'), 10))
-                    + int(dauer_match.group('M'), 10)
-                )
-            )
-        else:
-            #entry_data["dauer"] = None
-            raise ValueError("Dauer", data['Dauer'])
-        # --
+        entry_data["dauer"] = self.parse_dauer(data['Dauer'])
 
         # datum
         entry_data["datum"] = datetime.datetime.strptime(data['Datum'], self.DATUM_FMT)
@@ -91,29 +144,185 @@ class AVMPhoneStatsReader(object):
         return AVMPhoneStatsEntry(**entry_data)
     # --- end of _create_stats_entry (...) ---
 
-    def _gen_read_csv_file(self, fh):
+    def read_csv_sep(self, fh):
+        """
+        Reads the "sep=" line from a text file handle
+        (or an iterator of lines).
+
+        @return: field separator or None if the file is empty
+        @raises AssertionError: unexpected file format
+        """
         try:
             header_line = next(fh)
         except StopIteration:
             # empty file?
-            return
+            return None
         # --
 
-        sep = None
         header_match = self.RE_HEADER_SEP.match(header_line)
         if header_match is not None:
-            sep = header_match.group("sep")
+            return header_match.group("sep")
         else:
             raise AssertionError("unexpected file format, missing sep= line")
-        # -- get separator
+    # --- end of read_csv_sep (...) ---
+
+    def read_csv_header(self, fh):
+        """
+        Reads the "sep=" line and the header row from a text file handle
+        (or an iterator of lines). Data rows are not consumed.
+
+        @return: 2-tuple (sep, field positions, see get_field_positions())
+                 or None if the file is empty
+        @raises AssertionError: unexpected file format
+        """
+        sep = self.read_csv_sep(fh)
+        if sep is None:
+            return None
+
+        try:
+            fieldnames = next(csv.reader(fh, delimiter=sep))
+        except StopIteration:
+            return None
+
+        return (sep, self.get_field_positions(fieldnames))
+    # --- end of read_csv_header (...) ---
+
+    def _gen_read_csv_file(self, fh):
+        sep = self.read_csv_sep(fh)
+        if sep is None:
+            return
 
         reader = csv.DictReader(fh, delimiter=sep)
         for row in reader:
             yield self._create_stats_entry(row)
     # --- end of _gen_read_csv_file (...) ---
 
-    def read_csv_file(self, fh):
-        for row in self._gen_read_csv_file(fh):
+    def get_field_positions(self, fieldnames):
+        """
+        @return: positions of self.FIELDS in a csv header row
+        """
+        fieldnames = [name.strip() for name in fieldnames]
+        try:
+            return tuple(fieldnames.index(name) for name in self.FIELDS)
+        except ValueError:
+            raise AssertionError(
+                "unexpected file format, missing columns", fieldnames
+            ) from None
+    # --- end of get_field_positions (...) ---
+
+    def _gen_read_csv_records_fast(self, fh, min_datum=None):
+        header = self.read_csv_header(fh)
+        if header is None:
+            return
+
+        sep, field_positions = header
+
+        # column positions are resolved once
+        yield from self.gen_parse_csv_rows(
+            csv.reader(fh, delimiter=sep), field_positions,
+            min_datum=min_datum
+        )
+    # --- end of _gen_read_csv_records_fast (...) ---
+
+    def gen_parse_csv_rows(self, rows, field_positions, min_datum=None):
+        """
+        Parses csv rows (lists of str), see get_field_positions().
+
+        @return: generator of (me, them, dauer, datum, call_type) records
+        """
+        idx_typ, idx_datum, idx_name, idx_rufnummer, \
+            idx_nebenstelle, idx_eigene_rufnummer, idx_dauer = field_positions
+
+        datum_cache = self.datum_cache  # ref
+        dauer_cache = self.dauer_cache  # ref
+        call_type_cache = self.call_type_cache  # ref
+        me_cache = self.me_cache  # ref
+        them_cache = self.them_cache  # ref
+
+        for row in rows:
+            if not row:
+                continue  # same as DictReader
+
+            # datum
+            key = row[idx_datum]
+            try:
+                datum = datum_cache[key]
+            except KeyError:
+                datum = self.parse_datum(key.strip())
+                if len(datum_cache) >= self.DATUM_CACHE_SIZE:
+                    datum_cache.clear()
+                datum_cache[key] = datum
+
+            if min_datum is not None and datum < min_datum:
+                continue  # skip parsing the remaining fields
+
+            # call_type
+            key = row[idx_typ]
+            try:
+                call_type = call_type_cache[key]
+            except KeyError:
+                call_type = CallType(int(key.strip(), 10))
+                call_type_cache[key] = call_type
+
+            # dauer
+            key = row[idx_dauer]
+            try:
+                dauer = dauer_cache[key]
+            except KeyError:
+                dauer = self.parse_dauer(key.strip())
+                dauer_cache[key] = dauer
+
+            # me (Nebenstelle/Rufnummer fritz box)
+            key = (row[idx_eigene_rufnummer], row[idx_nebenstelle])
+            try:
+                me = me_cache[key]
+            except KeyError:
+                me = self.parse_me(key[0].strip(), key[1].strip())
+                me_cache[key] = me
+
+            # them (Name/Rufnummer Gegenstelle)
+            key = (row[idx_rufnummer], row[idx_name])
+            try:
+                them = them_cache[key]
+            except KeyError:
+                them = self.parse_them(key[0].strip(), key[1].strip())
+                them_cache[key] = them
+
+            yield (me, them, dauer, datum, call_type)
+        # --
+    # --- end of gen_parse_csv_rows (...) ---
+
+    def _gen_read_csv_file_fast(self, fh, min_datum=None):
+        for me, them, dauer, datum, call_type in (
+            self._gen_read_csv_records_fast(fh, min_datum=min_datum)
+        ):
+            yield AVMPhoneStatsEntry(
+                me=me, them=them, dauer=dauer, datum=datum, call_type=call_type
+            )
+    # --- end of _gen_read_csv_file_fast (...) ---
+
+    def read_csv_file(self, fh, fast=None, min_datum=None):
+        """
+        Reads a csv file and yields AVMPhoneStatsEntry objects.
+
+        @param fh:         file handle opened in text mode
+        @param fast:       whether to use the fast reader (default: self.fast)
+        @param min_datum:  if set, skip entries older than this datetime
+        """
+        if fast is None:
+            fast = self.fast
+
+        if fast:
+            gen_entries = self._gen_read_csv_file_fast(fh, min_datum=min_datum)
+        elif min_datum is not None:
+            gen_entries = (
+                entry for entry in self._gen_read_csv_file(fh)
+                if entry.datum >= min_datum
+            )
+        else:
+            gen_entries = self._gen_read_csv_file(fh)
+
+        for row in gen_entries:
             yield row
     # --- end of read_csv_file (...) ---
 
@@ -0,0 +1,262 @@
+# fritz-fon-stats -- pre-aggregated call counts and durations
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2019 André Erdmann <dywi@mailerd.de>
+#
+# Distributed under the terms of the MIT license.
+# (See LICENSE.MIT or http://opensource.org/licenses/MIT)
+#
+#  A rollup table holds the number of calls, their total duration
+#  and a distinct-count sketch of the remote numbers (them.nr,
+#  see ffs.util.hll) per cell, where a cell is a (day, me code,
+#  call type) tuple.
+#  It is updated incrementally while rows are added, and it is stored
+#  in the archive (see ffs.fon.stats.archive).
+#
+#  Queries that only look at these dimensions (e.g. calls per device
+#  and month) can be answered from the cells instead of the raw rows,
+#  see ffs.fon.query.rollup. The cells are presented as columns
+#  (AVMPhoneStatsRollupColumns) with one row per cell,
+#  so that the usual filters can be applied to them.
+#
+#  The rollup file consists of a header (magic, version, number of
+#  rolled up rows, number of cells) followed by fixed-size cell records
+#  and the cells' sketches (ffs.util.hll.HyperLogLog.to_bytes()),
+#  in the same order.
+#
+
+__all__ = ["AVMPhoneStatsRollup", "AVMPhoneStatsRollupColumns"]
+
+import array
+import itertools
+import struct
+
+import ffs.util.hll
+
+import ffs.fon.exc.storage
+
+import ffs.fon.stats.columns
+
+
+SECONDS_PER_DAY = 86400
+
+
+class AVMPhoneStatsRollupColumns(ffs.fon.stats.columns.AVMPhoneStatsColumns):
+    """
+    Columns with one row per rollup cell.
+
+    The datum column holds the start of the cell's day, the dauer column
+    is unused (0), and the count / total columns hold the cell's
+    number of calls and their total duration.
+    There are no "them" objects, rows must not be checked against them,
+    them_sketches holds the cell's them.nr sketch instead.
+    """
+
+    TYPECODE_COUNT  = 'Q'
+    TYPECODE_TOTAL  = 'q'
+
+    COLUMN_TYPECODES = dict(
+        ffs.fon.stats.columns.AVMPhoneStatsColumns.COLUMN_TYPECODES,
+        count=TYPECODE_COUNT,
+        total=TYPECODE_TOTAL,
+    )
+
+    def __init__(self):
+        super().__init__()
+        self.count = array.array(self.TYPECODE_COUNT)
+        self.total = array.array(self.TYPECODE_TOTAL)
+        # HyperLogLog objects, by row
+        self.them_sketches = []
+    # --- end of __init__ (...) ---
+
+# --- end of AVMPhoneStatsRollupColumns ---
+
+
+class AVMPhoneStatsRollup(object):
+
+    # bump this whenever the file format changes,
+    #  rollup files of other versions are ignored
+    ROLLUP_VERSION = 2
+    ROLLUP_MAGIC = b'FFSROLL\0'
+
+    HEADER = struct.Struct("=8sI4xQQ")
+    # day timestamp, me code, call type, count, total
+    CELL_RECORD = struct.Struct("=qIB3xQq")
+
+    def __init__(self, sketch_precision=None):
+        super().__init__()
+        self.sketch_precision = sketch_precision
+        # (day timestamp, me code, call type)
+        #  -> [count, total, them.nr sketch]
+        self.cells = {}
+        # number of rows that have been rolled up
+        self.num_rows = 0
+    # --- end of __init__ (...) ---
+
+    def __len__(self):
+        return len(self.cells)
+
+    def add_rows(self, columns, rows=None):
+        """
+        Adds rows of an AVMPhoneStatsColumns object whose me codes
+        refer to the me table this rollup is used with.
+
+        @param columns:  AVMPhoneStatsColumns object
+        @param rows:     row ids or None (all rows)
+        """
+        cells = self.cells  # ref
+        new_sketch = self.new_sketch
+        row_view = columns.get_rows(rows)
+
+        # hash each remote number once
+        them_registers = list(
+            row_view.get_attr_values("them.nr", new_sketch().get_register)
+        )
+
+        for datum, me, call_type, dauer, (register, rank) in zip(
+            row_view.get_column("datum"), row_view.get_column("me"),
+            row_view.get_column("call_type"), row_view.get_column("dauer"),
+            them_registers
+        ):
+            key = ((datum - (datum % SECONDS_PER_DAY)), me, call_type)
+
+            try:
+                cell = cells[key]
+            except KeyError:
+                cell = [0, 0, new_sketch()]
+                cells[key] = cell
+            # --
+
+            cell[0] += 1
+            cell[1] += dauer
+            cell[2].add_register(register, rank)
+        # --
+
+        self.num_rows += len(row_view)
+    # --- end of add_rows (...) ---
+
+    def update(self, columns):
+        """
+        Adds the rows of columns that have not been rolled up yet,
+        i.e. rows that have been appended since the last update().
+        """
+        num_rows = len(columns)
+        if num_rows < self.num_rows:
+            raise ValueError("columns have fewer rows than the rollup")
+
+        self.add_rows(columns, range(self.num_rows, num_rows))
+    # --- end of update (...) ---
+
+    def new_sketch(self):
+        return ffs.util.hll.HyperLogLog(self.sketch_precision)
+
+    def is_current(self, columns):
+        """Returns True if all rows of columns have been rolled up."""
+        return self.num_rows == len(columns)
+
+    def get_columns(self, columns):
+        """
+        Returns an AVMPhoneStatsRollupColumns object with one row per cell,
+        in datum order, that shares columns' me table.
+        """
+        cell_columns = AVMPhoneStatsRollupColumns()
+        cell_columns.me_table = columns.me_table
+
+        for key in sorted(self.cells):
+            count, total, them_sketch = self.cells[key]
+            cell_columns.datum.append(key[0])
+            cell_columns.me.append(key[1])
+            cell_columns.call_type.append(key[2])
+            cell_columns.count.append(count)
+            cell_columns.total.append(total)
+            cell_columns.them_sketches.append(them_sketch)
+        # --
+
+        num_cells = len(cell_columns.datum)
+        cell_columns.dauer.extend(itertools.repeat(0, num_cells))
+        cell_columns.them.extend(itertools.repeat(0, num_cells))
+
+        # cells are sorted by datum
+        cell_columns.datum_index = (cell_columns.datum, range(num_cells))
+        return cell_columns
+    # --- end of get_columns (...) ---
+
+    def dump(self, fh):
+        cells = sorted(self.cells.items())
+
+        fh.write(
+            self.HEADER.pack(
+                self.ROLLUP_MAGIC, self.ROLLUP_VERSION,
+                self.num_rows, len(cells)
+            )
+        )
+
+        pack_cell = self.CELL_RECORD.pack
+        fh.write(
+            b''.join(
+                pack_cell(day, me, call_type, count, total)
+                for (day, me, call_type), (count, total, _) in cells
+            )
+        )
+
+        fh.write(
+            b''.join(
+                them_sketch.to_bytes() for _, (_, _, them_sketch) in cells
+            )
+        )
+    # --- end of dump (...) ---
+
+    @classmethod
+    def load(cls, data, name=None):
+        """
+        Creates a rollup from the data written by dump().
+
+        @return: rollup, or None if the data has another rollup version
+        @raises StatsStorageFormatError:
+        """
+        header_size = cls.HEADER.size
+
+        try:
+            magic, version, num_rows, num_cells = (
+                cls.HEADER.unpack(data[:header_size])
+            )
+        except struct.error:
+            raise ffs.fon.exc.storage.StatsStorageFormatError(
+                name, "truncated rollup header"
+            ) from None
+
+        if magic != cls.ROLLUP_MAGIC:
+            raise ffs.fon.exc.storage.StatsStorageFormatError(
+                name, "bad rollup magic"
+            )
+        elif version != cls.ROLLUP_VERSION:
+            return None
+
+        cells_end = header_size + (num_cells * cls.CELL_RECORD.size)
+        if len(data) < cells_end:
+            raise ffs.fon.exc.storage.StatsStorageFormatError(
+                name, "truncated rollup cells"
+            )
+
+        obj = cls()
+        obj.num_rows = num_rows
+        cells = obj.cells  # ref
+        from_bytes = ffs.util.hll.HyperLogLog.from_bytes
+        offset = cells_end
+
+        try:
+            for day, me, call_type, count, total in (
+                cls.CELL_RECORD.iter_unpack(data[header_size:cells_end])
+            ):
+                them_sketch, offset = from_bytes(data, offset)
+                cells[(day, me, call_type)] = [count, total, them_sketch]
+            # --
+        except ValueError:
+            raise ffs.fon.exc.storage.StatsStorageFormatError(
+                name, "truncated rollup sketches"
+            ) from None
+
+        return obj
+    # --- end of load (...) ---
+
+# --- end of AVMPhoneStatsRollup ---
@@ -9,6 +9,11 @@
 
 __all__ = ["AVMPhoneStats"]
 
+import array
+import itertools
+import operator
+
+
 class AVMPhoneStats(object):
 
     def __init__(self):
@@ -27,6 +32,16 @@ class AVMPhoneStats(object):
         return filter(filter_func, entries)
     # ---
 
+    def filter_select(self, filter_func, entries=None):
+        if entries is None:
+            entries = self.entries
+
+        if filter_func is None:
+            return list(entries)
+        else:
+            return list(filter(filter_func, entries))
+    # ---
+
     def filter_split(self, filter_func, entries=None):
         matched = []
         not_matched = []
@@ -53,6 +68,82 @@ class AVMPhoneStats(object):
         return (matched, not_matched)
     # --- end of filter_split (...) ---
 
+    def filter_chain(self, filter_funcv, invert=False):
+        """
+        Applies a sequence of filters, each one to the entries
+        matched by the previous filters.
+
+        All filters are evaluated in a single pass over the entries,
+        recording the number of passed filters ("stage") per entry.
+
+        @param filter_funcv:  filter funcs
+        @param invert:        whether to invert the final filter
+
+        @return:  2-tuple (
+                     entries matched by all but the final filter,
+                     entries matched by all filters (or, if inverted,
+                     entries matched by all but the final filter)
+                  )
+        """
+        if not filter_funcv:
+            return (self.entries, self.entries)
+
+        return self.select_filter_stages(
+            self.get_filter_stages(filter_funcv), len(filter_funcv), invert
+        )
+    # --- end of filter_chain (...) ---
+
+    def get_filter_stages(self, filter_funcv, entries=None):
+        """
+        Returns the number of passed filters per entry.
+
+        @return: array('H')
+        """
+        if entries is None:
+            entries = self.entries
+
+        stages = array.array('H')
+        add_stage = stages.append
+
+        for entry in entries:
+            stage = 0
+            for filter_func in filter_funcv:
+                if not filter_func(entry):
+                    break
+                stage += 1
+            # --
+            add_stage(stage)
+        # --
+
+        return stages
+    # --- end of get_filter_stages (...) ---
+
+    def select_filter_stages(self, stages, num_stages, invert=False):
+        """
+        Splits the entries by the stages from get_filter_stages(),
+        see filter_chain().
+        """
+        entries = self.entries
+
+        prev_stage = num_stages - 1
+        prev_matched = list(
+            itertools.compress(
+                entries,
+                map(operator.__ge__, stages, itertools.repeat(prev_stage))
+            )
+        )
+
+        final_stage = (prev_stage if invert else num_stages)
+        matched = list(
+            itertools.compress(
+                entries,
+                map(operator.__eq__, stages, itertools.repeat(final_stage))
+            )
+        )
+
+        return (prev_matched, matched)
+    # --- end of select_filter_stages (...) ---
+
     def get_entries(self):
         return list(self.entries)
 
@@ -0,0 +1,287 @@
+# fritz-fon-stats -- binary storage format for columnar fonlist stats
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2019 André Erdmann <dywi@mailerd.de>
+#
+# Distributed under the terms of the MIT license.
+# (See LICENSE.MIT or http://opensource.org/licenses/MIT)
+#
+#  File layout (native byte order, recorded in the header):
+#
+#    header         magic, format version, byte order, number of rows
+#    sections       each one is a u64 length followed by the data,
+#                   padded to a multiple of 8 bytes:
+#
+#                     meta              opaque bytes, e.g. a cache key
+#                     str_offsets       u32 end offset of each string
+#                     str_data          utf-8 encoded strings
+#                     me_table          u32 (nr, desc, nebenstelle, source)
+#                                       str refs
+#                     them_table        u32 (nr, name) str refs,
+#                                       name is NO_STR for unnamed callers
+#                     datum             int64 column
+#                     dauer             int32 column
+#                     call_type         uint8 column
+#                     me                uint32 column
+#                     them              uint32 column
+#
+
+__all__ = [
+    "dump_columns", "load_columns", "FORMAT_VERSION",
+    "write_section", "iter_sections", "encode_tables", "decode_tables",
+]
+
+import array
+import struct
+import sys
+
+import ffs.util.intern
+
+import ffs.fon.exc.storage
+
+import ffs.fon.stats.columns
+from ffs.fon.stats.columns import get_caller_key, get_nebenstelle_key
+
+import ffs.fon.stats.entry
+from ffs.fon.stats.entry import AVMCaller, AVMNamedCaller, AVMNebenstelle
+
+
+# bump this whenever the layout changes
+FORMAT_VERSION = 2
+
+FORMAT_MAGIC = b'FFSCOLS\0'
+
+BYTE_ORDER_FLAG = (1 if sys.byteorder == "big" else 0)
+
+HEADER = struct.Struct("=8sIB3xQ")
+SECTION_LEN = struct.Struct("=Q")
+
+NO_STR = 0xffffffff
+
+COLUMN_NAMES = ("datum", "dauer", "call_type", "me", "them")
+
+
+def _pad_len(length):
+    return (-length) % 8
+# --- end of _pad_len (...) ---
+
+
+def write_section(fh, data):
+    data = memoryview(data).cast('B')
+    fh.write(SECTION_LEN.pack(len(data)))
+    fh.write(data)
+    fh.write(bytes(_pad_len(len(data))))
+# --- end of write_section (...) ---
+
+
+def iter_sections(buf, offset=0):
+    buf_len = len(buf)
+
+    while offset < buf_len:
+        if offset + SECTION_LEN.size > buf_len:
+            raise ffs.fon.exc.storage.StatsStorageFormatError("truncated")
+
+        (length,) = SECTION_LEN.unpack_from(buf, offset)
+        offset += SECTION_LEN.size
+
+        if offset + length > buf_len:
+            raise ffs.fon.exc.storage.StatsStorageFormatError("truncated")
+
+        yield buf[offset:(offset + length)]
+        offset += length + _pad_len(length)
+    # --
+# --- end of iter_sections (...) ---
+
+
+def encode_tables(columns):
+    """
+    Encodes the code tables of an AVMPhoneStatsColumns object.
+
+    @return: 4-tuple (str_offsets, str_data, me_table, them_table)
+    """
+    strings = ffs.util.intern.InternTable()
+
+    def add_str(s):
+        return strings.intern(s, s)
+    # ---
+
+    me_table = array.array('I')
+    for obj in columns.me_table:
+        me_table.extend((
+            add_str(obj.nr), add_str(obj.desc), add_str(obj.nebenstelle),
+            add_str(obj.source)
+        ))
+
+    them_table = array.array('I')
+    for obj in columns.them_table:
+        name = getattr(obj, "name", None)
+        them_table.extend(
+            (add_str(obj.nr), (NO_STR if name is None else add_str(name)))
+        )
+
+    str_offsets = array.array('I')
+    str_data = bytearray()
+    for s in strings:
+        str_data.extend(s.encode("utf-8"))
+        str_offsets.append(len(str_data))
+
+    return (str_offsets, str_data, me_table, them_table)
+# --- end of encode_tables (...) ---
+
+
+def dump_columns(columns, fh, meta=b''):
+    """
+    Writes an AVMPhoneStatsColumns object to a binary file handle.
+
+    @param columns:  columnar stats
+    @type  columns:  L{AVMPhoneStatsColumns}
+    @param fh:       file handle opened in binary write mode
+    @param meta:     additional data that is stored as-is
+    @type  meta:     C{bytes}
+    """
+    fh.write(
+        HEADER.pack(FORMAT_MAGIC, FORMAT_VERSION, BYTE_ORDER_FLAG, len(columns))
+    )
+    write_section(fh, meta)
+
+    for data in encode_tables(columns):
+        write_section(fh, data)
+
+    for name in COLUMN_NAMES:
+        write_section(fh, getattr(columns, name))
+# --- end of dump_columns (...) ---
+
+
+def _decode_strings(str_offsets, str_data):
+    strings = []
+    start = 0
+    for end in str_offsets:
+        strings.append(str(str_data[start:end], "utf-8"))
+        start = end
+    return strings
+# --- end of _decode_strings (...) ---
+
+
+def _load_array(typecode, data):
+    arr = array.array(typecode)
+    if len(data) % arr.itemsize:
+        raise ffs.fon.exc.storage.StatsStorageFormatError(
+            "bad array size", typecode, len(data)
+        )
+    arr.frombytes(data)
+    return arr
+# --- end of _load_array (...) ---
+
+
+def decode_tables(columns, str_offsets, str_data, me_table, them_table):
+    """
+    Restores the code tables of an (empty) AVMPhoneStatsColumns object,
+    see encode_tables().
+    """
+    try:
+        strings = _decode_strings(_load_array('I', str_offsets), str_data)
+    except UnicodeDecodeError:
+        raise ffs.fon.exc.storage.StatsStorageFormatError(
+            "bad string data"
+        ) from None
+
+    try:
+        me_refs = _load_array('I', me_table)
+        for idx in range(0, len(me_refs), 4):
+            obj = AVMNebenstelle(
+                strings[me_refs[idx]],
+                strings[me_refs[idx + 1]],
+                strings[me_refs[idx + 2]],
+                strings[me_refs[idx + 3]]
+            )
+            columns.me_table.intern(get_nebenstelle_key(obj), obj)
+        # --
+
+        them_refs = _load_array('I', them_table)
+        for idx in range(0, len(them_refs), 2):
+            nr = strings[them_refs[idx]]
+            name_ref = them_refs[idx + 1]
+
+            if name_ref == NO_STR:
+                obj = AVMCaller(nr)
+            else:
+                obj = AVMNamedCaller(nr, strings[name_ref])
+
+            columns.them_table.intern(get_caller_key(obj), obj)
+        # --
+    except IndexError:
+        raise ffs.fon.exc.storage.StatsStorageFormatError(
+            "bad string reference"
+        ) from None
+# --- end of decode_tables (...) ---
+
+
+def check_codes(columns):
+    for name in ("me", "them"):
+        codes = getattr(columns, name)
+        if codes and max(codes) >= len(getattr(columns, name + "_table")):
+            raise ffs.fon.exc.storage.StatsStorageFormatError(
+                "bad code", name
+            )
+    # --
+# --- end of check_codes (...) ---
+
+
+def load_columns(buf):
+    """
+    Creates an AVMPhoneStatsColumns object from a buffer
+    that has been written by dump_columns().
+
+    @param buf:  data
+    @type  buf:  bytes-like
+
+    @return:     2-tuple (columns, meta)
+    """
+    buf = memoryview(buf)
+
+    try:
+        magic, version, byte_order, num_rows = HEADER.unpack_from(buf, 0)
+    except struct.error:
+        raise ffs.fon.exc.storage.StatsStorageFormatError(
+            "truncated"
+        ) from None
+
+    if magic != FORMAT_MAGIC:
+        raise ffs.fon.exc.storage.StatsStorageFormatError("bad magic")
+    elif version != FORMAT_VERSION:
+        raise ffs.fon.exc.storage.StatsStorageFormatError(
+            "unsupported version", version
+        )
+    elif byte_order != BYTE_ORDER_FLAG:
+        raise ffs.fon.exc.storage.StatsStorageFormatError(
+            "unsupported byte order"
+        )
+    # --
+
+    sections = list(iter_sections(buf, HEADER.size))
+    if len(sections) != (5 + len(COLUMN_NAMES)):
+        raise ffs.fon.exc.storage.StatsStorageFormatError(
+            "bad number of sections", len(sections)
+        )
+
+    meta = bytes(sections[0])
+
+    columns = ffs.fon.stats.columns.AVMPhoneStatsColumns()
+    decode_tables(columns, *sections[1:5])
+
+    for name, data in zip(COLUMN_NAMES, sections[5:]):
+        setattr(
+            columns, name,
+            _load_array(columns.COLUMN_TYPECODES[name], data)
+        )
+
+        if len(getattr(columns, name)) != num_rows:
+            raise ffs.fon.exc.storage.StatsStorageFormatError(
+                "bad column length", name
+            )
+    # --
+
+    check_codes(columns)
+
+    return (columns, meta)
+# --- end of load_columns (...) ---
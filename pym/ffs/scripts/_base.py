@@ -9,6 +9,7 @@
 
 __all__ = ["MainScriptBase"]
 
+import os
 import os.path
 import sys
 
@@ -17,11 +18,24 @@ class MainScriptBase(object):
     EX_OK = getattr(os, 'EX_OK', 0)
     EX_ERR = EX_OK ^ 1
     EX_KEYBOARD_INTERRUPT = EX_OK ^ 130
+    EX_BROKEN_PIPE = EX_OK ^ 141
 
     @classmethod
     def run(cls, prog=None, argv=None, **kwargs):
         main_script = cls(prog=prog, **kwargs)
-        exit_code = main_script.run_main(argv)
+        try:
+            exit_code = main_script.run_main(argv)
+            # write pending output now, while a broken pipe can be handled
+            sys.stdout.flush()
+        except BrokenPipeError:
+            # the reader went away (e.g. "ffs-query -S | head"),
+            #  point stdout to /dev/null so that flushing on exit
+            #  does not fail again
+            devnull = os.open(os.devnull, os.O_WRONLY)
+            os.dup2(devnull, sys.stdout.fileno())
+            os.close(devnull)
+            exit_code = cls.EX_BROKEN_PIPE
+        # --
         sys.exit(exit_code)
     # ---
 
@@ -0,0 +1,132 @@
+# fritz-fon-stats -- ffs-archive main script
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2019 André Erdmann <dywi@mailerd.de>
+#
+# Distributed under the terms of the MIT license.
+# (See LICENSE.MIT or http://opensource.org/licenses/MIT)
+#
+
+__all__ = ["FFSArchive"]
+
+import argparse
+import io
+import sys
+
+
+import ffs.scripts._base
+
+import ffs.fon.stats.archive
+import ffs.fon.stats.columns
+import ffs.fon.stats.parallel
+import ffs.fon.stats.reader
+
+
+class FFSArchive(ffs.scripts._base.MainScriptBase):
+
+    def build_argument_parser(self):
+        parser = argparse.ArgumentParser(
+            prog=self.prog_name,
+            description="convert FRITZ!Box foncall lists to an archive"
+        )
+
+        parser.add_argument(
+            "archive", metavar="<archive>",
+            help="path to archive directory"
+        )
+
+        parser.add_argument(
+            "-f", "--csv-file", metavar="<file>", default=None,
+            help="path to csv file (default: stdin)"
+        )
+
+        parser.add_argument(
+            "-j", "--jobs",
+            metavar="<n>", default=None, type=int,
+            help="number of processes for parsing the csv file (default: 1)"
+        )
+
+        parser.add_argument(
+            "-a", "--append", default=False, action="store_true",
+            help=(
+                "add new calls to an existing archive "
+                "instead of replacing it (overlapping exports are merged)"
+            )
+        )
+
+        parser.add_argument(
+            "--no-rollup",
+            dest="use_rollup", default=True, action="store_false",
+            help=(
+                "do not maintain the rollup table"
+                " (calls per day, number and call type)"
+            )
+        )
+
+        return parser
+    # --- end of build_argument_parser (...) ---
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.arg_parser = self.build_argument_parser()
+    # --- end of __init__ (...) ---
+
+    def parse_args(self, argv):
+        return self.arg_parser.parse_args(argv)
+    # --- end of parse_args (...) ---
+
+    def get_stats_reader(self):
+        return ffs.fon.stats.reader.AVMPhoneStatsReader()
+    # --- end of get_stats_reader (...) ---
+
+    def gen_read_csv_file(self, csv_file, min_datum=None):
+        stats_reader = self.get_stats_reader()
+
+        if csv_file is None or csv_file == "-":
+            yield from stats_reader.read_csv_file(
+                sys.stdin, min_datum=min_datum
+            )
+        else:
+            with io.open(csv_file, "rt", encoding="utf-8") as fh:
+                yield from stats_reader.read_csv_file(
+                    fh, min_datum=min_datum
+                )
+        # --
+    # --- end of gen_read_csv_file (...) ---
+
+    def read_phone_stats(self, csv_file, jobs=None, min_datum=None):
+        if jobs is not None and jobs > 1 and csv_file not in {None, "-"}:
+            return ffs.fon.stats.parallel.AVMPhoneStatsParallelReader(
+                jobs
+            ).read_csv_file(csv_file, min_datum=min_datum)
+        # --
+
+        stats = ffs.fon.stats.columns.AVMPhoneStatsColumns()
+        stats.update(self.gen_read_csv_file(csv_file, min_datum=min_datum))
+        return stats
+    # --- end of read_phone_stats (...) ---
+
+    def __call__(self, argv):
+        arg_config = self.parse_args(argv)
+        archive = ffs.fon.stats.archive.AVMPhoneStatsArchive(
+            arg_config.archive, use_rollup=arg_config.use_rollup
+        )
+
+        if arg_config.append and archive.exists():
+            archive.ingest(
+                self.read_phone_stats(
+                    arg_config.csv_file, jobs=arg_config.jobs,
+                    min_datum=archive.get_high_water_mark()
+                ).get_rows()
+            )
+        else:
+            archive.write(
+                self.read_phone_stats(arg_config.csv_file, jobs=arg_config.jobs)
+            )
+    # ---
+
+# --- end of FFSArchive ---
+
+
+if __name__ == "__main__":
+    FFSArchive.run()
@@ -10,27 +10,115 @@
 __all__ = ["FFSQuery"]
 
 import argparse
+import array
+import collections
+import contextlib
+import glob
+import heapq
 import io
+import itertools
+import operator
+import os
 import sys
 
 
 import ffs.scripts._base
 
-import ffs.fon.stats.reader
-import ffs.fon.stats.stats
+import ffs.util.cachedir
+import ffs.util.hll
+import ffs.util.lazyimport
+from ffs.util.lazyimport import lazy_import
 
-import ffs.fon.query.lang.lexer
-import ffs.fon.query.lang.parser
+import ffs.fon.query.aggregate
+import ffs.fon.query.histogram
+import ffs.fon.query.sink
+
+# loaded on first use only, e.g. a query without filters
+#  does not need the filter language parser
+lazy_import("ffs.fon.stats.archive")
+lazy_import("ffs.fon.stats.cache")
+lazy_import("ffs.fon.stats.parallel")
+lazy_import("ffs.fon.stats.reader")
+lazy_import("ffs.fon.stats.columns")
+
+lazy_import("ffs.fon.query.cache")
+lazy_import("ffs.fon.query.lang.lexer")
+lazy_import("ffs.fon.query.lang.parser")
+lazy_import("ffs.fon.query.planner")
+lazy_import("ffs.fon.query.compiler")
+lazy_import("ffs.fon.query.stream")
+lazy_import("ffs.fon.query.server")
 
 
 class FFSQuery(ffs.scripts._base.MainScriptBase):
 
     def build_argument_parser(self):
+        def arg_name_list(get_item):
+            def parse_name_list(arg):
+                names = [name.strip() for name in arg.split(",")]
+                try:
+                    for name in names:
+                        get_item(name)
+                except KeyError as err:
+                    raise argparse.ArgumentTypeError(
+                        "unknown name: {}".format(err.args[0])
+                    ) from None
+
+                return names
+            # ---
+
+            return parse_name_list
+        # --- end of arg_name_list (...) ---
+
         parser = argparse.ArgumentParser(prog=self.prog_name)
 
+        input_group = parser.add_mutually_exclusive_group()
+
+        input_group.add_argument(
+            "-f", "--csv-file", metavar="<file>",
+            dest="csv_files", default=None, nargs="+", action="extend",
+            help=(
+                "path to csv file(s) or glob pattern(s), each file is"
+                " an export of one box (see 'source' filter)"
+                " (default: stdin)"
+            )
+        )
+
+        input_group.add_argument(
+            "-A", "--archive", metavar="<dir>", default=None,
+            help="path to archive created by ffs-archive"
+        )
+
+        parser.add_argument(
+            "-S", "--stream",
+            default=False, action="store_true",
+            help=(
+                "filter the csv file while reading it, "
+                "without loading all calls into memory"
+            )
+        )
+
+        parser.add_argument(
+            "-j", "--jobs",
+            metavar="<n>", default=None, type=int,
+            help=(
+                "number of processes for parsing the csv file"
+                " and evaluating filters (default: 1)"
+            )
+        )
+
+        parser.add_argument(
+            "--cache-dir", metavar="<dir>", default=None,
+            help="directory for caching parsed csv files"
+        )
+
         parser.add_argument(
-            "-f", "--csv-file", metavar="<file>", default=None,
-            help="path to csv file (default: stdin)"
+            "--no-cache",
+            dest="use_cache", default=True, action="store_false",
+            help=(
+                "do not read or write cached csv files,"
+                " parsed filter expressions and parser tables"
+            )
         )
 
         parser.add_argument(
@@ -39,6 +127,39 @@ class FFSQuery(ffs.scripts._base.MainScriptBase):
             help="filter expressions"
         )
 
+        parser.add_argument(
+            "--no-plan",
+            dest="plan_filters", default=True, action="store_false",
+            help="evaluate AND/OR members in the given order"
+        )
+
+        parser.add_argument(
+            "--no-rollup",
+            dest="use_rollup", default=True, action="store_false",
+            help=(
+                "do not answer aggregate queries from the archive's"
+                " rollup table, always read the calls"
+            )
+        )
+
+        server_group = parser.add_argument_group(title="query server")
+        server_group_mut = server_group.add_mutually_exclusive_group()
+
+        server_group_mut.add_argument(
+            "--serve", dest="serve_socket", metavar="<socket>", default=None,
+            help=(
+                "run as query server on the given unix socket,"
+                " keeping call lists in memory between queries"
+                " (the given csv files or archive get loaded on startup)"
+            )
+        )
+
+        server_group_mut.add_argument(
+            "--connect", dest="connect_socket", metavar="<socket>",
+            default=None,
+            help="let the query server on the given unix socket run the query"
+        )
+
         parser.add_argument(
             "-v", "--invert-filter",
             dest="invert_filter", default=False, action="store_true",
@@ -60,7 +181,7 @@ class FFSQuery(ffs.scripts._base.MainScriptBase):
             choices=[
                 "print", "count", "ratio",
                 "list-me", "list-them", "list-dev",
-                "describe-filter"
+                "describe-filter", "describe-filter-source"
             ],
             help="set output mode"
         )
@@ -107,6 +228,78 @@ class FFSQuery(ffs.scripts._base.MainScriptBase):
             help="show compiled filters"
         )
 
+        output_mode_group_mut.add_argument(
+            "--describe-filter-source",
+            dest="output_mode", default=argparse.SUPPRESS,
+            action="store_const", const="describe_filter_source",
+            help="show the generated source code of compiled filters"
+        )
+
+        output_mode_group_mut.add_argument(
+            "-G", "--group-by",
+            dest="group_by", metavar="<key>[,<key>...]", default=None,
+            type=arg_name_list(ffs.fon.query.aggregate.get_group_key),
+            help=(
+                "group matched entries and show aggregates, keys: {}"
+                " (implies aggregate output mode)".format(
+                    ", ".join(sorted(ffs.fon.query.aggregate.GROUP_KEYS))
+                )
+            )
+        )
+
+        output_mode_group_mut.add_argument(
+            "-H", "--histogram",
+            dest="histogram", metavar="<bucket>", default=None,
+            choices=sorted(ffs.fon.query.histogram.HISTOGRAM_BUCKETS),
+            help=(
+                "show number and total duration of matched entries"
+                " per time bucket: %(choices)s"
+            )
+        )
+
+        output_mode_group.add_argument(
+            "--top",
+            dest="num_top", metavar="<n>", default=None, type=int,
+            help=(
+                "show the <n> most frequent remote numbers, or local numbers"
+                " (with -M) or devices (with -D)"
+            )
+        )
+
+        output_mode_group.add_argument(
+            "--top-by",
+            dest="top_rank_by", default="count",
+            choices=sorted(ffs.fon.query.sink.TopSink.RANK_ATTRS),
+            help="rank --top entries by call count or total duration"
+        )
+
+        output_mode_group.add_argument(
+            "--approx",
+            dest="approx_key", default=None,
+            choices=sorted(
+                ffs.fon.query.sink.ApproxDistinctSink.DISTINCT_ATTRS
+            ),
+            help=(
+                "estimate the number of distinct remote numbers,"
+                " local numbers or devices of matched entries"
+                " (per group with -G, relative error ~{:.1%}%)".format(
+                    ffs.util.hll.HyperLogLog.get_std_error()
+                )
+            )
+        )
+
+        output_mode_group.add_argument(
+            "--agg",
+            dest="aggregates", metavar="<func>[,<func>...]", default=None,
+            type=arg_name_list(ffs.fon.query.aggregate.get_aggregate),
+            help=(
+                "aggregates of the call duration (minutes): {}, p<N>"
+                " (implies aggregate output mode, default: count)".format(
+                    ", ".join(ffs.fon.query.aggregate.AGGREGATES)
+                )
+            )
+        )
+
         return parser
     # --- end of build_argument_parser (...) ---
 
@@ -116,164 +309,919 @@ class FFSQuery(ffs.scripts._base.MainScriptBase):
     # --- end of __init__ (...) ---
 
     def parse_args(self, argv):
-        return self.arg_parser.parse_args(argv)
+        arg_config = self.arg_parser.parse_args(argv)
+
+        # --output-mode choices are spelled like the options,
+        #  e.g. "list-me" for --list-me (output mode "list_me")
+        output_mode = getattr(arg_config, "output_mode", None)
+        if output_mode is not None:
+            arg_config.output_mode = output_mode.replace("-", "_")
+
+        if arg_config.stream and arg_config.archive:
+            self.arg_parser.error("--stream cannot be used with --archive")
+
+        if arg_config.approx_key is not None:
+            if (
+                getattr(arg_config, "output_mode", None) is not None
+                or arg_config.aggregates is not None
+                or arg_config.histogram is not None
+                or arg_config.num_top is not None
+            ):
+                self.arg_parser.error(
+                    "--approx can only be used with --group-by"
+                )
+
+            arg_config.output_mode = "approx_distinct"
+            return arg_config
+        # --
+
+        if arg_config.num_top is not None and (
+            arg_config.group_by is not None
+            or arg_config.aggregates is not None
+            or arg_config.histogram is not None
+        ):
+            self.arg_parser.error(
+                "--top cannot be used with --group-by, --agg or --histogram"
+            )
+        # --
+
+        if (
+            arg_config.histogram is not None
+            and arg_config.aggregates is not None
+        ):
+            self.arg_parser.error("--histogram cannot be used with --agg")
+        # --
+
+        if arg_config.group_by is not None or arg_config.aggregates is not None:
+            if getattr(arg_config, "output_mode", None) is not None:
+                self.arg_parser.error(
+                    "--agg cannot be used with other output modes"
+                )
+
+            arg_config.output_mode = "aggregate"
+
+        elif arg_config.histogram is not None:
+            arg_config.output_mode = "histogram"
+
+        elif arg_config.num_top is not None:
+            top_keys = {
+                None:           "them",
+                "list_them":    "them",
+                "list_me":      "me",
+                "list_dev":     "dev",
+            }
+
+            try:
+                arg_config.top_key = top_keys[
+                    getattr(arg_config, "output_mode", None)
+                ]
+            except KeyError:
+                self.arg_parser.error(
+                    "--top can only be used with -T, -M or -D"
+                )
+
+            if arg_config.num_top < 1:
+                self.arg_parser.error("--top must be positive")
+
+            arg_config.output_mode = "top"
+        # --
+
+        return arg_config
     # --- end of parse_args (...) ---
 
-    def get_query_parser(self):
+    def get_parser_tables_file(self):
+        return ffs.util.cachedir.get_user_cache_dir(
+            "ply", "filter_lang_parsetab.pickle"
+        )
+    # --- end of get_parser_tables_file (...) ---
+
+    def get_query_parser(self, use_cache=True):
         parser = ffs.fon.query.lang.parser.FilterLangParser(
             ffs.fon.query.lang.lexer.FilterLangLexer()
         )
-        parser.build()
+        parser.build(
+            tables_file=(
+                self.get_parser_tables_file() if use_cache else None
+            )
+        )
         return parser
     # --- end of get_query_parser (...) ---
 
-    def compile_filters(self, filter_exprv, flatten=True):
+    def get_filter_cache(self, arg_config):
+        if arg_config.use_cache:
+            return ffs.fon.query.cache.FilterExprCache()
+        else:
+            return None
+    # --- end of get_filter_cache (...) ---
+
+    def compile_filters(
+        self, filter_exprv, flatten=True, filter_cache=None, use_cache=True
+    ):
+        """
+        Parses filter expressions.
+
+        @param filter_exprv:  filter expressions (str)
+        @param flatten:       whether to flatten the filter trees
+        @param filter_cache:  FilterExprCache object or None,
+                              only used if flatten is True
+        @param use_cache:     whether to use cached parser tables
+
+        @return: list of filter trees, or None if no expressions given
+        """
         if not filter_exprv:
             return None
 
-        parser = self.get_query_parser()
+        if not flatten or filter_cache is None:
+            parser = self.get_query_parser(use_cache)
+            filter_funcv = [
+                parser.parse(filter_expr) for filter_expr in filter_exprv
+            ]
 
-        filter_funcv = [
-            parser.parse(filter_expr) for filter_expr in filter_exprv
-        ]
+            if any((f is None for f in filter_funcv)):
+                raise RuntimeError("Failed to compile filters!\n")
+            # --
+
+            if flatten:
+                return [f.flatten() for f in filter_funcv]
+            else:
+                return filter_funcv
+        # --
+
+        filter_cache.load()
+
+        # the parser is built only if some expression is not cached
+        parser = None
+        filter_funcv = []
+        for filter_expr in filter_exprv:
+            filter_func = filter_cache.get(filter_expr)
+
+            if filter_func is None:
+                if parser is None:
+                    parser = self.get_query_parser(use_cache)
 
-        if any((f is None for f in filter_funcv)):
-            raise RuntimeError("Failed to compile filters!\n")
+                filter_func = parser.parse(filter_expr)
+                if filter_func is None:
+                    raise RuntimeError("Failed to compile filters!\n")
+
+                filter_func = filter_func.flatten()
+                filter_cache.put(
+                    filter_expr, filter_func,
+                    (parser.date_today if parser.date_today_used else None)
+                )
+            # --
+
+            filter_funcv.append(filter_func)
         # --
 
-        if flatten:
-            return [f.flatten() for f in filter_funcv]
-        else:
-            return filter_funcv
-    # ---
+        try:
+            filter_cache.save()
+        except OSError:
+            pass
+
+        return filter_funcv
+    # --- end of compile_filters (...) ---
+
+    def get_filter_planner(self, stats):
+        return ffs.fon.query.planner.FilterPlanner(stats)
+    # --- end of get_filter_planner (...) ---
 
-    def get_stats_reader(self):
-        return ffs.fon.stats.reader.AVMPhoneStatsReader()
+    def get_filter_compiler(self):
+        return ffs.fon.query.compiler.FilterCompiler()
+    # --- end of get_filter_compiler (...) ---
+
+    def get_stats_reader(self, source=""):
+        return ffs.fon.stats.reader.AVMPhoneStatsReader(source=source)
     # --- end of get_stats_reader (...) ---
 
-    def read_phone_stats(self, csv_file):
-        stats = ffs.fon.stats.stats.AVMPhoneStats()
-        stats_reader = self.get_stats_reader()
+    def create_phone_stats(self):
+        return ffs.fon.stats.columns.AVMPhoneStatsColumns()
+    # --- end of create_phone_stats (...) ---
+
+    def get_stats_cache(self, arg_config):
+        if arg_config.use_cache:
+            return ffs.fon.stats.cache.AVMPhoneStatsCache(arg_config.cache_dir)
+        else:
+            return None
+    # --- end of get_stats_cache (...) ---
+
+    def get_csv_files(self, arg_config):
+        """
+        @return: list of csv file paths, globs expanded,
+                 or [None] if stdin should be read
+        """
+        if not arg_config.csv_files:
+            return [None]
+
+        csv_files = []
+        for arg in arg_config.csv_files:
+            if arg != "-" and glob.has_magic(arg):
+                matches = sorted(glob.glob(arg))
+                if not matches:
+                    raise OSError("no csv files match {!r}".format(arg))
+                csv_files.extend(matches)
+            else:
+                csv_files.append(arg)
+        # --
+
+        return csv_files
+    # --- end of get_csv_files (...) ---
+
+    def get_source_names(self, csv_files):
+        """
+        Returns the box names of the given csv files:
+        the file name without extension, or the path without extension
+        if several files have the same name. Empty for stdin.
+        """
+        def get_path_name(csv_file):
+            if csv_file is None or csv_file == "-":
+                return ""
+            else:
+                return os.path.splitext(os.path.normpath(csv_file))[0]
+        # ---
+
+        path_names = [get_path_name(csv_file) for csv_file in csv_files]
+        names = [os.path.basename(path_name) for path_name in path_names]
+        name_count = collections.Counter(names)
+
+        return [
+            (name if name_count[name] < 2 else path_name)
+            for name, path_name in zip(names, path_names)
+        ]
+    # --- end of get_source_names (...) ---
+
+    def gen_read_phone_stats(self, csv_file, source=""):
+        stats_reader = self.get_stats_reader(source)
+
+        if csv_file is None or csv_file == "-":
+            yield from stats_reader.read_csv_file(sys.stdin)
+        else:
+            with io.open(csv_file, "rt", encoding="utf-8") as fh:
+                yield from stats_reader.read_csv_file(fh)
+        # --
+    # --- end of gen_read_phone_stats (...) ---
+
+    def gen_read_phone_stats_files(self, csv_files):
+        """
+        Reads entries from several csv files,
+        merged by datum (newest first) if each file is sorted that way.
+        """
+        if len(csv_files) == 1:
+            return self.gen_read_phone_stats(
+                csv_files[0], self.get_source_names(csv_files)[0]
+            )
+
+        return heapq.merge(
+            *[
+                self.gen_read_phone_stats(csv_file, source)
+                for csv_file, source in zip(
+                    csv_files, self.get_source_names(csv_files)
+                )
+            ],
+            key=operator.attrgetter("datum"), reverse=True
+        )
+    # --- end of gen_read_phone_stats_files (...) ---
 
+    def read_phone_stats(
+        self, csv_file, stats_cache=None, jobs=None, source=""
+    ):
         if csv_file is None or csv_file == "-":
-            stats.update(stats_reader.read_csv_file(sys.stdin))
+            stats = self.create_phone_stats()
+            stats.update(
+                self.get_stats_reader(source).read_csv_file(sys.stdin)
+            )
+            return stats
+        # --
+
+        if stats_cache is not None:
+            fingerprint = stats_cache.get_fingerprint(csv_file, source)
+            stats = stats_cache.load(csv_file, fingerprint)
+            if stats is not None:
+                return stats
+        # --
+
+        if jobs is not None and jobs > 1:
+            stats = ffs.fon.stats.parallel.AVMPhoneStatsParallelReader(
+                jobs
+            ).read_csv_file(csv_file, source=source)
+
         else:
+            stats = self.create_phone_stats()
             with io.open(csv_file, "rt", encoding="utf-8") as fh:
-                stats.update(stats_reader.read_csv_file(fh))
+                stats.update(self.get_stats_reader(source).read_csv_file(fh))
+        # --
+
+        if stats_cache is not None:
+            try:
+                stats_cache.store(csv_file, fingerprint, stats)
+            except OSError:
+                pass  # the cache is optional
         # --
 
         return stats
     # --- end of read_phone_stats (...) ---
 
-    def get_phone_stats(self, arg_config):
-        return self.read_phone_stats(arg_config.csv_file)
-    # ---
+    def read_phone_stats_files(self, csv_files, stats_cache=None, jobs=None):
+        """
+        Reads several csv files into one stats object,
+        merged by datum (newest first).
 
-    def filter_stats(self, stats, filter_funcv, invert_filter):
-        prev_matched = stats.get_entries()
-        matched = prev_matched
+        Files that are not cached are read concurrently
+        by a process pool if jobs is greater than 1.
+        """
+        sources = self.get_source_names(csv_files)
 
-        if filter_funcv:
-            # initially, match all entries
-            #  each filter_func then reduces the amount
-            #  of the previously matched entries
-            for filter_func in filter_funcv:
-                prev_matched = matched
-                if prev_matched:
-                    matched, others = stats.filter_split(
-                        filter_func, entries=prev_matched
-                    )
-                else:
-                    matched = []
-                    others = []
-                    break
-                # --
+        if len(csv_files) == 1:
+            return self.read_phone_stats(
+                csv_files[0], stats_cache, jobs=jobs, source=sources[0]
+            )
+        # --
 
+        files_stats = [None for _ in csv_files]
+        fingerprints = [None for _ in csv_files]
+        missing = []
+
+        for idx, (csv_file, source) in enumerate(zip(csv_files, sources)):
+            if csv_file is None or csv_file == "-":
+                files_stats[idx] = self.read_phone_stats(
+                    csv_file, source=source
+                )
+
+            elif stats_cache is not None:
+                fingerprints[idx] = stats_cache.get_fingerprint(
+                    csv_file, source
+                )
+                files_stats[idx] = stats_cache.load(
+                    csv_file, fingerprints[idx]
+                )
             # --
 
-            if invert_filter:
-                matched = others
+            if files_stats[idx] is None:
+                missing.append(idx)
+        # --
+
+        if missing:
+            missing_stats = ffs.fon.stats.parallel.AVMPhoneStatsParallelReader(
+                (jobs or 1)
+            ).read_csv_files(
+                [csv_files[idx] for idx in missing],
+                sources=[sources[idx] for idx in missing]
+            )
+
+            for idx, stats in zip(missing, missing_stats):
+                files_stats[idx] = stats
+
+                if stats_cache is not None:
+                    try:
+                        stats_cache.store(
+                            csv_files[idx], fingerprints[idx], stats
+                        )
+                    except OSError:
+                        pass  # the cache is optional
+                # --
             # --
         # --
 
-        return (prev_matched, matched)
+        return ffs.fon.stats.columns.AVMPhoneStatsColumns.merge_sorted(
+            files_stats
+        )
+    # --- end of read_phone_stats_files (...) ---
+
+    def open_phone_stats_archive(self, archive_path):
+        return ffs.fon.stats.archive.AVMPhoneStatsArchive(archive_path).open()
+    # --- end of open_phone_stats_archive (...) ---
+
+    def get_phone_stats(self, arg_config):
+        if arg_config.archive:
+            return self.open_phone_stats_archive(arg_config.archive)
+        else:
+            return self.read_phone_stats_files(
+                self.get_csv_files(arg_config),
+                self.get_stats_cache(arg_config),
+                jobs=arg_config.jobs
+            )
+    # ---
+
+    def filter_stats(self, stats, filter_funcv, invert_filter, jobs=None):
+        # each filter_func reduces the amount
+        #  of the previously matched entries
+        if jobs is not None and jobs > 1:
+            return ffs.fon.stats.parallel.AVMPhoneStatsParallelFilter(
+                jobs
+            ).filter_chain(stats, (filter_funcv or ()), invert=invert_filter)
+        else:
+            return stats.filter_chain(
+                (filter_funcv or ()), invert=invert_filter
+            )
     # --- end of filter_stats (...) ---
 
+    def get_rollup_cells(self, arg_config, stats, sink, filter_funcv):
+        """
+        @return: rollup cells (AVMPhoneStatsRollupColumns) of stats
+                 if the sink's output can be computed from them,
+                 else None
+        """
+        rollup = getattr(stats, "rollup", None)
+
+        if (
+            not arg_config.use_rollup
+            or rollup is None
+            or not rollup.is_current(stats)
+            or not sink.supports_rollup(filter_funcv or ())
+        ):
+            return None
+        # --
+
+        return rollup.get_columns(stats)
+    # --- end of get_rollup_cells (...) ---
+
+    def get_query_server_worker(self):
+        return FFSQueryServerWorker(prog=self.prog)
+    # --- end of get_query_server_worker (...) ---
+
+    def run_server(self, socket_path, argv):
+        worker = self.get_query_server_worker()
+        worker.preload(argv)
+
+        server = ffs.fon.query.server.QueryServer(
+            socket_path, worker.handle_request
+        )
+
+        try:
+            server.run()
+        except OSError as err:
+            self.write_error(
+                "{}: cannot run query server: {}".format(self.prog_name, err)
+            )
+            return self.EX_ERR
+    # --- end of run_server (...) ---
+
+    def run_client(self, socket_path, argv):
+        try:
+            exit_code, stdout, stderr = ffs.fon.query.server.query_server(
+                socket_path, argv
+            )
+        except (OSError, ValueError) as err:
+            self.write_error(
+                "{}: query server {}: {}".format(
+                    self.prog_name, socket_path, err
+                )
+            )
+            return self.EX_ERR
+        # --
+
+        sys.stdout.write(stdout)
+        sys.stderr.write(stderr)
+        return exit_code
+    # --- end of run_client (...) ---
+
     def __call__(self, argv):
         arg_config = self.parse_args(argv)
-        filter_funcv = self.compile_filters(arg_config.filter_exprv)
 
-        stats = self.get_phone_stats(arg_config)
+        if arg_config.connect_socket is not None:
+            return self.run_client(arg_config.connect_socket, argv)
+
+        elif arg_config.serve_socket is not None:
+            return self.run_server(arg_config.serve_socket, argv)
+        # --
+
+        filter_funcv = self.compile_filters(
+            arg_config.filter_exprv,
+            filter_cache=self.get_filter_cache(arg_config),
+            use_cache=arg_config.use_cache
+        )
+
         output_mode = (arg_config.output_mode or "print")
 
+        if arg_config.stream:
+            stats = None
+        else:
+            stats = self.get_phone_stats(arg_config)
+
+        if filter_funcv and arg_config.plan_filters:
+            planner = self.get_filter_planner(stats)
+            filter_funcv = [planner.plan(f) for f in filter_funcv]
+            describe_filter = planner.describe
+        else:
+            describe_filter = (lambda f: f.describe())
+        # --
+
+        if filter_funcv:
+            compiler = self.get_filter_compiler()
+            compiled_filter_funcv = [compiler.compile(f) for f in filter_funcv]
+        else:
+            compiled_filter_funcv = filter_funcv
+        # --
+
         if output_mode == "describe_filter":
             if not filter_funcv:
                 pass
             elif len(filter_funcv) == 1:
-                print(filter_funcv[0].describe())
+                print(describe_filter(filter_funcv[0]))
             else:
                 print(
-                    "\n".join((f.describe() for f in filter_funcv))
+                    "\n".join((describe_filter(f) for f in filter_funcv))
                 )
             # --
 
-        elif output_mode in {
-            "print", "ratio", "count", "list_me", "list_them", "list_dev"
-        }:
-            prev_matched, matched = self.filter_stats(
-                stats, filter_funcv, arg_config.invert_filter
-            )
-
-            if not output_mode or output_mode == "print":
-                print("\n".join(map(str, matched)))
+        elif output_mode == "describe_filter_source":
+            if compiled_filter_funcv:
+                print(
+                    "\n\n".join((f.source for f in compiled_filter_funcv))
+                )
 
-            elif output_mode == "count":
-                print(len(matched))
+        elif output_mode in ffs.fon.query.sink.OUTPUT_SINKS:
+            sink_kwargs = {}
+            if output_mode == "aggregate":
+                sink_kwargs["group_by"] = arg_config.group_by
+                sink_kwargs["aggregates"] = arg_config.aggregates
+            elif output_mode == "histogram":
+                sink_kwargs["bucket"] = arg_config.histogram
+            elif output_mode == "top":
+                sink_kwargs["top_key"] = arg_config.top_key
+                sink_kwargs["num_top"] = arg_config.num_top
+                sink_kwargs["rank_by"] = arg_config.top_rank_by
+            elif output_mode == "approx_distinct":
+                sink_kwargs["distinct_key"] = arg_config.approx_key
+                sink_kwargs["group_by"] = arg_config.group_by
 
-            elif output_mode == "ratio":
-                num_matched = len(matched)
-                num_prev_matched = len(prev_matched)
+            sink = ffs.fon.query.sink.create_output_sink(
+                output_mode, resolve_names=arg_config.resolve_names,
+                **sink_kwargs
+            )
 
-                print(
-                    "{p:.00%} ({a} / {b})".format(
-                        a=num_matched, b=num_prev_matched,
-                        p=num_matched / (num_prev_matched or 1)
+            if arg_config.stream:
+                filter_chain = ffs.fon.query.stream.FilterChainStream(
+                    (compiled_filter_funcv or ()), arg_config.invert_filter
+                )
+                sink.add_many(
+                    filter_chain.filter(
+                        self.gen_read_phone_stats_files(
+                            self.get_csv_files(arg_config)
+                        )
                     )
                 )
+                sink.finish(filter_chain.num_prev_matched)
 
-            elif output_mode == "list_me":
-                print(
-                    "\n".join(sorted(set((obj.me.nr for obj in matched))))
+            else:
+                rollup_cells = self.get_rollup_cells(
+                    arg_config, stats, sink, compiled_filter_funcv
                 )
 
-            elif output_mode == "list_them":
-                if arg_config.resolve_names:
-                    lines_gen = map(
-                        str,
-                        sorted(
-                            set((obj.them for obj in matched)),
-                            key=lambda o: o.nr
-                        )
+                if rollup_cells is not None:
+                    prev_matched, matched = rollup_cells.filter_chain(
+                        (compiled_filter_funcv or ()),
+                        invert=arg_config.invert_filter
                     )
+                    sink.add_rollup_cells(matched)
+                    sink.finish(sum(prev_matched.get_column("count")))
+
                 else:
-                    lines_gen = sorted(set((obj.them.nr for obj in matched)))
+                    prev_matched, matched = self.filter_stats(
+                        stats, compiled_filter_funcv,
+                        arg_config.invert_filter, jobs=arg_config.jobs
+                    )
+                    sink.add_many(matched)
+                    sink.finish(len(prev_matched))
                 # --
+            # --
+
+        else:
+            raise NotImplementedError("unknown output mode: {}".format(output_mode))
+    # ---
 
-                print("\n".join(lines_gen))
+# --- end of FFSQuery ---
 
-            elif output_mode == "list_dev":
-                print(
-                    "\n".join(sorted(set((obj.me.nebenstelle for obj in matched))))
+
+class FFSQueryServerWorker(FFSQuery):
+    """
+    Runs ffs-query command lines for the query server (--serve),
+    keeping call lists and the filter language parser in memory.
+
+    Csv files are checked for changes (inode, size, mtime) on each request.
+    Only changed files are read again. If rows have been added to a file
+    (its old content is still at its end), only the new rows are parsed.
+    Archives are reopened if one of their files has changed.
+
+    The number of files kept in memory is limited,
+    the least recently requested ones are dropped first.
+    """
+
+    # size of the file end that is compared
+    #  in order to detect whether rows have been added only
+    CSV_TAIL_SIZE = 2**16
+
+    # max. number of csv files, merged file combinations and archives
+    #  kept in memory
+    MAX_CSV_FILES = 16
+    MAX_MERGED_STATS = 4
+    MAX_ARCHIVES = 4
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.query_parser = None
+        # (real path, source) -> (file signature, stats, file tail)
+        self.csv_stats = {}
+        # tuple of (real path, source) -> merged stats
+        self.merged_stats = {}
+        # real path -> (archive signature, stats)
+        self.archive_stats = {}
+    # --- end of __init__ (...) ---
+
+    def parse_args(self, argv):
+        arg_config = super().parse_args(argv)
+        # requests are never forwarded
+        arg_config.serve_socket = None
+        arg_config.connect_socket = None
+        return arg_config
+    # --- end of parse_args (...) ---
+
+    def get_query_parser(self, use_cache=True):
+        parser = self.query_parser
+        if parser is None:
+            parser = super().get_query_parser(use_cache)
+            self.query_parser = parser
+
+        # relative dates refer to the day of the request
+        parser.set_date_today()
+        return parser
+    # --- end of get_query_parser (...) ---
+
+    def get_filter_cache(self, arg_config):
+        return None  # the parser is kept in memory
+
+    def get_cached(self, cache, key):
+        """
+        Returns an entry of an in-memory cache (dict) and marks it as
+        recently used, or None if there is no such entry.
+        """
+        entry = cache.pop(key, None)
+        if entry is not None:
+            cache[key] = entry
+        return entry
+    # --- end of get_cached (...) ---
+
+    def put_cached(self, cache, key, entry, max_entries):
+        """
+        Adds an entry to an in-memory cache (dict),
+        dropping the least recently used entries beyond max_entries.
+        """
+        cache.pop(key, None)
+        cache[key] = entry
+
+        while len(cache) > max_entries:
+            del cache[next(iter(cache))]
+    # --- end of put_cached (...) ---
+
+    def get_csv_file_signature(self, csv_file):
+        stat_info = os.stat(csv_file)
+        return (stat_info.st_ino, stat_info.st_size, stat_info.st_mtime_ns)
+    # --- end of get_csv_file_signature (...) ---
+
+    def get_archive_signature(self, archive_path):
+        return sorted(
+            (entry.name, entry.stat().st_size, entry.stat().st_mtime_ns)
+            for entry in os.scandir(archive_path)
+        )
+    # --- end of get_archive_signature (...) ---
+
+    def get_archive_stats(self, archive):
+        archive_path = os.path.realpath(archive)
+        signature = self.get_archive_signature(archive_path)
+
+        entry = self.get_cached(self.archive_stats, archive_path)
+        if entry is None or entry[0] != signature:
+            entry = (signature, self.open_phone_stats_archive(archive_path))
+            self.put_cached(
+                self.archive_stats, archive_path, entry, self.MAX_ARCHIVES
+            )
+
+        return entry[1]
+    # --- end of get_archive_stats (...) ---
+
+    def read_csv_file_tail(self, csv_file):
+        with io.open(csv_file, "rb") as fh:
+            size = fh.seek(0, io.SEEK_END)
+            fh.seek(max(0, (size - self.CSV_TAIL_SIZE)))
+            return fh.read()
+    # --- end of read_csv_file_tail (...) ---
+
+    def is_csv_file_extended(self, csv_file, old_tail):
+        """
+        Returns True if the csv file still ends with old_tail,
+        i.e. rows have been added, but no old rows have been dropped
+        (exports are sorted by datum, newest first).
+        """
+        with io.open(csv_file, "rb") as fh:
+            size = fh.seek(0, io.SEEK_END)
+            if size < len(old_tail):
+                return False
+
+            fh.seek(size - len(old_tail))
+            return fh.read() == old_tail
+    # --- end of is_csv_file_extended (...) ---
+
+    def update_phone_stats(self, csv_file, stats, source=""):
+        """
+        Reads the rows of a csv file that have been added since stats
+        were read from it, like ffs-archive --append: only rows at least
+        as new as the newest row of stats get parsed, and rows at that
+        datum that are already in stats are dropped.
+
+        @return: new stats object, newest rows first
+                 (stats if no rows have been added),
+                 or None if stats is empty
+        """
+        datum = stats.datum
+        if not len(datum):
+            return None
+
+        high_water_mark = max(datum)
+        known = collections.Counter(
+            stats.get_rows(
+                array.array(
+                    stats.TYPECODE_ROW,
+                    itertools.compress(
+                        range(len(datum)),
+                        map(
+                            operator.__eq__, datum,
+                            itertools.repeat(high_water_mark)
+                        )
+                    )
                 )
+            )
+        )
+        min_datum = ffs.fon.stats.columns.timestamp_to_datum(high_water_mark)
 
-            else:
-                raise NotImplementedError("unhandled output mode: {}".format(output_mode))
+        def gen_new_entries(entries):
+            for entry in entries:
+                if entry.datum > min_datum:
+                    yield entry
+                elif known[entry]:
+                    known[entry] -= 1
+                else:
+                    yield entry
             # --
+        # --- end of gen_new_entries (...) ---
+
+        new_stats = self.create_phone_stats()
+        with io.open(csv_file, "rt", encoding="utf-8") as fh:
+            new_stats.update(
+                gen_new_entries(
+                    self.get_stats_reader(source).read_csv_file(
+                        fh, min_datum=min_datum
+                    )
+                )
+            )
+        # --
+
+        if not len(new_stats):
+            return stats
+
+        # keep the file's row order, new rows are at its top
+        new_stats.extend(stats)
+        return new_stats
+    # --- end of update_phone_stats (...) ---
+
+    def get_csv_file_stats(
+        self, csv_file, key, signature, stats_cache=None, jobs=None
+    ):
+        """
+        Returns the stats of a csv file, which get read again
+        if the file has changed, incrementally if rows have been added.
+
+        @param key:        (real path, source)
+        @param signature:  current file signature
+        """
+        entry = self.get_cached(self.csv_stats, key)
+        if entry is not None and entry[0] == signature:
+            return entry[1]
+
+        # before reading the file, see get_csv_files_stats()
+        tail = self.read_csv_file_tail(csv_file)
+
+        stats = None
+        if entry is not None and self.is_csv_file_extended(csv_file, entry[2]):
+            stats = self.update_phone_stats(csv_file, entry[1], source=key[1])
+
+        if stats is None:
+            stats = self.read_phone_stats(
+                csv_file, stats_cache, jobs=jobs, source=key[1]
+            )
+
+        self.put_cached(
+            self.csv_stats, key, (signature, stats, tail), self.MAX_CSV_FILES
+        )
+
+        # merged stats that include this file are out of date
+        for merged_keys in [k for k in self.merged_stats if key in k]:
+            del self.merged_stats[merged_keys]
+
+        return stats
+    # --- end of get_csv_file_stats (...) ---
+
+    def get_csv_files_stats(self, csv_files, stats_cache=None, jobs=None):
+        if any(
+            (csv_file is None or csv_file == "-") for csv_file in csv_files
+        ):
+            raise RuntimeError(
+                "the query server cannot read stdin,"
+                " use --csv-file or --archive"
+            )
+
+        keys = tuple(
+            zip(
+                map(os.path.realpath, csv_files),
+                self.get_source_names(csv_files)
+            )
+        )
+        # before reading the files, so that changes made while reading
+        #  get noticed by the next request
+        signatures = [
+            self.get_csv_file_signature(csv_file) for csv_file in csv_files
+        ]
+
+        files_stats = [
+            self.get_csv_file_stats(
+                csv_file, key, signature, stats_cache, jobs=jobs
+            )
+            for csv_file, key, signature in zip(csv_files, keys, signatures)
+        ]
+
+        if len(files_stats) == 1:
+            return files_stats[0]
+
+        stats = self.get_cached(self.merged_stats, keys)
+        if stats is None:
+            stats = ffs.fon.stats.columns.AVMPhoneStatsColumns.merge_sorted(
+                files_stats
+            )
+            self.put_cached(
+                self.merged_stats, keys, stats, self.MAX_MERGED_STATS
+            )
+        # --
+
+        return stats
+    # --- end of get_csv_files_stats (...) ---
+
+    def get_phone_stats(self, arg_config):
+        if arg_config.archive:
+            return self.get_archive_stats(arg_config.archive)
         else:
-            raise NotImplementedError("unknown output mode: {}".format(output_mode))
-    # ---
+            return self.get_csv_files_stats(
+                self.get_csv_files(arg_config),
+                self.get_stats_cache(arg_config),
+                jobs=arg_config.jobs
+            )
+    # --- end of get_phone_stats (...) ---
 
-# --- end of FFSQuery ---
+    def preload(self, argv):
+        """
+        Loads the csv files or archive given in argv, if any.
+        """
+        arg_config = self.parse_args(argv)
+        if arg_config.archive or arg_config.csv_files:
+            self.get_phone_stats(arg_config)
+    # --- end of preload (...) ---
+
+    def handle_request(self, argv, cwd):
+        """
+        Runs a command line in the given working directory.
+
+        Requests are handled one at a time, so that stdout and stderr
+        can be captured by replacing sys.stdout and sys.stderr.
+
+        @return: 3-tuple (exit code, stdout text, stderr text)
+        """
+        stdout = io.StringIO()
+        stderr = io.StringIO()
+        server_cwd = os.getcwd()
+
+        with contextlib.ExitStack() as stack:
+            stack.enter_context(contextlib.redirect_stdout(stdout))
+            stack.enter_context(contextlib.redirect_stderr(stderr))
+            stack.callback(os.chdir, server_cwd)
+
+            try:
+                os.chdir(cwd)
+                exit_code = self.run_main(argv)
+
+            except SystemExit as err:
+                # argument errors, --help
+                if err.code is None or isinstance(err.code, int):
+                    exit_code = (err.code or self.EX_OK)
+                else:
+                    self.write_error(str(err.code))
+                    exit_code = self.EX_ERR
+
+            except Exception as err:
+                self.write_error("{}: {}".format(self.prog_name, err))
+                exit_code = self.EX_ERR
+        # --
+
+        return (exit_code, stdout.getvalue(), stderr.getvalue())
+    # --- end of handle_request (...) ---
+
+# --- end of FFSQueryServerWorker ---
 
 
 if __name__ == "__main__":
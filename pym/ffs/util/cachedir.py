@@ -0,0 +1,30 @@
+# fritz-fon-stats -- user cache directory
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2019 André Erdmann <dywi@mailerd.de>
+#
+# Distributed under the terms of the MIT license.
+# (See LICENSE.MIT or http://opensource.org/licenses/MIT)
+#
+
+__all__ = ["get_user_cache_dir"]
+
+import os.path
+
+
+CACHE_DIR_NAME = "fritz-fon-stats"
+
+
+def get_user_cache_dir(*subdirs):
+    """
+    Returns the path to the per-user cache directory,
+    $XDG_CACHE_HOME/fritz-fon-stats or ~/.cache/fritz-fon-stats.
+
+    The directory is not created.
+    """
+    cache_home = os.environ.get("XDG_CACHE_HOME")
+    if not cache_home:
+        cache_home = os.path.join(os.path.expanduser("~"), ".cache")
+
+    return os.path.join(cache_home, CACHE_DIR_NAME, *subdirs)
+# --- end of get_user_cache_dir (...) ---
@@ -0,0 +1,197 @@
+# fritz-fon-stats -- HyperLogLog distinct-count sketches
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2019 André Erdmann <dywi@mailerd.de>
+#
+# Distributed under the terms of the MIT license.
+# (See LICENSE.MIT or http://opensource.org/licenses/MIT)
+#
+#  A sketch estimates the number of distinct values added to it
+#  using m = 2**precision registers (Flajolet et al., HyperLogLog, 2007).
+#  Each value is hashed to 64 bits: the low <precision> bits select
+#  a register, which keeps the max. position of the first 1-bit
+#  of the remaining bits ("rank").
+#
+#  The relative standard error of the estimate is 1.04 / sqrt(m),
+#  e.g. 1.6% for the default precision of 12 (4096 registers).
+#  Small cardinalities are estimated by linear counting,
+#  which is near-exact as long as most registers are empty.
+#
+#  Sketches of the same precision can be merged (register-wise max),
+#  the result is the sketch of the union of the value sets.
+#  Registers are kept in a dict (register -> rank), so sketches
+#  of few values stay small, in memory and when serialized.
+#
+#  Values are hashed via their str(), with a fixed hash function
+#  (not hash(), which is randomized per process),
+#  so sketches from different processes and runs can be merged.
+#
+
+__all__ = ["HyperLogLog"]
+
+import array
+import math
+import struct
+
+import ffs.util.lazyimport
+from ffs.util.lazyimport import lazy_import
+
+# loaded on first use
+hashlib = lazy_import("hashlib")
+
+
+class HyperLogLog(object):
+
+    DEFAULT_PRECISION = 12
+
+    MIN_PRECISION = 4
+    MAX_PRECISION = 15
+
+    HASH_BITS = 64
+
+    # precision, number of registers
+    HEADER = struct.Struct("=BxH")
+
+    __slots__ = ["precision", "registers"]
+
+    def __init__(self, precision=None):
+        super().__init__()
+
+        if precision is None:
+            precision = self.DEFAULT_PRECISION
+        elif not (self.MIN_PRECISION <= precision <= self.MAX_PRECISION):
+            raise ValueError("precision out of range", precision)
+
+        self.precision = precision
+        # register -> rank, empty registers are not stored
+        self.registers = {}
+    # --- end of __init__ (...) ---
+
+    @classmethod
+    def get_std_error(cls, precision=None):
+        """Returns the relative standard error of estimates."""
+        if precision is None:
+            precision = cls.DEFAULT_PRECISION
+        return 1.04 / math.sqrt(2**precision)
+    # --- end of get_std_error (...) ---
+
+    def get_register(self, value):
+        """
+        Hashes a value.
+
+        @return: 2-tuple (register, rank)
+        """
+        digest = hashlib.blake2b(
+            str(value).encode("utf-8"), digest_size=(self.HASH_BITS // 8)
+        ).digest()
+        hash_value = int.from_bytes(digest, "little")
+
+        precision = self.precision
+        rest = hash_value >> precision
+        return (
+            hash_value & ((1 << precision) - 1),
+            (self.HASH_BITS - precision - rest.bit_length() + 1)
+        )
+    # --- end of get_register (...) ---
+
+    def add_register(self, register, rank):
+        registers = self.registers  # ref
+        if rank > registers.get(register, 0):
+            registers[register] = rank
+    # --- end of add_register (...) ---
+
+    def add(self, value):
+        self.add_register(*self.get_register(value))
+
+    def merge(self, other):
+        """
+        Adds the registers of another sketch of the same precision.
+        """
+        if other.precision != self.precision:
+            raise ValueError(
+                "cannot merge sketches of different precision",
+                self.precision, other.precision
+            )
+
+        add_register = self.add_register
+        for register, rank in other.registers.items():
+            add_register(register, rank)
+    # --- end of merge (...) ---
+
+    def estimate(self):
+        """
+        @return: estimated number of distinct values (int)
+        """
+        registers = self.registers
+        if not registers:
+            return 0
+
+        num_registers = 1 << self.precision
+        num_empty = num_registers - len(registers)
+
+        if num_registers >= 128:
+            alpha = 0.7213 / (1 + 1.079 / num_registers)
+        else:
+            alpha = {16: 0.673, 32: 0.697, 64: 0.709}[num_registers]
+
+        raw_estimate = (
+            alpha * num_registers * num_registers
+            / (num_empty + sum(2.0 ** -rank for rank in registers.values()))
+        )
+
+        if raw_estimate <= (2.5 * num_registers) and num_empty:
+            # linear counting
+            return round(
+                num_registers * math.log(num_registers / num_empty)
+            )
+        else:
+            return round(raw_estimate)
+    # --- end of estimate (...) ---
+
+    def to_bytes(self):
+        registers = sorted(self.registers.items())
+        return b''.join((
+            self.HEADER.pack(self.precision, len(registers)),
+            array.array('H', (reg for reg, _ in registers)).tobytes(),
+            bytes(rank for _, rank in registers)
+        ))
+    # --- end of to_bytes (...) ---
+
+    @classmethod
+    def from_bytes(cls, data, offset=0):
+        """
+        Reads a sketch written by to_bytes().
+
+        @return: 2-tuple (sketch, offset of the next byte after it)
+        @raises ValueError: truncated data
+        """
+        try:
+            precision, num_registers = cls.HEADER.unpack_from(data, offset)
+        except struct.error:
+            raise ValueError("truncated sketch") from None
+
+        offset += cls.HEADER.size
+
+        registers = array.array('H')
+        regs_end = offset + (num_registers * registers.itemsize)
+        ranks_end = regs_end + num_registers
+
+        if len(data) < ranks_end:
+            raise ValueError("truncated sketch")
+
+        registers.frombytes(data[offset:regs_end])
+
+        obj = cls(precision)
+        obj.registers = dict(zip(registers, data[regs_end:ranks_end]))
+        return (obj, ranks_end)
+    # --- end of from_bytes (...) ---
+
+    def __len__(self):
+        return self.estimate()
+
+    def __repr__(self):
+        return "{cls.__name__}<p={p:d}, ~{n:d}>".format(
+            cls=self.__class__, p=self.precision, n=self.estimate()
+        )
+
+# --- end of HyperLogLog ---
@@ -0,0 +1,55 @@
+# fritz-fon-stats -- intern table
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2019 André Erdmann <dywi@mailerd.de>
+#
+# Distributed under the terms of the MIT license.
+# (See LICENSE.MIT or http://opensource.org/licenses/MIT)
+#
+
+__all__ = ["InternTable"]
+
+
+class InternTable(object):
+    """
+    Maps hashable keys to small integer codes (and back to their value),
+    in order of first appearance.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.values = []
+        self.codes = {}
+    # --- end of __init__ (...) ---
+
+    def __len__(self):
+        return len(self.values)
+
+    def __iter__(self):
+        return iter(self.values)
+
+    def __getitem__(self, code):
+        return self.values[code]
+
+    def copy(self):
+        table = self.__class__()
+        table.values.extend(self.values)
+        table.codes.update(self.codes)
+        return table
+    # --- end of copy (...) ---
+
+    def intern(self, key, value):
+        codes = self.codes  # ref
+
+        try:
+            return codes[key]
+        except KeyError:
+            pass
+
+        code = len(self.values)
+        self.values.append(value)
+        codes[key] = code
+        return code
+    # --- end of intern (...) ---
+
+# --- end of InternTable ---
@@ -0,0 +1,56 @@
+# fritz-fon-stats -- lazy module imports
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2019 André Erdmann <dywi@mailerd.de>
+#
+# Distributed under the terms of the MIT license.
+# (See LICENSE.MIT or http://opensource.org/licenses/MIT)
+#
+#  lazy_import() creates a module object whose code runs on first
+#  attribute access (importlib.util.LazyLoader). The module is put into
+#  sys.modules and set as attribute of its parent package, so that
+#  qualified references (ffs.fon.stats.archive.AVMPhoneStatsArchive)
+#  and later import statements work as usual.
+#
+#  This keeps the startup time of the scripts low: modules of
+#  a subsystem (e.g. the csv reader or the process pool) are loaded
+#  only if that subsystem gets used.
+#
+#  Note that "from <module> import <name>" loads the module immediately.
+#
+
+__all__ = ["lazy_import"]
+
+import importlib.util
+import sys
+
+
+def lazy_import(name):
+    """
+    Returns the module with the given (absolute) name,
+    which gets loaded when one of its attributes is accessed.
+
+    @raises ImportError: module not found
+    """
+    try:
+        return sys.modules[name]
+    except KeyError:
+        pass
+
+    # imports the parent packages
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ImportError("No module named {!r}".format(name), name=name)
+
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+
+    parent_name, _, child_name = name.rpartition(".")
+    if parent_name:
+        setattr(sys.modules[parent_name], child_name, module)
+
+    return module
+# --- end of lazy_import (...) ---
@@ -0,0 +1,63 @@
+# fritz-fon-stats -- byte masks
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2019 André Erdmann <dywi@mailerd.de>
+#
+# Distributed under the terms of the MIT license.
+# (See LICENSE.MIT or http://opensource.org/licenses/MIT)
+#
+#  A mask is a bytes object with one byte per row,
+#  which is either 0 (not matched) or 1 (matched).
+#
+#  All operations below run in C, there is no per-row Python code.
+#
+
+__all__ = [
+    "mask_true", "mask_false",
+    "mask_and", "mask_or", "mask_not",
+    "mask_count", "mask_any", "mask_all", "mask_none",
+]
+
+MASK_NOT_TABLE = bytes.maketrans(b'\x00\x01', b'\x01\x00')
+
+
+def mask_true(length):
+    return b'\x01' * length
+
+
+def mask_false(length):
+    return bytes(length)
+
+
+def mask_and(mask_a, mask_b):
+    return (
+        int.from_bytes(mask_a, "little") & int.from_bytes(mask_b, "little")
+    ).to_bytes(len(mask_a), "little")
+# --- end of mask_and (...) ---
+
+
+def mask_or(mask_a, mask_b):
+    return (
+        int.from_bytes(mask_a, "little") | int.from_bytes(mask_b, "little")
+    ).to_bytes(len(mask_a), "little")
+# --- end of mask_or (...) ---
+
+
+def mask_not(mask):
+    return mask.translate(MASK_NOT_TABLE)
+
+
+def mask_count(mask):
+    return mask.count(1)
+
+
+def mask_any(mask):
+    return (1 in mask)
+
+
+def mask_all(mask):
+    return (0 not in mask)
+
+
+def mask_none(mask):
+    return (1 not in mask)
@@ -0,0 +1,34 @@
+# fritz-fon-stats -- sorted row id sequences
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2019 André Erdmann <dywi@mailerd.de>
+#
+# Distributed under the terms of the MIT license.
+# (See LICENSE.MIT or http://opensource.org/licenses/MIT)
+#
+#  Row id sequences are arrays of ascending, distinct row ids,
+#  e.g. the result of an index lookup.
+#
+
+__all__ = ["rows_and", "rows_or"]
+
+import array
+
+
+def rows_and(rows_a, rows_b):
+    if len(rows_a) > len(rows_b):
+        rows_a, rows_b = rows_b, rows_a
+
+    # filtering the smaller sequence keeps the order
+    return array.array(rows_a.typecode, filter(set(rows_b).__contains__, rows_a))
+# --- end of rows_and (...) ---
+
+
+def rows_or(rows_a, rows_b):
+    if not rows_a:
+        return rows_b
+    elif not rows_b:
+        return rows_a
+    else:
+        return array.array(rows_a.typecode, sorted(set(rows_a).union(rows_b)))
+# --- end of rows_or (...) ---
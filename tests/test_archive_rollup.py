@@ -0,0 +1,134 @@
+# fritz-fon-stats -- tests: rollup table of appended archives
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2019 André Erdmann <dywi@mailerd.de>
+#
+# Distributed under the terms of the MIT license.
+# (See LICENSE.MIT or http://opensource.org/licenses/MIT)
+#
+#  Run from the top-level directory:
+#
+#    python -m unittest discover -s tests
+#
+
+import datetime
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+
+PYM_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "pym"
+)
+
+CSV_HEADER = (
+    "sep=;\n"
+    "Typ;Datum;Name;Rufnummer;Nebenstelle;Eigene Rufnummer;Dauer\n"
+)
+
+DEVICES = ("Telefon 1", "Fax", "Wohnzimmer")
+LOCAL_NUMBERS = ("Internet: 123456", "Internet: 654321")
+
+
+def gen_csv_rows(first_day, last_day, number_offset):
+    """
+    Generates csv rows, newest first, with a few calls per day.
+    Remote numbers depend on the day and number_offset, so that
+    exports with different offsets have different numbers.
+    """
+    start = datetime.datetime(2019, 1, 1, 8, 0)
+
+    for day in range(last_day, (first_day - 1), -1):
+        for call in range(3, -1, -1):
+            datum = start + datetime.timedelta(days=day, hours=call)
+            yield ";".join((
+                str((call % 4) + 1),
+                datum.strftime("%d.%m.%y %H:%M"),
+                "",
+                "0151{:07d}".format(number_offset + (day * 4) + call),
+                DEVICES[(day + call) % len(DEVICES)],
+                LOCAL_NUMBERS[call % len(LOCAL_NUMBERS)],
+                "0:{:02d}".format((day + call) % 60),
+            ))
+# --- end of gen_csv_rows (...) ---
+
+
+class AppendedArchiveRollupTest(unittest.TestCase):
+
+    def run_script(self, script_name, *args):
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.pathsep.join(
+            filter(None, (PYM_DIR, env.get("PYTHONPATH")))
+        )
+        env["XDG_CACHE_HOME"] = self.tmpdir.name
+
+        proc = subprocess.run(
+            [sys.executable, "-m", "ffs.scripts." + script_name] + list(args),
+            env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            universal_newlines=True
+        )
+        self.assertEqual(proc.returncode, 0, proc.stderr)
+        return proc.stdout
+    # --- end of run_script (...) ---
+
+    def write_csv(self, name, rows):
+        csv_file = os.path.join(self.tmpdir.name, name)
+        with io.open(csv_file, "wt", encoding="utf-8") as fh:
+            fh.write(CSV_HEADER)
+            fh.write("\n".join(rows))
+            fh.write("\n")
+        return csv_file
+    # --- end of write_csv (...) ---
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.archive = os.path.join(self.tmpdir.name, "archive")
+
+        # the second export overlaps with the first one (days 20-29)
+        #  and has other numbers for later days
+        old_csv = self.write_csv("old.csv", gen_csv_rows(0, 29, 0))
+        new_csv = self.write_csv(
+            "new.csv",
+            list(gen_csv_rows(30, 59, 5000)) + list(gen_csv_rows(20, 29, 0))
+        )
+
+        self.run_script("ffs_archive", "-f", old_csv, self.archive)
+        self.run_script("ffs_archive", "-a", "-f", new_csv, self.archive)
+    # --- end of setUp (...) ---
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def assert_rollup_query(self, *args):
+        rollup_output = self.run_script("ffs_query", "-A", self.archive, *args)
+        rows_output = self.run_script(
+            "ffs_query", "--no-rollup", "-A", self.archive, *args
+        )
+        self.assertEqual(rollup_output, rows_output)
+        return rollup_output
+    # --- end of assert_rollup_query (...) ---
+
+    def test_count(self):
+        self.assertEqual(
+            self.run_script("ffs_query", "-A", self.archive, "-c").strip(),
+            str(60 * 4)
+        )
+
+    def test_group_by(self):
+        self.assert_rollup_query("-G", "dev,me,month", "--agg", "count,sum")
+
+    def test_approx_them(self):
+        output = self.assert_rollup_query("--approx", "them", "-G", "month")
+        self.assertIn("distinct_them", output)
+
+    def test_approx_them_filtered(self):
+        self.assert_rollup_query("--approx", "them", "-F", "dev fax")
+
+# --- end of AppendedArchiveRollupTest ---
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+# fritz-fon-stats -- tests: startup cost of ffs-query
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2019 André Erdmann <dywi@mailerd.de>
+#
+# Distributed under the terms of the MIT license.
+# (See LICENSE.MIT or http://opensource.org/licenses/MIT)
+#
+#  Imports ffs.scripts.ffs_query in a subprocess with "python -X importtime"
+#  and checks that heavy subsystems are loaded lazily (see ffs.util.lazyimport)
+#  and that the import stays within a time budget.
+#
+#  The budget (milliseconds) can be changed via $FFS_IMPORT_TIME_BUDGET_MS
+#  for slow machines.
+#
+
+import os
+import subprocess
+import sys
+import unittest
+
+
+PYM_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "pym"
+)
+
+# modules that must not be loaded by importing ffs-query
+LAZY_MODULES = ("ply", "multiprocessing", "asyncio")
+
+DEFAULT_IMPORT_TIME_BUDGET_MS = 150
+
+
+def get_import_times(module_name):
+    """
+    Imports a module in a new interpreter.
+
+    @return: dict module name -> cumulative import time (microseconds)
+    """
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        filter(None, (PYM_DIR, env.get("PYTHONPATH")))
+    )
+
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import " + module_name],
+        env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        universal_newlines=True, check=True
+    )
+
+    # "import time: <self us> | <cumulative us> | <indented module name>"
+    import_times = {}
+    for line in proc.stderr.splitlines():
+        fields = line.split("|")
+        if len(fields) == 3 and fields[1].strip().isdigit():
+            import_times[fields[2].strip()] = int(fields[1])
+    # --
+
+    return import_times
+# --- end of get_import_times (...) ---
+
+
+class FFSQueryImportTest(unittest.TestCase):
+
+    MODULE_NAME = "ffs.scripts.ffs_query"
+
+    def setUp(self):
+        self.import_times = get_import_times(self.MODULE_NAME)
+
+    def test_lazy_modules(self):
+        for name in LAZY_MODULES:
+            loaded = sorted(
+                module for module in self.import_times
+                if module == name or module.startswith(name + ".")
+            )
+            self.assertFalse(
+                loaded, "{} loaded on import".format(", ".join(loaded))
+            )
+        # --
+    # --- end of test_lazy_modules (...) ---
+
+    def test_import_time(self):
+        budget_ms = int(
+            os.environ.get(
+                "FFS_IMPORT_TIME_BUDGET_MS", DEFAULT_IMPORT_TIME_BUDGET_MS
+            )
+        )
+        import_time_ms = self.import_times[self.MODULE_NAME] / 1000
+
+        self.assertLessEqual(
+            import_time_ms, budget_ms,
+            "importing {} took {:.1f} ms".format(
+                self.MODULE_NAME, import_time_ms
+            )
+        )
+    # --- end of test_import_time (...) ---
+
+# --- end of FFSQueryImportTest ---
+
+
+if __name__ == "__main__":
+    unittest.main()